@@ -0,0 +1,389 @@
+import logging
+import os
+import threading
+from typing import Callable, List, Optional, Tuple
+
+import numpy as np
+
+from openrecall.config import ann_index_path
+
+logger = logging.getLogger(__name__)
+
+# Constants
+KMEANS_ITERATIONS: int = 10
+TRAINING_POINTS_PER_LIST: int = 256  # Sample size per list used to fit the centroids
+SEEDING_POINTS_PER_LIST: int = 8  # Pool size per list used for k-means++ seeding
+SAVE_EVERY: int = 1000  # Incremental additions between two saves to disk
+ASSIGN_CHUNK_ROWS: int = 65536  # Rows assigned to centroids at a time
+
+
+def normalize_rows(matrix: np.ndarray) -> np.ndarray:
+    """Scales each row to unit length, leaving all-zero rows at zero."""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def default_nlist(count: int) -> int:
+    """Returns the usual IVF list count of about sqrt(n), at least 1."""
+    return max(1, int(np.sqrt(count)))
+
+
+def _seed_centroids(
+    vectors: np.ndarray, nlist: int, rng: np.random.Generator
+) -> np.ndarray:
+    """
+    Picks initial centroids with k-means++ on a small random pool.
+
+    Spreading the seeds avoids two centroids starting in the same cluster,
+    which Lloyd iterations cannot undo. The pool keeps the quadratic seeding
+    cost small compared to the iterations themselves.
+    """
+    pool_size = min(len(vectors), nlist * SEEDING_POINTS_PER_LIST)
+    pool = vectors[rng.choice(len(vectors), pool_size, replace=False)]
+    chosen = [int(rng.integers(pool_size))]
+    best = pool @ pool[chosen[0]]
+    for _ in range(1, nlist):
+        distances = np.clip(1.0 - best, 0.0, None).astype(np.float64)
+        total = distances.sum()
+        if total > 0:
+            index = int(rng.choice(pool_size, p=distances / total))
+        else:
+            index = int(rng.integers(pool_size))
+        chosen.append(index)
+        best = np.maximum(best, pool @ pool[index])
+    return pool[chosen].copy()
+
+
+def kmeans(
+    vectors: np.ndarray,
+    nlist: int,
+    iterations: int = KMEANS_ITERATIONS,
+    seed: int = 0,
+) -> np.ndarray:
+    """
+    Fits spherical k-means centroids to L2-normalized vectors.
+
+    Args:
+        vectors: An (n, dim) matrix of normalized vectors.
+        nlist: The number of centroids.
+        iterations: The number of Lloyd iterations.
+        seed: The random seed for initialization and empty-list reseeding.
+
+    Returns:
+        An (nlist, dim) float32 matrix of normalized centroids.
+    """
+    rng = np.random.default_rng(seed)
+    nlist = min(nlist, len(vectors))
+    centroids = _seed_centroids(vectors, nlist, rng)
+    for _ in range(iterations):
+        assignments = assign(vectors, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        counts = np.bincount(assignments, minlength=nlist)
+        # Reseed empty lists with random points so that no centroid is wasted
+        empty = np.flatnonzero(counts == 0)
+        sums[empty] = vectors[rng.choice(len(vectors), len(empty))]
+        centroids = normalize_rows(sums).astype(np.float32)
+    return centroids
+
+
+def assign(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """
+    Returns the index of the most similar centroid for each vector.
+
+    The argmax of a dot product does not change when a vector is scaled, so
+    the vectors do not need to be normalized first.
+    """
+    assignments = np.empty(len(vectors), dtype=np.int64)
+    for start in range(0, len(vectors), ASSIGN_CHUNK_ROWS):
+        chunk = vectors[start : start + ASSIGN_CHUNK_ROWS]
+        assignments[start : start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+    return assignments
+
+
+class IVFIndex:
+    """
+    An inverted-file approximate nearest neighbour index.
+
+    Embeddings are clustered around k-means centroids, and each centroid owns
+    a list of entry ids. A query only visits the `nprobe` lists whose
+    centroids are closest to it, so the number of candidates grows with
+    n / nlist * nprobe rather than with n. The index stores ids only; the
+    candidates are scored exactly by the caller (see `EmbeddingIndex`).
+
+    The centroids and lists are persisted next to the database. Entries added
+    after the last save are recovered with `sync`.
+    """
+
+    def __init__(self, path: Optional[str] = None) -> None:
+        """
+        Args:
+            path: Where the index is saved, or None to keep it in memory only.
+        """
+        self.path = path
+        self.centroids: Optional[np.ndarray] = None
+        self.last_id = 0
+        self._lists: List[np.ndarray] = []
+        self._pending: List[List[int]] = []
+        self._unsaved = 0
+        self._training = False
+        self._backlog: List[Tuple[np.ndarray, np.ndarray]] = []
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        if path and os.path.exists(path):
+            self.load()
+
+    @property
+    def is_trained(self) -> bool:
+        return self.centroids is not None
+
+    @property
+    def is_training(self) -> bool:
+        return self._training
+
+    @property
+    def dim(self) -> Optional[int]:
+        return None if self.centroids is None else self.centroids.shape[1]
+
+    def __len__(self) -> int:
+        return sum(len(ids) for ids in self._lists) + sum(
+            len(ids) for ids in self._pending
+        )
+
+    def reset(self) -> None:
+        """Discards the centroids and lists, in memory and on disk."""
+        with self._lock:
+            self.centroids = None
+            self.last_id = 0
+            self._lists = []
+            self._pending = []
+            self._unsaved = 0
+        if self.path and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _begin_training(self) -> bool:
+        """Marks the index as training; returns False if it already is."""
+        with self._lock:
+            if self._training:
+                return False
+            self._training = True
+            self._backlog = []
+            return True
+
+    def train(
+        self,
+        ids: np.ndarray,
+        embeddings: np.ndarray,
+        nlist: Optional[int] = None,
+        seed: int = 0,
+    ) -> bool:
+        """
+        Rebuilds the index from scratch.
+
+        The centroids are fitted on a sample without holding the lock, so
+        searches and insertions continue meanwhile. Entries added during
+        training are replayed into the new lists before they are swapped in.
+
+        Args:
+            ids: The entry ids, in ascending order.
+            embeddings: An (n, dim) matrix of embeddings.
+            nlist: The number of lists; defaults to about sqrt(n).
+            seed: The random seed used for sampling and k-means.
+
+        Returns:
+            False if another rebuild was already running, True otherwise.
+        """
+        if len(ids) == 0 or not self._begin_training():
+            return False
+        self._fit(ids, embeddings, nlist, seed)
+        return True
+
+    def train_async(
+        self, ids: np.ndarray, embeddings: np.ndarray, nlist: Optional[int] = None
+    ) -> bool:
+        """
+        Starts `train` in a background thread.
+
+        Returns:
+            False if another rebuild was already running, True otherwise.
+        """
+        if len(ids) == 0 or not self._begin_training():
+            return False
+        threading.Thread(
+            target=self._fit, args=(ids, embeddings, nlist, 0), daemon=True
+        ).start()
+        return True
+
+    def _fit(
+        self, ids: np.ndarray, embeddings: np.ndarray, nlist: Optional[int], seed: int
+    ) -> None:
+        """Fits the centroids and swaps in the new lists; see `train`."""
+        try:
+            ids = np.asarray(ids, dtype=np.int64)
+            vectors = np.asarray(embeddings, dtype=np.float32)
+            nlist = nlist or default_nlist(len(ids))
+            rng = np.random.default_rng(seed)
+            sample_size = min(len(vectors), nlist * TRAINING_POINTS_PER_LIST)
+            sample = normalize_rows(
+                vectors[np.sort(rng.choice(len(vectors), sample_size, replace=False))]
+            )
+            centroids = kmeans(sample, nlist, seed=seed)
+            lists = self._build_lists(ids, vectors, centroids)
+            with self._lock:
+                pending: List[List[int]] = [[] for _ in range(len(centroids))]
+                last_id = int(ids[-1])
+                for backlog_ids, backlog_vectors in self._backlog:
+                    if backlog_vectors.shape[1] != centroids.shape[1]:
+                        continue
+                    keep = backlog_ids > last_id
+                    for entry_id, list_no in zip(
+                        backlog_ids[keep], assign(backlog_vectors[keep], centroids)
+                    ):
+                        pending[list_no].append(int(entry_id))
+                        last_id = max(last_id, int(entry_id))
+                self.centroids = centroids
+                self._lists = lists
+                self._pending = pending
+                self.last_id = last_id
+        finally:
+            with self._lock:
+                self._training = False
+                self._backlog = []
+        logger.info(f"Built IVF index with {len(centroids)} lists over {len(ids)} entries.")
+        self.save()
+
+    @staticmethod
+    def _build_lists(
+        ids: np.ndarray, vectors: np.ndarray, centroids: np.ndarray
+    ) -> List[np.ndarray]:
+        """Groups the ids by their nearest centroid."""
+        assignments = assign(vectors, centroids)
+        order = np.argsort(assignments, kind="stable")
+        bounds = np.searchsorted(assignments[order], np.arange(len(centroids) + 1))
+        return [ids[order[bounds[i] : bounds[i + 1]]] for i in range(len(centroids))]
+
+    def add(self, ids: np.ndarray, embeddings: np.ndarray) -> None:
+        """
+        Assigns new entries to their nearest list.
+
+        Ids at or below `last_id` are ignored, so the same entry can safely be
+        reported both by `insert_entry()` and by `sync`. Does nothing until the
+        index has been trained.
+
+        Args:
+            ids: The entry ids, in ascending order.
+            embeddings: An (n, dim) matrix of embeddings.
+        """
+        if len(ids) == 0:
+            return
+        ids = np.asarray(ids, dtype=np.int64)
+        vectors = np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1)
+        with self._lock:
+            if self._training:
+                self._backlog.append((ids, vectors))
+            if self.centroids is None or vectors.shape[1] != self.centroids.shape[1]:
+                return
+            keep = ids > self.last_id
+            if not np.any(keep):
+                return
+            ids, vectors = ids[keep], vectors[keep]
+            for entry_id, list_no in zip(ids, assign(vectors, self.centroids)):
+                self._pending[list_no].append(int(entry_id))
+            self.last_id = int(ids[-1])
+            self._unsaved += len(ids)
+            should_save = self._unsaved >= SAVE_EVERY
+        if should_save:
+            self.save()
+
+    def sync(self, fetch_after: Callable[[int], Tuple[np.ndarray, np.ndarray]]) -> int:
+        """
+        Adds the entries that were inserted since the index last saw one.
+
+        Args:
+            fetch_after: Returns the ids and embeddings of all entries with an
+                id greater than the given one, in ascending id order.
+
+        Returns:
+            The number of entries fetched.
+        """
+        if not self.is_trained:
+            return 0
+        with self._sync_lock:
+            ids, embeddings = fetch_after(self.last_id)
+            self.add(ids, embeddings)
+            return len(ids)
+
+    def _list_ids(self, list_no: int) -> np.ndarray:
+        """Returns the ids of one list, folding in pending additions."""
+        if self._pending[list_no]:
+            self._lists[list_no] = np.concatenate(
+                [self._lists[list_no], np.array(self._pending[list_no], dtype=np.int64)]
+            )
+            self._pending[list_no] = []
+        return self._lists[list_no]
+
+    def candidates(self, query_embedding: np.ndarray, nprobe: int) -> np.ndarray:
+        """
+        Returns the ids stored in the lists closest to the query.
+
+        Args:
+            query_embedding: The query vector.
+            nprobe: How many lists to visit. Higher values trade latency for
+                recall; nprobe equal to the list count is an exact search.
+
+        Returns:
+            The candidate entry ids, sorted ascending.
+        """
+        with self._lock:
+            if self.centroids is None:
+                return np.empty(0, dtype=np.int64)
+            scores = self.centroids @ query_embedding.astype(np.float32)
+            nprobe = min(nprobe, len(scores))
+            probed = np.argpartition(-scores, nprobe - 1)[:nprobe]
+            found = [self._list_ids(list_no) for list_no in probed]
+        return np.sort(np.concatenate(found))
+
+    def save(self) -> None:
+        """Writes the centroids and lists to `path`, atomically."""
+        if not self.path or self.centroids is None:
+            return
+        with self._lock:
+            lists = [self._list_ids(list_no) for list_no in range(len(self._lists))]
+            centroids, last_id = self.centroids, self.last_id
+            self._unsaved = 0
+        offsets = np.cumsum([0] + [len(ids) for ids in lists])
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                np.savez(
+                    f,
+                    centroids=centroids,
+                    ids=np.concatenate(lists),
+                    offsets=offsets,
+                    last_id=np.int64(last_id),
+                )
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.error(f"Failed to save IVF index to {self.path}: {e}")
+
+    def load(self) -> None:
+        """Reads the centroids and lists from `path`."""
+        try:
+            with np.load(self.path) as data:
+                centroids = data["centroids"]
+                ids = data["ids"]
+                offsets = data["offsets"]
+                last_id = int(data["last_id"])
+        except (OSError, KeyError, ValueError) as e:
+            logger.error(f"Failed to load IVF index from {self.path}: {e}")
+            return
+        with self._lock:
+            self.centroids = centroids
+            self._lists = [ids[offsets[i] : offsets[i + 1]] for i in range(len(centroids))]
+            self._pending = [[] for _ in range(len(centroids))]
+            self.last_id = last_id
+
+
+# Process-wide index shared by insert_entry() and the search route
+ann_index = IVFIndex(ann_index_path)
@@ -1,22 +1,80 @@
+import base64
+import json
+import time
+from itertools import islice
 from threading import Thread
 from datetime import datetime
+from functools import partial
+from typing import Optional
 
 import numpy as np
-from flask import Flask, jsonify, render_template_string, request, send_from_directory
+from flask import (
+    Flask,
+    Response,
+    jsonify,
+    render_template_string,
+    request,
+    send_from_directory,
+    stream_with_context,
+)
 from jinja2 import BaseLoader
 
-from openrecall.config import appdata_folder, screenshots_path
+from openrecall.ann import ann_index
+from openrecall.config import appdata_folder, args, screenshots_path
 from openrecall.database import (
+    BATCH_SIZE,
+    EXPORT_COLUMNS,
+    TIMELINE_ZOOMS,
+    add_standing_query,
+    apply_shard_embeddings,
     create_db,
-    get_all_entries,
-    get_timestamps,
-    get_entries_by_time_range,
+    delete_standing_query,
+    get_frames,
+    get_ingest_version,
+    get_timeline_buckets,
+    get_timestamp_bounds,
     get_unique_apps,
     get_unique_languages,
     get_activity_digest,
+    get_entry_batch,
+    get_session,
+    get_sessions,
+    get_shard_stats,
+    count_entries_needing_model,
+    get_embeddings_after,
+    get_entry_lines_after,
+    get_entry_titles_after,
+    get_line_embeddings_after,
+    get_query_matches,
+    get_standing_queries,
+    get_title_embeddings_after,
+    iter_entries,
+    keyword_search,
+    seal_shards,
+    seek_timestamp,
+    sync_embedding_store,
+)
+from openrecall.embedding_store import embedding_store
+from openrecall.nlp import (
+    DEFAULT_TOP_K,
+    EMBEDDING_DIM,
+    KEYWORD_CANDIDATES,
+    MODEL_NAME,
+    TITLE_WEIGHT,
+    EmbeddingIndex,
+    MultiVectorIndex,
+    TitleIndex,
+    embed_new_titles,
+    get_cache_stats,
+    get_query_embedding,
+    reciprocal_rank_fusion,
 )
-from openrecall.nlp import cosine_similarity, get_embedding
+from openrecall.planner import VECTOR_FIRST, QueryTrace, SearchPlanner
+from openrecall.reembed import ReembedJob
+from openrecall.result_cache import ResultCache
 from openrecall.screenshot import record_screenshots_thread, recording_paused
+from openrecall.shards import period_bounds
+from openrecall.standing_queries import DEFAULT_THRESHOLD, is_valid_webhook
 from openrecall.utils import human_readable_time, timestamp_to_human_readable
 
 app = Flask(__name__)
@@ -166,6 +224,13 @@ base_template = """
             <option value="{{ lang }}" {% if request.args.get('language') == lang %}selected{% endif %}>{{ lang }}</option>
           {% endfor %}
         </select>
+        <select class="form-control mx-2" name="mode">
+          <option value="screen">Whole Screen</option>
+          <option value="lines" {% if request.args.get('mode') == 'lines' %}selected{% endif %}>Best Line</option>
+          <option value="title" {% if request.args.get('mode') == 'title' %}selected{% endif %}>Title + Text</option>
+          <option value="hybrid" {% if request.args.get('mode') == 'hybrid' %}selected{% endif %}>Keyword + Semantic</option>
+          <option value="shortlist" {% if request.args.get('mode') == 'shortlist' %}selected{% endif %}>Keyword Shortlist</option>
+        </select>
         <input type="datetime-local" class="form-control mx-2" name="start_time" value="{{ request.args.get('start_time', '') }}">
         <input type="datetime-local" class="form-control mx-2" name="end_time" value="{{ request.args.get('end_time', '') }}">
         <button class="btn btn-primary" type="submit"><i class="fas fa-search"></i></button>
@@ -218,70 +283,240 @@ class StringLoader(BaseLoader):
 
 app.jinja_env.loader = StringLoader()
 
+# Resident semantic search indexes, extended with new entries before each search
+search_index = EmbeddingIndex(EMBEDDING_DIM)
+line_index = MultiVectorIndex(EMBEDDING_DIM)
+title_index = TitleIndex(EMBEDDING_DIM)
+# Chooses between filtering before and after ranking for each search
+search_planner = SearchPlanner()
+# Ranked ids of recent searches, for paging, refining and navigating back
+result_cache = ResultCache(args.result_cache_size, args.result_cache_ttl)
+
+
+def reset_search_indexes() -> None:
+    """Drops the resident indexes so that they reload on the next search.
+
+    Re-embedded entries keep their ids, so the append-only indexes cannot pick
+    them up incrementally.
+    """
+    global search_index, line_index, title_index
+    search_index = EmbeddingIndex(EMBEDDING_DIM)
+    line_index = MultiVectorIndex(EMBEDDING_DIM)
+    title_index = TitleIndex(EMBEDDING_DIM)
+    ann_index.reset()
+    sync_embedding_store(MODEL_NAME, EMBEDDING_DIM)
+
+
+reembed_job = ReembedJob(MODEL_NAME, on_complete=reset_search_indexes)
+
+
+def rank_by_screen(
+    query_embedding: np.ndarray, candidate_ids: Optional[np.ndarray], limit: int
+) -> np.ndarray:
+    """Ranks entries by the similarity of their mean (whole screen) embedding."""
+    fetch_after = partial(get_embeddings_after, dim=EMBEDDING_DIM, model=MODEL_NAME)
+    search_index.sync(fetch_after)
+    # Past the threshold, unfiltered queries only score the entries in the
+    # approximate index's nearest lists; smaller corpora are scanned exactly.
+    if candidate_ids is None and len(search_index) >= args.ann_threshold:
+        if ann_index.is_trained:
+            ann_index.sync(fetch_after)
+            candidate_ids = ann_index.candidates(query_embedding, args.ann_nprobe)
+        else:
+            ann_index.train_async(*search_index.snapshot())
+    ranked_ids, _ = search_index.search(
+        query_embedding, k=limit, candidate_ids=candidate_ids
+    )
+    return ranked_ids
+
+
+def rank_by_lines(
+    query_embedding: np.ndarray, candidate_ids: Optional[np.ndarray], limit: int
+) -> np.ndarray:
+    """Ranks entries by their best-matching OCR line."""
+    line_index.sync(
+        partial(get_line_embeddings_after, dim=EMBEDDING_DIM),
+        partial(get_entry_lines_after, model=MODEL_NAME),
+    )
+    ranked_ids, _ = line_index.search(
+        query_embedding, k=limit, candidate_ids=candidate_ids
+    )
+    return ranked_ids
+
+
+def rank_by_title(
+    query_embedding: np.ndarray,
+    candidate_ids: Optional[np.ndarray],
+    limit: int,
+    title_weight: float = TITLE_WEIGHT,
+) -> np.ndarray:
+    """Ranks entries by a blend of window title and text similarity."""
+    search_index.sync(
+        partial(get_embeddings_after, dim=EMBEDDING_DIM, model=MODEL_NAME)
+    )
+    embed_new_titles()
+    title_index.sync(
+        partial(get_title_embeddings_after, dim=EMBEDDING_DIM, model=MODEL_NAME),
+        get_entry_titles_after,
+    )
+    ranked_ids, _ = title_index.rank(
+        query_embedding,
+        search_index,
+        k=limit,
+        candidate_ids=candidate_ids,
+        title_weight=title_weight,
+    )
+    return ranked_ids
+
+
+def rank_hybrid(
+    q: str,
+    query_embedding: np.ndarray,
+    candidate_ids: Optional[np.ndarray],
+    limit: int,
+    shortlist: bool = False,
+) -> np.ndarray:
+    """Fuses BM25 keyword and whole-screen semantic rankings.
+
+    With `shortlist`, semantic scoring only runs on the keyword hits, unless
+    there are none.
+    """
+    keyword_ids, _ = keyword_search(q, KEYWORD_CANDIDATES, candidate_ids)
+    if shortlist and len(keyword_ids):
+        semantic_ids = rank_by_screen(query_embedding, keyword_ids, len(keyword_ids))
+    else:
+        semantic_ids = rank_by_screen(query_embedding, candidate_ids, max(limit, KEYWORD_CANDIDATES))
+    return reciprocal_rank_fusion([keyword_ids, semantic_ids], limit=limit)
+
+
+def rank_entries(
+    q: str,
+    query_embedding: np.ndarray,
+    mode: str,
+    title_weight: float,
+    candidate_ids: Optional[np.ndarray],
+    limit: int,
+) -> np.ndarray:
+    """Ranks entries with the ranking selected by the search `mode`."""
+    if mode == "lines":
+        return rank_by_lines(query_embedding, candidate_ids, limit)
+    if mode == "title":
+        return rank_by_title(query_embedding, candidate_ids, limit, title_weight)
+    if mode in ("hybrid", "shortlist"):
+        return rank_hybrid(
+            q, query_embedding, candidate_ids, limit, shortlist=mode == "shortlist"
+        )
+    return rank_by_screen(query_embedding, candidate_ids, limit)
+
 
 @app.route("/")
 def timeline():
-    # connect to db
-    timestamps = get_timestamps()
+    # Only the ends of the timeline are rendered; frames and the activity
+    # strip are fetched on demand, so the page size does not grow with history
+    bounds = get_timestamp_bounds()
     return render_template_string(
         """
 {% extends "base_template" %}
 {% block content %}
-{% if timestamps|length > 0 %}
+{% if bounds %}
   <div class="container-fluid">
     <div class="image-container mb-4">
-      <img id="timestampImage" src="/static/{{timestamps[0]}}.webp" alt="Image for timestamp" class="img-fluid rounded">
+      <img id="timestampImage" src="/static/{{bounds[1]}}.webp" alt="Image for timestamp" class="img-fluid rounded">
     </div>
     <div class="timeline-controls text-center">
       <button id="playPauseBtn" class="btn btn-primary mx-2"><i class="fas fa-play"></i></button>
       <div class="slider-container d-inline-block w-75 align-middle">
-        <input type="range" class="slider custom-range" id="discreteSlider" min="0" max="{{timestamps|length - 1}}" step="1" value="{{timestamps|length - 1}}">
+        <canvas id="activityStrip" height="24" class="w-100 d-block"></canvas>
+        <input type="range" class="slider custom-range" id="discreteSlider" min="{{bounds[0]}}" max="{{bounds[1]}}" step="1" value="{{bounds[1]}}">
       </div>
-      <div class="slider-value" id="sliderValue">{{timestamps[0] | timestamp_to_human_readable }}</div>
+      <div class="slider-value" id="sliderValue">{{bounds[1] | timestamp_to_human_readable }}</div>
     </div>
   </div>
   <script>
-    const timestamps = {{ timestamps|tojson }};
+    const first = {{ bounds[0] }};
+    const last = {{ bounds[1] }};
+    const pageSize = 100;
     const slider = document.getElementById('discreteSlider');
     const sliderValue = document.getElementById('sliderValue');
     const timestampImage = document.getElementById('timestampImage');
     const playPauseBtn = document.getElementById('playPauseBtn');
+    const activityStrip = document.getElementById('activityStrip');
+    let current = last;
+    let seekRequest = 0;
+    let queued = [];
     let playInterval;
 
-    function updateContent(index) {
-      const reversedIndex = timestamps.length - 1 - index;
-      const timestamp = timestamps[reversedIndex];
+    function updateContent(timestamp) {
+      current = timestamp;
       sliderValue.textContent = new Date(timestamp * 1000).toLocaleString();
       timestampImage.src = `/static/${timestamp}.webp`;
-      slider.value = index;
+      slider.value = timestamp;
     }
 
+    // The slider spans the recorded time; the nearest frame is looked up on demand
     slider.addEventListener('input', function() {
-      updateContent(this.value);
+      const request = ++seekRequest;
+      queued = [];
+      fetch(`/api/timeline/seek?timestamp=${this.value}`)
+        .then(response => response.ok ? response.json() : null)
+        .then(frame => {
+          if (frame && request === seekRequest) {
+            updateContent(frame.timestamp);
+          }
+        });
     });
 
+    function stop() {
+      clearInterval(playInterval);
+      playInterval = null;
+      playPauseBtn.innerHTML = '<i class="fas fa-play"></i>';
+    }
+
+    // Playback steps back in time, loading the previous frames a page at a time
+    function step() {
+      if (queued.length) {
+        updateContent(queued.shift());
+        return;
+      }
+      fetch(`/api/timeline/frames?end_time=${current - 1}&limit=${pageSize}&order=desc`)
+        .then(response => response.json())
+        .then(page => {
+          queued = page.timestamps;
+          if (queued.length) {
+            updateContent(queued.shift());
+          } else {
+            stop();
+          }
+        });
+    }
+
     playPauseBtn.addEventListener('click', function() {
       if (playInterval) {
-        clearInterval(playInterval);
-        playInterval = null;
-        this.innerHTML = '<i class="fas fa-play"></i>';
+        stop();
       } else {
         this.innerHTML = '<i class="fas fa-pause"></i>';
-        playInterval = setInterval(() => {
-          let currentValue = parseInt(slider.value, 10);
-          if (currentValue > 0) {
-            updateContent(currentValue - 1);
-          } else {
-            clearInterval(playInterval);
-            playInterval = null;
-            playPauseBtn.innerHTML = '<i class="fas fa-play"></i>';
-          }
-        }, 1000);
+        playInterval = setInterval(step, 1000);
       }
     });
 
-    // Initialize
-    updateContent(timestamps.length - 1);
+    // Entries per hour (per day for long histories) above the slider
+    const zoom = last - first > 30 * 86400 ? 'day' : 'hour';
+    const utcOffset = -new Date().getTimezoneOffset() * 60;
+    fetch(`/api/timeline?zoom=${zoom}&utc_offset=${utcOffset}`)
+      .then(response => response.json())
+      .then(timeline => {
+        const width = activityStrip.width = activityStrip.clientWidth;
+        const height = activityStrip.height;
+        const span = Math.max(1, last - first);
+        const barWidth = Math.max(1, timeline.bucket_seconds / span * width);
+        const peak = Math.max(1, ...timeline.buckets.map(bucket => bucket[1]));
+        const context = activityStrip.getContext('2d');
+        context.fillStyle = '#007bff';
+        for (const [start, count] of timeline.buckets) {
+          const barHeight = Math.max(1, count / peak * height);
+          context.fillRect((start - first) / span * width, height - barHeight, barWidth, barHeight);
+        }
+      });
   </script>
 {% else %}
   <div class="container-fluid">
@@ -292,7 +527,7 @@ def timeline():
 {% endif %}
 {% endblock %}
 """,
-        timestamps=timestamps,
+        bounds=bounds,
     )
 
 
@@ -303,32 +538,100 @@ def search():
     language_filter = request.args.get("language")
     start_time_str = request.args.get("start_time")
     end_time_str = request.args.get("end_time")
+    limit = request.args.get("limit", DEFAULT_TOP_K, type=int)
+    mode = request.args.get("mode", "screen")
     apps = get_unique_apps()
     languages = get_unique_languages()
 
+    start_time = end_time = None
     if start_time_str and end_time_str:
         start_time = int(
             datetime.strptime(start_time_str, "%Y-%m-%dT%H:%M").timestamp()
         )
         end_time = int(datetime.strptime(end_time_str, "%Y-%m-%dT%H:%M").timestamp())
-        entries = get_entries_by_time_range(start_time, end_time)
-    else:
-        entries = get_all_entries()
-
-    if app_filter:
-        entries = [entry for entry in entries if entry.app == app_filter]
-
-    if language_filter:
-        entries = [entry for entry in entries if entry.language == language_filter]
+    filters = {
+        "app": app_filter or None,
+        "language": language_filter or None,
+        "start_time": start_time,
+        "end_time": end_time,
+    }
+    trace = QueryTrace()
+    plan = None
 
     if q:
-        embeddings = [np.frombuffer(entry.embedding, dtype=np.float32) for entry in entries]
-        query_embedding = get_embedding(q)
-        similarities = [cosine_similarity(query_embedding, emb) for emb in embeddings]
-        indices = np.argsort(similarities)[::-1]
-        sorted_entries = [entries[i] for i in indices]
+        with trace.stage("embed query"):
+            query_embedding = get_query_embedding(q)
+        title_weight = request.args.get("title_weight", TITLE_WEIGHT, type=float)
+        rank = partial(rank_entries, q, query_embedding, mode, title_weight)
+        cache_key = (
+            " ".join(q.split()),
+            mode,
+            title_weight if mode == "title" else None,
+            tuple(filters.values()),
+            limit,
+            MODEL_NAME,
+        )
+        # Read before ranking, so that entries inserted meanwhile count as new
+        ingest_version = get_ingest_version()
+        extend = None
+        # Keyword scores depend on corpus-wide statistics, so hybrid rankings
+        # cannot be extended with new entries alone
+        if mode not in ("hybrid", "shortlist"):
+
+            def extend(cached_ids: np.ndarray, last_id: int) -> np.ndarray:
+                new_ids = get_entry_batch(**filters, after_id=last_id).ids
+                return rank(np.union1d(cached_ids, new_ids), limit)
+
+        with trace.stage("result cache") as stage:
+            ranked_ids = result_cache.get(cache_key, *ingest_version, extend=extend)
+            stage["hit"] = ranked_ids is not None
+        entries = None
+        if ranked_ids is not None:
+            with trace.stage("load") as stage:
+                entries = get_entry_batch(entry_ids=ranked_ids).take_ids(ranked_ids)
+                stage["rows"] = len(entries)
+        else:
+            plan = search_planner.plan(limit, **filters)
+            if plan.strategy == VECTOR_FIRST:
+                with trace.stage("rank") as stage:
+                    ranked_ids = rank(None, plan.fetch_k)
+                    stage["rows"] = len(ranked_ids)
+                with trace.stage("post-filter") as stage:
+                    # Only the ranked ids are read, and only those matching the
+                    # filters come back; the results page only needs timestamps,
+                    # so no text or title is decoded
+                    entries = get_entry_batch(**filters, entry_ids=ranked_ids).take_ids(ranked_ids)
+                    entries = entries.take(np.arange(min(limit, len(entries))))
+                    stage["rows"] = len(entries)
+                # Too few ranked results passed the filters, but more would have
+                # been ranked: the estimate was off, so the filters run first
+                if len(entries) < limit and len(ranked_ids) >= plan.fetch_k < plan.total_rows:
+                    trace.notes.append(
+                        "vector-first returned too few matches; fell back to filter-first"
+                    )
+                    entries = None
+            if entries is None:
+                with trace.stage("filter") as stage:
+                    entries = get_entry_batch(**filters)
+                    stage["rows"] = len(entries)
+                with trace.stage("rank") as stage:
+                    ranked_ids = rank(entries.ids, limit)
+                    entries = entries.take_ids(ranked_ids)
+                    stage["rows"] = len(entries)
+            result_cache.put(cache_key, *ingest_version, entries.ids)
     else:
-        sorted_entries = entries
+        with trace.stage("filter") as stage:
+            entries = get_entry_batch(**filters)
+            stage["rows"] = len(entries)
+
+    if request.args.get("explain"):
+        return jsonify(
+            {
+                "plan": plan._asdict() if plan is not None else None,
+                **trace.to_dict(),
+                "results": len(entries),
+            }
+        )
 
     return render_template_string(
         """
@@ -336,11 +639,11 @@ def search():
 {% block content %}
     <div class="container-fluid">
         <div class="row">
-            {% for entry in entries %}
+            {% for timestamp in timestamps %}
                 <div class="col-md-3 mb-4">
                     <div class="card">
                         <a href="#" data-toggle="modal" data-target="#modal-{{ loop.index0 }}">
-                            <img src="/static/{{ entry['timestamp'] }}.webp" alt="Image" class="card-img-top">
+                            <img src="/static/{{ timestamp }}.webp" alt="Image" class="card-img-top">
                         </a>
                     </div>
                 </div>
@@ -348,7 +651,7 @@ def search():
                     <div class="modal-dialog modal-xl" role="document" style="max-width: none; width: 100vw; height: 100vh; padding: 20px;">
                         <div class="modal-content" style="height: calc(100vh - 40px); width: calc(100vw - 40px); padding: 0;">
                             <div class="modal-body" style="padding: 0;">
-                                <img src="/static/{{ entry['timestamp'] }}.webp" alt="Image" style="width: 100%; height: 100%; object-fit: contain; margin: 0 auto;">
+                                <img src="/static/{{ timestamp }}.webp" alt="Image" style="width: 100%; height: 100%; object-fit: contain; margin: 0 auto;">
                             </div>
                         </div>
                     </div>
@@ -358,7 +661,7 @@ def search():
     </div>
 {% endblock %}
 """,
-        entries=sorted_entries,
+        timestamps=entries.timestamps.tolist(),
         apps=apps,
         languages=languages,
     )
@@ -437,17 +740,250 @@ def digest():
     )
 
 
+def _export_entry(entry: dict) -> str:
+    """Serializes one exported entry as an NDJSON line."""
+    if entry.get("embedding") is not None:
+        # float16 halves the size and keeps more precision than search needs
+        vector = np.frombuffer(entry["embedding"], dtype=np.float32).astype(np.float16)
+        entry["embedding"] = base64.b64encode(vector.tobytes()).decode("ascii")
+    return json.dumps(entry) + "\n"
+
+
 @app.route("/api/entries")
 def api_entries():
-    entries = get_all_entries()
-    return jsonify([entry._asdict() for entry in entries])
+    """Streams entries as NDJSON in ascending timestamp order.
+
+    Query parameters: `after_timestamp` (resume after this timestamp, e.g. the
+    last one received), `limit` (maximum number of entries, default all) and
+    `fields` (comma-separated columns; `embedding` adds the base64 float16
+    embedding). The timestamp is always included.
+    """
+    after_timestamp = request.args.get("after_timestamp", type=int)
+    limit = request.args.get("limit", type=int)
+    fields = request.args.get("fields")
+    columns = [field.strip() for field in fields.split(",") if field.strip()] if fields else None
+    unknown = set(columns or []) - set(EXPORT_COLUMNS)
+    if unknown:
+        return jsonify({"error": f"Unknown fields: {', '.join(sorted(unknown))}"}), 400
+
+    def generate():
+        for entry in islice(iter_entries(after_timestamp, columns), limit):
+            yield _export_entry(entry)
+
+    return Response(stream_with_context(generate()), mimetype="application/x-ndjson")
+
+
+@app.route("/api/sessions")
+def api_sessions():
+    """Lists activity sessions, newest first.
+
+    Query parameters: `start_time` and `end_time` (Unix timestamps; sessions
+    overlapping the range are returned), `app` and `limit`.
+    """
+    sessions = get_sessions(
+        start_time=request.args.get("start_time", type=int),
+        end_time=request.args.get("end_time", type=int),
+        app=request.args.get("app") or None,
+        limit=request.args.get("limit", type=int),
+    )
+    return jsonify([session._asdict() for session in sessions])
+
+
+@app.route("/api/sessions/<int:session_id>")
+def api_session(session_id: int):
+    """Returns one session with the ids and timestamps of its frames."""
+    session = get_session(session_id)
+    if session is None:
+        return jsonify({"error": f"Unknown session: {session_id}"}), 404
+    entries = get_entry_batch(
+        app=session.app,
+        start_time=session.start_time,
+        end_time=session.end_time,
+        ascending=True,
+    )
+    keep = np.array([title == session.title for title in entries.titles], dtype=bool)
+    entries = entries.take(np.flatnonzero(keep))
+    return jsonify(
+        {
+            **session._asdict(),
+            "entries": [
+                {"id": entry_id, "timestamp": timestamp}
+                for entry_id, timestamp in zip(entries.ids.tolist(), entries.timestamps.tolist())
+            ],
+        }
+    )
+
+
+@app.route("/api/standing_queries", methods=["GET", "POST"])
+def api_standing_queries():
+    """Lists the standing queries, or saves a new one.
+
+    A POST takes a JSON object with `query` and optionally `name`,
+    `threshold`, `keywords`, `app` and `webhook` (a URL new matches are
+    POSTed to; only http and https URLs are accepted).
+    """
+    if request.method == "POST":
+        body = request.get_json(silent=True) or {}
+        query = (body.get("query") or "").strip()
+        if not query:
+            return jsonify({"error": "Missing query"}), 400
+        webhook = body.get("webhook") or None
+        if webhook is not None and not (isinstance(webhook, str) and is_valid_webhook(webhook)):
+            return jsonify({"error": "The webhook must be an http or https URL"}), 400
+        query_id = add_standing_query(
+            body.get("name") or query,
+            query,
+            get_query_embedding(query),
+            MODEL_NAME,
+            threshold=float(body.get("threshold", DEFAULT_THRESHOLD)),
+            keywords=body.get("keywords") or None,
+            app=body.get("app") or None,
+            webhook=webhook,
+        )
+        if query_id is None:
+            return jsonify({"error": "Could not save the query"}), 500
+        return jsonify({"id": query_id}), 201
+    return jsonify(
+        [
+            {key: value for key, value in query._asdict().items() if key != "embedding"}
+            for query in get_standing_queries()
+        ]
+    )
+
+
+@app.route("/api/standing_queries/<int:query_id>", methods=["DELETE"])
+def api_delete_standing_query(query_id: int):
+    if not delete_standing_query(query_id):
+        return jsonify({"error": f"Unknown standing query: {query_id}"}), 404
+    return jsonify({"deleted": query_id})
+
+
+@app.route("/api/standing_queries/<int:query_id>/matches")
+def api_standing_query_matches(query_id: int):
+    """Lists the entries that matched a standing query, newest first.
+
+    Query parameters: `after_timestamp` (only newer matches, e.g. after the
+    last one seen) and `limit`.
+    """
+    matches = get_query_matches(
+        query_id,
+        after_timestamp=request.args.get("after_timestamp", type=int),
+        limit=request.args.get("limit", type=int),
+    )
+    return jsonify([match._asdict() for match in matches])
+
+
+@app.route("/api/timeline")
+def api_timeline():
+    """Counts the entries per time bucket.
+
+    Query parameters: `zoom` ("day", "hour" or "minute", default "hour"),
+    `start_time` and `end_time` (Unix timestamps) and `utc_offset` (seconds
+    east of UTC, so that days start at local midnight).
+    """
+    zoom = request.args.get("zoom", "hour")
+    if zoom not in TIMELINE_ZOOMS:
+        return jsonify({"error": f"Unknown zoom: {zoom}"}), 400
+    buckets = get_timeline_buckets(
+        zoom,
+        start_time=request.args.get("start_time", type=int),
+        end_time=request.args.get("end_time", type=int),
+        utc_offset=request.args.get("utc_offset", 0, type=int),
+    )
+    return jsonify({"zoom": zoom, "bucket_seconds": TIMELINE_ZOOMS[zoom], "buckets": buckets})
+
+
+@app.route("/api/timeline/frames")
+def api_timeline_frames():
+    """Lists the ids and timestamps of the frames in a time window.
+
+    Query parameters: `start_time` and `end_time` (Unix timestamps), `limit`
+    (default BATCH_SIZE) and `order` ("asc" or "desc"; with a limit, which
+    end of the window is returned).
+    """
+    ids, timestamps = get_frames(
+        start_time=request.args.get("start_time", type=int),
+        end_time=request.args.get("end_time", type=int),
+        limit=request.args.get("limit", BATCH_SIZE, type=int),
+        ascending=request.args.get("order", "asc") != "desc",
+    )
+    return jsonify({"ids": ids.tolist(), "timestamps": timestamps.tolist()})
+
+
+@app.route("/api/timeline/seek")
+def api_timeline_seek():
+    """Returns the frame closest to `timestamp`.
+
+    Query parameters: `timestamp` and `direction` ("before", "after" or
+    "nearest", the default).
+    """
+    timestamp = request.args.get("timestamp", type=int)
+    direction = request.args.get("direction", "nearest")
+    if timestamp is None or direction not in ("before", "after", "nearest"):
+        return jsonify({"error": "Expected a timestamp and a direction"}), 400
+    frame = seek_timestamp(timestamp, direction)
+    if frame is None:
+        return jsonify({"error": "No frame found"}), 404
+    return jsonify({"id": frame[0], "timestamp": frame[1]})
+
+
+@app.route("/api/ann/rebuild", methods=["POST"])
+def api_ann_rebuild():
+    search_index.sync(
+        partial(get_embeddings_after, dim=EMBEDDING_DIM, model=MODEL_NAME)
+    )
+    started = ann_index.train_async(*search_index.snapshot())
+    return jsonify({"started": started, "entries": len(search_index)})
+
+
+@app.route("/api/reembed", methods=["GET", "POST"])
+def api_reembed():
+    if request.method == "POST":
+        started = reembed_job.start()
+        return jsonify({"started": started, **reembed_job.status()})
+    return jsonify(reembed_job.status())
+
+
+@app.route("/api/stats")
+def api_stats():
+    return jsonify(
+        {
+            "caches": {**get_cache_stats(), "results": result_cache.stats()},
+            "embedding_store": embedding_store.stats(),
+            "shards": get_shard_stats(),
+        }
+    )
+
+
+def seal_shards_thread() -> None:
+    """
+    Seals finished partitions at startup and again whenever one ends.
+
+    Sealing waits while the re-embedding job runs (see `shard_lock`).
+    """
+    if args.shard_months <= 0:
+        return
+    while True:
+        seal_shards(args.shard_months)
+        _, next_start = period_bounds(int(time.time()), args.shard_months)
+        time.sleep(max(60, next_start - time.time() + 60))
 
 
 if __name__ == "__main__":
     create_db()
+    # Sealed entries re-embedded by an interrupted job
+    apply_shard_embeddings()
+    sync_embedding_store(MODEL_NAME, EMBEDDING_DIM)
 
     print(f"Appdata folder: {appdata_folder}")
 
+    # Entries embedded by another model are migrated in the background
+    if count_entries_needing_model(MODEL_NAME) > 0:
+        reembed_job.start()
+
+    # Past months are moved to read-only shards in the background
+    Thread(target=seal_shards_thread, daemon=True).start()
+
     # Start the thread to record screenshots
     t = Thread(target=record_screenshots_thread)
     t.start()
@@ -0,0 +1,87 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional
+
+
+class LRUCache:
+    """A thread-safe, size-bounded least-recently-used cache with hit counters.
+
+    The recorder thread and the Flask request threads share the caches built on
+    top of this class, so every operation takes a lock.
+    """
+
+    def __init__(self, max_size: int, ttl: Optional[float] = None) -> None:
+        """
+        Args:
+            max_size: The maximum number of items kept before the least
+                recently used ones are evicted. A value of 0 disables caching.
+            ttl: If set, items older than this many seconds are treated as
+                misses and dropped.
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        # Values are stored with the time they were put
+        self._data: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Returns the cached value for `key`, or None on a miss."""
+        with self._lock:
+            if key not in self._data:
+                self.misses += 1
+                return None
+            value, stored_at = self._data[key]
+            if self.ttl is not None and time.monotonic() - stored_at > self.ttl:
+                del self._data[key]
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any) -> None:
+        """Stores `value` under `key`, evicting the oldest items if needed."""
+        if self.max_size <= 0:
+            return
+        with self._lock:
+            self._data[key] = (value, time.monotonic())
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        """Removes `key` if it is cached."""
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self) -> None:
+        """Removes all items and resets the hit/miss counters."""
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+            self.expired = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._data
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns the current size, bounds and hit/miss counters."""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "ttl": self.ttl,
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
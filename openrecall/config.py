@@ -17,6 +17,89 @@ parser.add_argument(
     default=False,
 )
 
+parser.add_argument(
+    "--model",
+    default="all-MiniLM-L6-v2",
+    help="SentenceTransformer model used for text embeddings",
+)
+
+parser.add_argument(
+    "--line-cache-size",
+    type=int,
+    default=50000,
+    help="Number of OCR line embeddings kept in memory",
+)
+
+parser.add_argument(
+    "--no-line-cache-db",
+    action="store_true",
+    help="Do not persist OCR line embeddings in the database",
+    default=False,
+)
+
+parser.add_argument(
+    "--query-cache-size",
+    type=int,
+    default=256,
+    help="Number of search query embeddings kept in memory",
+)
+
+parser.add_argument(
+    "--result-cache-size",
+    type=int,
+    default=128,
+    help="Number of recent search results (ranked entry ids) kept in memory",
+)
+
+parser.add_argument(
+    "--result-cache-ttl",
+    type=float,
+    default=600.0,
+    help="Seconds a cached search result is reused",
+)
+
+parser.add_argument(
+    "--ann-threshold",
+    type=int,
+    default=50000,
+    help="Number of entries above which search uses the approximate index",
+)
+
+parser.add_argument(
+    "--ann-nprobe",
+    type=int,
+    default=8,
+    help="Approximate index lists visited per query (higher is slower but more accurate)",
+)
+
+parser.add_argument(
+    "--quantize-model",
+    action="store_true",
+    help="Run the embedding model with int8 linear layers (faster on CPU)",
+    default=False,
+)
+
+parser.add_argument(
+    "--ingest-batch-size",
+    type=int,
+    default=64,
+    help="Maximum number of entries committed to the database together",
+)
+
+parser.add_argument(
+    "--ingest-max-latency",
+    type=float,
+    default=1.0,
+    help="Seconds an entry may wait before its batch is committed",
+)
+
+parser.add_argument(
+    "--shard-months",
+    type=int,
+    default=0,
+    help="Seal finished periods of this many months into read-only archive shards (default 0: keep everything in one database)",
+)
+
 args = parser.parse_args()
 
 
@@ -43,6 +126,9 @@ else:
     appdata_folder = get_appdata_folder()
     screenshots_path = os.path.join(appdata_folder, "screenshots")
 db_path = os.path.join(appdata_folder, "recall.db")
+ann_index_path = os.path.join(appdata_folder, "ann_index.npz")
+embedding_store_path = os.path.join(appdata_folder, "embeddings")
+shards_path = os.path.join(appdata_folder, "shards")
 model_cache_path = os.path.join(appdata_folder, "sentence_transformers")
 
 for d in [screenshots_path, model_cache_path]:
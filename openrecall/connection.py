@@ -0,0 +1,128 @@
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Iterator, List, Optional
+from urllib.request import pathname2url
+
+BUSY_TIMEOUT_MS: int = 5000  # How long a statement waits on a locked database
+CACHE_SIZE_KIB: int = 65536  # Page cache per connection (64 MiB)
+MMAP_SIZE: int = 256 * 1024 * 1024  # Bytes of the database file memory-mapped
+MAX_IDLE_READERS: int = 8  # Reader connections kept open between calls
+
+
+class ConnectionPool:
+    """
+    Long-lived SQLite connections for one database file.
+
+    The database runs in WAL mode so that the web server's reads never wait
+    for the recorder's writes. All writes go through a single writer
+    connection guarded by a lock, which serializes them inside the process;
+    reads borrow one of a small pool of query-only connections, which are
+    kept open so that each call skips connection setup and keeps a warm page
+    cache.
+
+    A pool opened with `immutable=True` serves a file that is never written
+    again, such as a sealed shard: it only has readers, which skip locking
+    and change detection entirely.
+    """
+
+    def __init__(
+        self, path: str, max_idle_readers: int = MAX_IDLE_READERS, immutable: bool = False
+    ) -> None:
+        """
+        Args:
+            path: The path of the SQLite database file.
+            max_idle_readers: The number of reader connections kept open when
+                they are not in use. Extra readers are closed on return.
+            immutable: Whether the file is read-only and never modified.
+        """
+        self.path = path
+        self.max_idle_readers = max_idle_readers
+        self.immutable = immutable
+        self._idle_readers: List[sqlite3.Connection] = []
+        self._readers_lock = threading.Lock()
+        self._writer: Optional[sqlite3.Connection] = None
+        self._writer_lock = threading.Lock()
+        self._wal_ready = False
+
+    def _connect(self, read_only: bool) -> sqlite3.Connection:
+        """Opens a connection and applies the performance pragmas."""
+        if self.immutable:
+            uri = f"file:{pathname2url(self.path)}?mode=ro&immutable=1"
+            conn = sqlite3.connect(uri, uri=True, check_same_thread=False)
+            conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+            return conn
+        conn = sqlite3.connect(
+            self.path, timeout=BUSY_TIMEOUT_MS / 1000, check_same_thread=False
+        )
+        if not read_only:
+            # WAL is persistent in the file; the writer sets it before any
+            # reader connects.
+            conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT_MS}")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA cache_size=-{CACHE_SIZE_KIB}")
+        conn.execute(f"PRAGMA mmap_size={MMAP_SIZE}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        if read_only:
+            conn.execute("PRAGMA query_only=ON")
+        return conn
+
+    def _writer_connection(self) -> sqlite3.Connection:
+        """Returns the writer connection, opening it on first use."""
+        if self.immutable:
+            raise sqlite3.OperationalError(f"{self.path} is immutable")
+        if self._writer is None:
+            self._writer = self._connect(read_only=False)
+            self._wal_ready = True
+        return self._writer
+
+    @contextmanager
+    def writer(self) -> Iterator[sqlite3.Connection]:
+        """
+        Yields the writer connection for exclusive use by the calling thread.
+
+        The transaction is committed when the block exits normally and rolled
+        back if it raises.
+        """
+        with self._writer_lock:
+            conn = self._writer_connection()
+            try:
+                yield conn
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
+
+    @contextmanager
+    def reader(self) -> Iterator[sqlite3.Connection]:
+        """Yields a query-only connection for exclusive use by the calling thread."""
+        with self._readers_lock:
+            conn = self._idle_readers.pop() if self._idle_readers else None
+        if conn is None:
+            if not self._wal_ready and not self.immutable:
+                with self._writer_lock:
+                    self._writer_connection()
+            conn = self._connect(read_only=True)
+        try:
+            yield conn
+        finally:
+            if conn.in_transaction:
+                conn.rollback()
+            with self._readers_lock:
+                if len(self._idle_readers) < self.max_idle_readers:
+                    self._idle_readers.append(conn)
+                    conn = None
+            if conn is not None:
+                conn.close()
+
+    def close(self) -> None:
+        """Closes the writer and all idle reader connections."""
+        with self._readers_lock:
+            readers, self._idle_readers = self._idle_readers, []
+        for conn in readers:
+            conn.close()
+        with self._writer_lock:
+            if self._writer is not None:
+                self._writer.close()
+                self._writer = None
@@ -1,162 +1,2331 @@
+import os
+import re
+import shutil
 import sqlite3
+import threading
 import time
-from collections import namedtuple
+from collections import Counter, namedtuple
 import numpy as np
-from typing import Any, List, Optional, Tuple
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple
 
-from openrecall.config import db_path
+from openrecall.ann import ann_index
+from openrecall.config import db_path, shards_path
+from openrecall.connection import ConnectionPool
+from openrecall.embedding_store import embedding_store
+from openrecall.shards import Shard, ShardSet, period_bounds, write_meta
+from openrecall.standing_queries import DEFAULT_THRESHOLD, QueryMatch, StandingQuery, standing_queries
+from openrecall import text_store
 
 # Define the structure of a database entry using namedtuple
 Entry = namedtuple(
     "Entry", ["id", "app", "title", "text", "timestamp", "embedding", "language"]
 )
+# An entry to be inserted; see `insert_entry` for the fields
+NewEntry = namedtuple(
+    "NewEntry",
+    ["text", "timestamp", "embedding", "app", "title", "language", "line_hashes", "model"],
+    defaults=(None, None),
+)
+# Change counters of the entries; see `get_ingest_version`
+IngestVersion = namedtuple("IngestVersion", ["epoch", "version", "last_id"])
+# A run of consecutive entries in the same window; see `_create_session_table`
+Session = namedtuple(
+    "Session",
+    ["id", "app", "title", "start_time", "end_time", "frame_count", "entry_id", "entry_timestamp"],
+)
+
+# Number of rows read or written per round trip by bulk operations
+BATCH_SIZE: int = 500
+# Columns that can be selected by the paginated export
+EXPORT_COLUMNS: Tuple[str, ...] = (
+    "id", "timestamp", "app", "title", "text", "language", "model", "embedding",
+)
+# Words counted by the activity digest: letters (any script) with inner
+# apostrophes or hyphens, at least two characters, not touching digits
+TOKEN_PATTERN = re.compile(r"(?<!\w)[^\W\d_](?:[^\W\d_]|['-](?=[^\W\d_]))+(?!\w)")
+SECONDS_PER_HOUR: int = 3600
+# Dimension tables holding the distinct values of low-cardinality entry columns
+DIMENSION_TABLES: Dict[str, str] = {"app": "apps", "language": "languages"}
+# Entries joined with their dimension tables and titles, for reads that return names
+ENTRY_SOURCE: str = (
+    "entries"
+    " LEFT JOIN apps ON apps.id = entries.app_id"
+    " LEFT JOIN languages ON languages.id = entries.language_id"
+    " LEFT JOIN titles ON titles.id = entries.title_id"
+)
+# Model that produced all embeddings written before the model column existed
+LEGACY_MODEL_NAME: str = "all-MiniLM-L6-v2"
+# Keyword matches read per database when a search is restricted to candidates
+KEYWORD_SCAN_LIMIT: int = 20000
+# Reader connections kept open per sealed shard
+SHARD_IDLE_READERS: int = 2
+# Longest pause, in seconds, between two frames of the same session
+SESSION_GAP: int = 300
+# Bucket sizes, in seconds, of the timeline zoom levels
+TIMELINE_ZOOMS: Dict[str, int] = {"day": 86400, "hour": SECONDS_PER_HOUR, "minute": 60}
+# Columns of the sessions table, in the order `_extend_sessions` keeps them
+SESSION_COLUMNS: str = (
+    "id, start_time, end_time, app_id, title_id, frame_count, entry_id, entry_timestamp, entry_lines"
+)
+# Sessions with their app and title names, as read into `Session` tuples
+SESSION_QUERY: str = (
+    "SELECT sessions.id, apps.name, titles.title, sessions.start_time, sessions.end_time,"
+    " sessions.frame_count, sessions.entry_id, sessions.entry_timestamp"
+    " FROM sessions"
+    " LEFT JOIN apps ON apps.id = sessions.app_id"
+    " LEFT JOIN titles ON titles.id = sessions.title_id"
+)
+
+# Open connections per database path, so that tests pointing `db_path` at a
+# temporary file get their own pool.
+_pools: Dict[str, ConnectionPool] = {}
+_pools_lock = threading.Lock()
+# Sealed shards per shard directory, for the same reason
+_shard_sets: Dict[str, ShardSet] = {}
+
+
+# Current counters, with the last entry id read on first use
+_ingest_version = IngestVersion(0, 0, None)
+_ingest_lock = threading.Lock()
+
+# Held while entries move between the hot database and the shards, and by
+# jobs that must not see them move (see `openrecall.reembed.ReembedJob`)
+shard_lock = threading.RLock()
+
+# (name, entry count) pairs per dimension table, dropped whenever entries change
+_facet_cache: Dict[str, List[Tuple[str, int]]] = {}
+_facet_lock = threading.Lock()
+
+
+def _connections() -> ConnectionPool:
+    """Returns the connection pool of the current database path."""
+    with _pools_lock:
+        pool = _pools.get(db_path)
+        if pool is None:
+            pool = _pools[db_path] = ConnectionPool(db_path)
+        return pool
+
+
+def _shard_set() -> ShardSet:
+    """Returns the sealed shards of the current shard directory."""
+    with _pools_lock:
+        shard_set = _shard_sets.get(shards_path)
+        if shard_set is None:
+            shard_set = _shard_sets[shards_path] = ShardSet(shards_path)
+        return shard_set
+
+
+def _shard_pool(path: str) -> ConnectionPool:
+    """Returns the read-only connection pool of a sealed shard."""
+    with _pools_lock:
+        pool = _pools.get(path)
+        if pool is None:
+            pool = _pools[path] = ConnectionPool(path, SHARD_IDLE_READERS, immutable=True)
+        return pool
+
+
+def _sources(**filters: Any) -> List[Tuple[ConnectionPool, Optional[Shard]]]:
+    """
+    Returns the databases a read has to visit, oldest first.
+
+    These are the sealed shards that may hold entries matching `filters`
+    (see `Shard.may_contain`), followed by the hot database, paired with
+    their shard (None for the hot database).
+    """
+    sources: List[Tuple[ConnectionPool, Optional[Shard]]] = [
+        (_shard_pool(shard.path), shard) for shard in _shard_set().select(**filters)
+    ]
+    sources.append((_connections(), None))
+    return sources
+
+
+def _drop_pool(path: str) -> None:
+    """Closes the pooled connections to a file that is about to be replaced."""
+    with _pools_lock:
+        pool = _pools.pop(path, None)
+    if pool is not None:
+        pool.close()
+
+
+def close_connections() -> None:
+    """Closes all pooled connections, e.g. on shutdown."""
+    with _pools_lock:
+        pools = list(_pools.values())
+        _pools.clear()
+    for pool in pools:
+        pool.close()
+
+
+def create_db() -> None:
+    """
+    Creates the SQLite database and the 'entries' table if they don't exist.
+
+    The table schema includes columns for an auto-incrementing ID, application name,
+    window title, extracted text, timestamp, and text embedding.
+    """
+    try:
+        with _connections().writer() as conn:
+            cursor = conn.cursor()
+            has_sessions = cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sessions'"
+            ).fetchone()
+            compacted = _create_schema(cursor)
+            if not has_sessions:
+                # Sealed entries are included, so this runs here rather than
+                # in `_create_schema`, which also creates shards
+                _rebuild_sessions(cursor)
+    except sqlite3.Error as e:
+        print(f"Database error during table creation: {e}")
+        compacted = 0
+    _invalidate_facets()
+    if compacted:
+        # Give the space freed by the text migration back to the file system
+        try:
+            with _connections().writer() as conn:
+                conn.execute("VACUUM")
+        except sqlite3.Error as e:
+            print(f"Database error while compacting: {e}")
+
+
+def _create_schema(cursor: sqlite3.Cursor) -> int:
+    """
+    Creates or migrates every table of a database, hot or shard.
+
+    Args:
+        cursor (sqlite3.Cursor): A cursor on an open connection.
+
+    Returns:
+        int: The number of entries whose text was moved to the line store.
+    """
+    cursor.execute(
+        """CREATE TABLE IF NOT EXISTS entries (
+               id INTEGER PRIMARY KEY AUTOINCREMENT,
+               app TEXT,
+               title TEXT,
+               text TEXT,
+               timestamp INTEGER UNIQUE,
+               embedding BLOB,
+               language TEXT
+           )"""
+    )
+    # Add index on timestamp for faster lookups
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_timestamp ON entries (timestamp)"
+    )
+    # Distinct (app, title) pairs, each embedded once for title search
+    cursor.execute(
+        """CREATE TABLE IF NOT EXISTS titles (
+               id INTEGER PRIMARY KEY AUTOINCREMENT,
+               app TEXT,
+               title TEXT,
+               embedding BLOB,
+               model TEXT,
+               UNIQUE (app, title)
+           )"""
+    )
+    _migrate_model_column(cursor)
+    _migrate_title_ids(cursor)
+    _migrate_dimension_tables(cursor)
+    _create_filter_indexes(cursor)
+    text_store.create_table(cursor)
+    compacted = _migrate_text_store(cursor)
+    _create_fts_index(cursor)
+    _create_rollup_tables(cursor)
+    _create_session_table(cursor)
+    _create_standing_query_tables(cursor)
+    # Persistent backing store for the OCR line embedding cache
+    cursor.execute(
+        """CREATE TABLE IF NOT EXISTS line_embeddings (
+               hash TEXT PRIMARY KEY,
+               embedding BLOB
+           )"""
+    )
+    # Per-entry line references for multi-vector search: an int64
+    # array of line_embeddings rowids, so repeated lines are stored once
+    cursor.execute(
+        """CREATE TABLE IF NOT EXISTS entry_lines (
+               entry_id INTEGER PRIMARY KEY,
+               line_ids BLOB
+           )"""
+    )
+    # New embeddings of sealed entries, until `apply_shard_embeddings`
+    # rewrites their shards
+    cursor.execute(
+        """CREATE TABLE IF NOT EXISTS shard_embeddings (
+               entry_id INTEGER PRIMARY KEY,
+               embedding BLOB,
+               model TEXT,
+               line_ids BLOB
+           )"""
+    )
+    return compacted
+
+
+def _migrate_model_column(cursor: sqlite3.Cursor) -> None:
+    """
+    Adds the column recording which model produced each embedding.
+
+    Rows that predate the column were embedded with the legacy default model.
+
+    Args:
+        cursor (sqlite3.Cursor): A cursor on an open connection.
+    """
+    columns = {row[1] for row in cursor.execute("PRAGMA table_info(entries)")}
+    if "model" not in columns:
+        cursor.execute("ALTER TABLE entries ADD COLUMN model TEXT")
+        cursor.execute("UPDATE entries SET model = ?", (LEGACY_MODEL_NAME,))
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_model ON entries (model)")
+
+
+def _migrate_title_ids(cursor: sqlite3.Cursor) -> None:
+    """
+    Adds the reference from entries to their (app, title) pair and fills it.
+
+    Titles are then read through `title_id`, so the `title` column is
+    emptied. It is kept for compatibility with SQLite versions that cannot
+    drop columns.
+
+    Args:
+        cursor (sqlite3.Cursor): A cursor on an open connection.
+    """
+    columns = {row[1] for row in cursor.execute("PRAGMA table_info(entries)")}
+    if "title_id" not in columns:
+        cursor.execute("ALTER TABLE entries ADD COLUMN title_id INTEGER")
+        cursor.execute(
+            "INSERT OR IGNORE INTO titles (app, title) SELECT DISTINCT app, title FROM entries"
+        )
+        cursor.execute(
+            """UPDATE entries SET title_id = (
+                   SELECT id FROM titles
+                   WHERE titles.app IS entries.app AND titles.title IS entries.title
+               )"""
+        )
+        cursor.execute("UPDATE entries SET title = NULL")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_title_id ON entries (title_id)")
+
+
+def _create_fts_index(cursor: sqlite3.Cursor) -> None:
+    """
+    Creates the FTS5 keyword index over entry text and titles.
+
+    The index is contentless, so the text is not stored twice: `insert_entries`
+    passes it the text and title of each new entry, and `_delete_rows`
+    removes entries with the text they were indexed with. Existing entries
+    are indexed when the table is first created. SQLite builds without FTS5
+    only lose keyword search.
+
+    Args:
+        cursor (sqlite3.Cursor): A cursor on an open connection.
+    """
+    if _has_fts(cursor):
+        return
+    try:
+        cursor.execute(
+            "CREATE VIRTUAL TABLE entries_fts USING fts5(text, title, content='')"
+        )
+    except sqlite3.OperationalError as e:
+        print(f"Full-text search is unavailable: {e}")
+        return
+    _index_entries(cursor)
+
+
+def _index_entries(cursor: sqlite3.Cursor) -> None:
+    """Adds every entry to the (empty) keyword index."""
+    last_id = 0
+    while True:
+        rows = cursor.execute(
+            f"SELECT entries.id, titles.title, entries.text, entries.text_line_ids FROM {ENTRY_SOURCE} WHERE entries.id > ? ORDER BY entries.id LIMIT ?",
+            (last_id, BATCH_SIZE),
+        ).fetchall()
+        if not rows:
+            break
+        texts = _resolve_texts(cursor, [(row[2], row[3]) for row in rows])
+        cursor.executemany(
+            "INSERT INTO entries_fts (rowid, text, title) VALUES (?, ?, ?)",
+            [(row[0], text, row[1]) for row, text in zip(rows, texts)],
+        )
+        last_id = rows[-1][0]
+
+
+def _has_fts(cursor: sqlite3.Cursor) -> bool:
+    """Returns True if the keyword index exists."""
+    return cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'entries_fts'"
+    ).fetchone() is not None
+
+
+def _migrate_text_store(cursor: sqlite3.Cursor) -> int:
+    """
+    Moves entry text into the content-addressed line store.
+
+    Entries keep their lines as packed ids in `text_line_ids`; `text` is
+    emptied. The column itself is kept for compatibility with SQLite
+    versions that cannot drop columns.
+
+    Args:
+        cursor (sqlite3.Cursor): A cursor on an open connection.
+
+    Returns:
+        int: The number of entries migrated.
+    """
+    columns = {row[1] for row in cursor.execute("PRAGMA table_info(entries)")}
+    if "text_line_ids" not in columns:
+        cursor.execute("ALTER TABLE entries ADD COLUMN text_line_ids BLOB")
+    migrated = 0
+    while True:
+        rows = cursor.execute(
+            "SELECT id, text FROM entries WHERE text IS NOT NULL LIMIT ?", (BATCH_SIZE,)
+        ).fetchall()
+        if not rows:
+            break
+        blobs = text_store.store_texts(cursor, [text for _, text in rows])
+        text_store.add_references(cursor, blobs)
+        cursor.executemany(
+            "UPDATE entries SET text_line_ids = ?, text = NULL WHERE id = ?",
+            [(blob, entry_id) for (entry_id, _), blob in zip(rows, blobs)],
+        )
+        migrated += len(rows)
+    return migrated
+
+
+def _resolve_texts(
+    cursor: sqlite3.Cursor, pairs: List[Tuple[Optional[str], Optional[bytes]]]
+) -> List[Optional[str]]:
+    """
+    Returns entry texts from (text, text_line_ids) column pairs.
+
+    Rows not yet migrated still carry their text; the others are rebuilt from
+    the line store in one batch.
+    """
+    pending = [blob if text is None else None for text, blob in pairs]
+    rebuilt = text_store.load_texts(cursor, pending)
+    return [text if text is not None else other for (text, _), other in zip(pairs, rebuilt)]
+
+
+def _migrate_dimension_tables(cursor: sqlite3.Cursor) -> None:
+    """
+    Moves app names and languages into the `apps` and `languages` tables.
+
+    Entries reference them through `app_id` and `language_id`. The old text
+    columns are kept for compatibility with SQLite versions that cannot drop
+    columns, but are emptied, so each row only stores two integers. Each
+    dimension row also keeps the number of entries referencing it, maintained
+    by triggers, which makes facet counts a lookup.
+
+    Args:
+        cursor (sqlite3.Cursor): A cursor on an open connection.
+    """
+    columns = {row[1] for row in cursor.execute("PRAGMA table_info(entries)")}
+    migrated = False
+    for column, table in DIMENSION_TABLES.items():
+        cursor.execute(
+            f"""CREATE TABLE IF NOT EXISTS {table} (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    name TEXT UNIQUE,
+                    entry_count INTEGER NOT NULL DEFAULT 0
+                )"""
+        )
+        if f"{column}_id" not in columns:
+            cursor.execute(f"ALTER TABLE entries ADD COLUMN {column}_id INTEGER")
+        cursor.execute(
+            f"INSERT OR IGNORE INTO {table} (name) SELECT DISTINCT {column} FROM entries WHERE {column} IS NOT NULL"
+        )
+        cursor.execute(
+            f"""UPDATE entries SET {column}_id = (SELECT id FROM {table} WHERE name = entries.{column}),
+                                   {column} = NULL
+                WHERE {column} IS NOT NULL"""
+        )
+        migrated = migrated or cursor.rowcount > 0
+        for event, row, delta in (("INSERT", "new", "+ 1"), ("DELETE", "old", "- 1")):
+            cursor.execute(
+                f"""CREATE TRIGGER IF NOT EXISTS {table}_count_{event.lower()} AFTER {event} ON entries BEGIN
+                        UPDATE {table} SET entry_count = entry_count {delta} WHERE id = {row}.{column}_id;
+                    END"""
+            )
+        if migrated:
+            cursor.execute(
+                f"UPDATE {table} SET entry_count = (SELECT COUNT(*) FROM entries WHERE {column}_id = {table}.id)"
+            )
+
+
+def _create_filter_indexes(cursor: sqlite3.Cursor) -> None:
+    """
+    Creates the composite indexes used by `query_entries`.
+
+    A search filtered to one app or language over a time range reads only
+    the matching index range instead of scanning the table.
+
+    Args:
+        cursor (sqlite3.Cursor): A cursor on an open connection.
+    """
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_app_timestamp ON entries (app_id, timestamp)"
+    )
+    cursor.execute(
+        "CREATE INDEX IF NOT EXISTS idx_language_timestamp ON entries (language_id, timestamp)"
+    )
+
+
+def _get_or_create_dimension_id(
+    cursor: sqlite3.Cursor, table: str, name: Optional[str]
+) -> Optional[int]:
+    """Returns the id of `name` in a dimension table, inserting it if it is new."""
+    if name is None:
+        return None
+    cursor.execute(f"INSERT OR IGNORE INTO {table} (name) VALUES (?)", (name,))
+    return cursor.execute(f"SELECT id FROM {table} WHERE name = ?", (name,)).fetchone()[0]
+
+
+def _create_rollup_tables(cursor: sqlite3.Cursor) -> None:
+    """
+    Creates the per-hour rollups behind the activity digest.
+
+    `app_hourly` counts entries per (hour, app) and `token_hourly` counts
+    word occurrences per (hour, token), where hour is the timestamp divided
+    by SECONDS_PER_HOUR. Both are updated by `insert_entries`; existing
+    entries are counted when the tables are first created.
+
+    Args:
+        cursor (sqlite3.Cursor): A cursor on an open connection.
+    """
+    exists = cursor.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'app_hourly'"
+    ).fetchone()
+    cursor.execute(
+        """CREATE TABLE IF NOT EXISTS app_hourly (
+               hour INTEGER,
+               app TEXT,
+               count INTEGER,
+               PRIMARY KEY (hour, app)
+           ) WITHOUT ROWID"""
+    )
+    cursor.execute(
+        """CREATE TABLE IF NOT EXISTS token_hourly (
+               hour INTEGER,
+               token TEXT,
+               count INTEGER,
+               PRIMARY KEY (hour, token)
+           ) WITHOUT ROWID"""
+    )
+    if exists:
+        return
+    last_id = 0
+    while True:
+        rows = cursor.execute(
+            f"SELECT entries.id, entries.timestamp, apps.name, entries.text, entries.text_line_ids FROM {ENTRY_SOURCE} WHERE entries.id > ? ORDER BY entries.id LIMIT ?",
+            (last_id, BATCH_SIZE),
+        ).fetchall()
+        if not rows:
+            break
+        texts = _resolve_texts(cursor, [(row[3], row[4]) for row in rows])
+        _update_rollups(cursor, [(row[1], row[2], text) for row, text in zip(rows, texts)])
+        last_id = rows[-1][0]
+
+
+def tokenize(text: str) -> List[str]:
+    """
+    Splits text into lowercase words for the activity digest.
+
+    Unlike `str.split`, punctuation is not glued to words ("hello," and
+    "Hello" count as one word) and numbers, symbols and single letters, which
+    OCR produces in bulk, are dropped.
+    """
+    return TOKEN_PATTERN.findall(text.lower()) if text else []
+
+
+def _update_rollups(cursor: sqlite3.Cursor, rows: List[Tuple[int, str, str]]) -> None:
+    """Adds (timestamp, app, text) rows to the per-hour digest rollups."""
+    app_counts: Counter = Counter()
+    token_counts: Counter = Counter()
+    for timestamp, app, text in rows:
+        hour = timestamp // SECONDS_PER_HOUR
+        # Key columns of a WITHOUT ROWID table cannot be NULL
+        app_counts[(hour, app if app is not None else "")] += 1
+        token_counts.update((hour, token) for token in tokenize(text))
+    cursor.executemany(
+        """INSERT INTO app_hourly (hour, app, count) VALUES (?, ?, ?)
+           ON CONFLICT(hour, app) DO UPDATE SET count = count + excluded.count""",
+        [(hour, app, count) for (hour, app), count in app_counts.items()],
+    )
+    cursor.executemany(
+        """INSERT INTO token_hourly (hour, token, count) VALUES (?, ?, ?)
+           ON CONFLICT(hour, token) DO UPDATE SET count = count + excluded.count""",
+        [(hour, token, count) for (hour, token), count in token_counts.items()],
+    )
+
+
+def _create_session_table(cursor: sqlite3.Cursor) -> None:
+    """
+    Creates the table of activity sessions.
+
+    A session is a run of consecutive entries with the same app and window
+    title, none more than SESSION_GAP seconds after the previous one. It
+    records its time span, its number of frames and a representative entry,
+    the frame with the most OCR lines. `insert_entries` extends the latest
+    session or starts a new one, so listing what happened over a day reads a
+    few hundred sessions rather than every frame.
+
+    Args:
+        cursor (sqlite3.Cursor): A cursor on an open connection.
+    """
+    cursor.execute(
+        """CREATE TABLE IF NOT EXISTS sessions (
+               id INTEGER PRIMARY KEY,
+               start_time INTEGER,
+               end_time INTEGER,
+               app_id INTEGER,
+               title_id INTEGER,
+               frame_count INTEGER,
+               entry_id INTEGER,
+               entry_timestamp INTEGER,
+               entry_lines INTEGER
+           )"""
+    )
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_sessions_start ON sessions (start_time)")
+    cursor.execute("CREATE INDEX IF NOT EXISTS idx_sessions_end ON sessions (end_time)")
+
+
+def _extend_sessions(
+    cursor: sqlite3.Cursor,
+    rows: List[Tuple[int, int, Optional[int], Optional[int], int]],
+    current: Optional[List[Any]],
+) -> Optional[List[Any]]:
+    """
+    Adds entries to the sessions table.
+
+    Args:
+        cursor (sqlite3.Cursor): A cursor inside the writing transaction.
+        rows: (id, timestamp, app_id, title_id, line count) of each entry, in
+              timestamp order.
+        current: The session the first entry may continue, as a list of
+                 SESSION_COLUMNS values, or None.
+
+    Returns:
+        Optional[List[Any]]: The session of the last entry, to pass on with
+                             the next rows.
+    """
+    changed: List[List[Any]] = []
+    for entry_id, timestamp, app_id, title_id, line_count in rows:
+        if (
+            current is not None
+            and current[3] == app_id
+            and current[4] == title_id
+            and 0 <= timestamp - current[2] <= SESSION_GAP
+        ):
+            current[2] = timestamp
+            current[5] += 1
+            if line_count > current[8]:
+                current[6:9] = [entry_id, timestamp, line_count]
+        else:
+            # A new window, a pause, or an entry recorded out of order
+            current = [None, timestamp, timestamp, app_id, title_id, 1, entry_id, timestamp, line_count]
+        if not changed or changed[-1] is not current:
+            changed.append(current)
+    for session in changed:
+        if session[0] is None:
+            cursor.execute(
+                f"INSERT INTO sessions ({SESSION_COLUMNS}) VALUES ({','.join('?' * 9)})", session
+            )
+            session[0] = cursor.lastrowid
+        else:
+            cursor.execute(
+                """UPDATE sessions SET end_time = ?, frame_count = ?, entry_id = ?,
+                       entry_timestamp = ?, entry_lines = ?
+                   WHERE id = ?""",
+                (session[2], *session[5:9], session[0]),
+            )
+    return current
+
+
+def _last_session(cursor: sqlite3.Cursor) -> Optional[List[Any]]:
+    """Returns the most recent session, which new entries may continue."""
+    row = cursor.execute(
+        f"SELECT {SESSION_COLUMNS} FROM sessions ORDER BY end_time DESC LIMIT 1"
+    ).fetchone()
+    return list(row) if row is not None else None
+
+
+def _rebuild_sessions(cursor: sqlite3.Cursor) -> None:
+    """
+    Recomputes every session from the entries, reading the sealed shards too.
+
+    Args:
+        cursor (sqlite3.Cursor): A cursor inside the writing transaction on
+                                 the hot database.
+    """
+    cursor.execute("DELETE FROM sessions")
+    line_size = text_store.LINE_ID_DTYPE.itemsize
+    current = None
+    for pool, shard in _sources():
+        after = None
+        while True:
+            sql = f"SELECT id, timestamp, app_id, title_id, COALESCE(length(text_line_ids), 0) / {line_size} FROM entries"
+            params: List[Any] = []
+            if after is not None:
+                sql += " WHERE timestamp > ?"
+                params.append(after)
+            sql += " ORDER BY timestamp LIMIT ?"
+            params.append(BATCH_SIZE)
+            if shard is None:
+                rows = cursor.execute(sql, params).fetchall()
+            else:
+                with pool.reader() as conn:
+                    rows = conn.execute(sql, params).fetchall()
+            if not rows:
+                break
+            current = _extend_sessions(cursor, rows, current)
+            after = rows[-1][1]
+
+
+def _create_standing_query_tables(cursor: sqlite3.Cursor) -> None:
+    """
+    Creates the tables of saved searches and of the entries matching them.
+
+    See `openrecall.standing_queries` for how new entries are matched.
+
+    Args:
+        cursor (sqlite3.Cursor): A cursor on an open connection.
+    """
+    cursor.execute(
+        """CREATE TABLE IF NOT EXISTS standing_queries (
+               id INTEGER PRIMARY KEY,
+               name TEXT,
+               query TEXT,
+               embedding BLOB,
+               model TEXT,
+               threshold REAL,
+               keywords TEXT,
+               app TEXT,
+               webhook TEXT
+           )"""
+    )
+    cursor.execute(
+        """CREATE TABLE IF NOT EXISTS query_matches (
+               query_id INTEGER,
+               entry_id INTEGER,
+               timestamp INTEGER,
+               score REAL,
+               PRIMARY KEY (query_id, entry_id)
+           ) WITHOUT ROWID"""
+    )
+
+
+def _read_standing_queries(cursor: sqlite3.Cursor) -> List[StandingQuery]:
+    """Reads every standing query, with its embedding."""
+    rows = cursor.execute(
+        "SELECT id, name, query, embedding, model, threshold, keywords, app, webhook FROM standing_queries ORDER BY id"
+    ).fetchall()
+    return [
+        StandingQuery(row[0], row[1], row[2], np.frombuffer(row[3], dtype=np.float32), *row[4:])
+        for row in rows
+    ]
+
+
+def _fts_query(query: str) -> Optional[str]:
+    """
+    Turns free text into an FTS5 query matching any of its terms.
+
+    Each whitespace-separated term is quoted as a phrase, so that strings
+    such as error codes ("0x80070005") or ticket numbers ("PROJ-1234") match
+    as written and FTS5 operators in user input are treated as text.
+    """
+    terms = [
+        '"' + term.replace('"', '""') + '"'
+        for term in query.split()
+        if re.search(r"\w", term)
+    ]
+    return " OR ".join(terms) if terms else None
+
+
+def keyword_search(
+    query: str, limit: int, candidate_ids: Optional[np.ndarray] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Ranks entries by BM25 over their text and window title.
+
+    Args:
+        query (str): The free-text query.
+        limit (int): The maximum number of results.
+        candidate_ids (Optional[np.ndarray]): If given, only these entries are
+                                              returned.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The matching entry ids, best first, and
+            their BM25 scores (higher is better).
+    """
+    match = _fts_query(query)
+    rows: List[Tuple[int, float]] = []
+    if candidate_ids is not None:
+        candidate_ids = np.unique(np.asarray(candidate_ids, dtype=np.int64))
+        if len(candidate_ids) == 0:
+            match = None
+    if match is not None:
+        bounds = {}
+        if candidate_ids is not None:
+            bounds = {"min_id": int(candidate_ids[0]), "max_id": int(candidate_ids[-1])}
+        try:
+            # Each shard ranks with its own BM25 statistics
+            for pool, _ in _sources(**bounds):
+                with pool.reader() as conn:
+                    if candidate_ids is None:
+                        rows.extend(
+                            conn.execute(
+                                "SELECT rowid, -bm25(entries_fts) FROM entries_fts WHERE entries_fts MATCH ? ORDER BY rank LIMIT ?",
+                                (match, limit),
+                            ).fetchall()
+                        )
+                    else:
+                        rows.extend(_keyword_candidates(conn, match, candidate_ids, limit))
+        except sqlite3.Error as e:
+            print(f"Database error during keyword search: {e}")
+
+    ids = np.array([row[0] for row in rows], dtype=np.int64)
+    scores = np.array([row[1] for row in rows], dtype=np.float32)
+    order = np.argsort(-scores, kind="stable")[:limit]
+    return ids[order], scores[order]
+
+
+def _keyword_candidates(
+    conn: sqlite3.Connection, match: str, candidate_ids: np.ndarray, limit: int
+) -> List[Tuple[int, float]]:
+    """
+    Returns the best keyword matches of one database among the candidates.
+
+    The candidates' id range is part of the FTS query, which FTS5 answers
+    from its id-ordered posting lists. Matches are then read in rank order,
+    one page at a time, until `limit` of them are candidates, reading at
+    most KEYWORD_SCAN_LIMIT matches.
+
+    Args:
+        conn (sqlite3.Connection): A connection to the database.
+        match (str): The FTS5 query.
+        candidate_ids (np.ndarray): The allowed entry ids, sorted and unique.
+        limit (int): The maximum number of results.
+
+    Returns:
+        List[Tuple[int, float]]: (entry id, BM25 score) pairs, best first.
+    """
+    cursor = conn.execute(
+        "SELECT rowid, -bm25(entries_fts) FROM entries_fts"
+        " WHERE entries_fts MATCH ? AND rowid BETWEEN ? AND ? ORDER BY rank LIMIT ?",
+        (match, int(candidate_ids[0]), int(candidate_ids[-1]), KEYWORD_SCAN_LIMIT),
+    )
+    found: List[Tuple[int, float]] = []
+    try:
+        while len(found) < limit:
+            page = cursor.fetchmany(BATCH_SIZE)
+            if not page:
+                break
+            page_ids = np.array([row[0] for row in page], dtype=np.int64)
+            keep = np.isin(page_ids, candidate_ids, assume_unique=True)
+            found.extend(row for row, kept in zip(page, keep) if kept)
+    finally:
+        cursor.close()
+    return found[:limit]
+
+
+def _get_or_create_title_id(cursor: sqlite3.Cursor, app: str, title: str) -> int:
+    """Returns the id of an (app, title) pair, inserting it if it is new."""
+    cursor.execute("INSERT OR IGNORE INTO titles (app, title) VALUES (?, ?)", (app, title))
+    return cursor.execute(
+        "SELECT id FROM titles WHERE app IS ? AND title IS ?", (app, title)
+    ).fetchone()[0]
+
+
+def _select_list(columns: Iterable[str]) -> str:
+    """Returns the SELECT expressions of entry columns, read from ENTRY_SOURCE."""
+    expressions = []
+    for column in columns:
+        if column in DIMENSION_TABLES:
+            expressions.append(f"{DIMENSION_TABLES[column]}.name AS {column}")
+        elif column == "text":
+            # Rebuilt from the line store by `_rows_to_dicts`
+            expressions.append("entries.text AS text, entries.text_line_ids AS text_line_ids")
+        elif column == "title":
+            expressions.append("titles.title AS title")
+        else:
+            expressions.append(f"entries.{column} AS {column}")
+    return ", ".join(expressions)
+
+
+def _rows_to_dicts(cursor: sqlite3.Cursor, rows: List[sqlite3.Row]) -> List[Dict[str, Any]]:
+    """Converts rows selected with `_select_list` to dicts, rebuilding texts."""
+    results = [dict(zip(row.keys(), row)) for row in rows]
+    if results and "text_line_ids" in results[0]:
+        texts = _resolve_texts(
+            cursor, [(result["text"], result.pop("text_line_ids")) for result in results]
+        )
+        for result, text in zip(results, texts):
+            result["text"] = text
+    return results
+
+
+class EntryBatch:
+    """
+    A columnar set of entries.
+
+    Ids and timestamps are NumPy arrays and the embeddings, if read, a single
+    (n, dim) float32 matrix, so a large read costs a few arrays instead of
+    one namedtuple and one array object per row. Apps, languages, titles and
+    texts are kept as ids and only decoded when first accessed, with one
+    batched query per column; ranking a batch and keeping its best rows with
+    `take_ids` therefore never decodes the text of the others.
+
+    Iterating a batch, or indexing it, yields `Entry` namedtuples.
+    """
+
+    def __init__(
+        self,
+        ids: np.ndarray,
+        timestamps: np.ndarray,
+        app_ids: np.ndarray,
+        language_ids: np.ndarray,
+        title_ids: np.ndarray,
+        line_offsets: np.ndarray,
+        line_ids: np.ndarray,
+        sources: np.ndarray,
+        pools: List[ConnectionPool],
+        embeddings: Optional[np.ndarray] = None,
+    ) -> None:
+        """
+        Args:
+            ids: The entry ids (int64).
+            timestamps: The entry timestamps (int64).
+            app_ids: The `apps` ids, -1 for none.
+            language_ids: The `languages` ids, -1 for none.
+            title_ids: The `titles` ids, -1 for none.
+            line_offsets: n + 1 offsets of each entry's text lines in `line_ids`.
+            line_ids: The concatenated text line ids of all entries (uint32).
+            sources: The index in `pools` of the database holding each entry.
+            pools: The databases the entries were read from.
+            embeddings: The (n, dim) float32 embedding matrix, if read. While
+                a re-embedding leaves rows of several dimensions, it is an
+                object array of one vector per row instead.
+        """
+        self.ids = ids
+        self.timestamps = timestamps
+        self.app_ids = app_ids
+        self.language_ids = language_ids
+        self.title_ids = title_ids
+        self.line_offsets = line_offsets
+        self.line_ids = line_ids
+        self.sources = sources
+        self.pools = pools
+        self.embeddings = embeddings
+        self._decoded: Dict[str, List[Optional[str]]] = {}
+
+    @classmethod
+    def empty(cls) -> "EntryBatch":
+        """Returns a batch without rows."""
+        none = np.empty(0, dtype=np.int64)
+        return cls(none, none, none, none, none, np.zeros(1, dtype=np.int64),
+                   np.empty(0, dtype=text_store.LINE_ID_DTYPE), none, [])
+
+    @classmethod
+    def concat(cls, batches: List["EntryBatch"]) -> "EntryBatch":
+        """Joins batches read from different databases, in order."""
+        batches = [batch for batch in batches if len(batch)]
+        if not batches:
+            return cls.empty()
+        if len(batches) == 1:
+            return batches[0]
+        pools: List[ConnectionPool] = []
+        sources, offsets, base = [], [np.zeros(1, dtype=np.int64)], 0
+        for batch in batches:
+            sources.append(batch.sources + len(pools))
+            pools.extend(batch.pools)
+            offsets.append(batch.line_offsets[1:] + base)
+            base += int(batch.line_offsets[-1])
+        embeddings = None
+        if all(batch.embeddings is not None for batch in batches):
+            parts = [batch.embeddings for batch in batches]
+            if len({part.dtype for part in parts}) == 1 and len({part.shape[1:] for part in parts}) == 1:
+                embeddings = np.concatenate(parts)
+            else:
+                embeddings = np.empty(sum(len(part) for part in parts), dtype=object)
+                embeddings[:] = [row for part in parts for row in part]
+        return cls(
+            np.concatenate([batch.ids for batch in batches]),
+            np.concatenate([batch.timestamps for batch in batches]),
+            np.concatenate([batch.app_ids for batch in batches]),
+            np.concatenate([batch.language_ids for batch in batches]),
+            np.concatenate([batch.title_ids for batch in batches]),
+            np.concatenate(offsets),
+            np.concatenate([batch.line_ids for batch in batches]),
+            np.concatenate(sources),
+            pools,
+            embeddings,
+        )
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def take(self, positions: np.ndarray) -> "EntryBatch":
+        """Returns the rows at `positions`, in that order; decoded columns are kept."""
+        positions = np.asarray(positions, dtype=np.int64)
+        starts = self.line_offsets[positions]
+        lengths = self.line_offsets[positions + 1] - starts
+        offsets = np.zeros(len(positions) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        # Index of every kept line: its row's start plus its rank within the row
+        flat = np.repeat(starts - offsets[:-1], lengths) + np.arange(offsets[-1])
+        batch = EntryBatch(
+            self.ids[positions],
+            self.timestamps[positions],
+            self.app_ids[positions],
+            self.language_ids[positions],
+            self.title_ids[positions],
+            offsets,
+            self.line_ids[flat],
+            self.sources[positions],
+            self.pools,
+            self.embeddings[positions] if self.embeddings is not None else None,
+        )
+        batch._decoded = {
+            column: [values[i] for i in positions.tolist()] for column, values in self._decoded.items()
+        }
+        return batch
+
+    def take_ids(self, entry_ids: np.ndarray) -> "EntryBatch":
+        """Returns the rows with the given ids, in that order; unknown ids are skipped."""
+        entry_ids = np.asarray(entry_ids, dtype=np.int64)
+        if len(self) == 0:
+            return self
+        order = np.argsort(self.ids, kind="stable")
+        sorted_ids = self.ids[order]
+        found = np.minimum(np.searchsorted(sorted_ids, entry_ids), len(order) - 1)
+        keep = sorted_ids[found] == entry_ids
+        return self.take(order[found[keep]])
+
+    def sort(self, ascending: bool = False, limit: Optional[int] = None) -> "EntryBatch":
+        """Returns the rows ordered by timestamp, at most `limit` of them."""
+        order = np.argsort(self.timestamps, kind="stable")
+        if not ascending:
+            order = order[::-1]
+        return self.take(order[:limit])
+
+    @property
+    def apps(self) -> List[Optional[str]]:
+        """The app names, decoded on first access."""
+        return self._names("apps", self.app_ids)
+
+    @property
+    def languages(self) -> List[Optional[str]]:
+        """The languages, decoded on first access."""
+        return self._names("languages", self.language_ids)
+
+    @property
+    def titles(self) -> List[Optional[str]]:
+        """The window titles, decoded on first access."""
+        return self._names("titles", self.title_ids, column="title")
+
+    @property
+    def texts(self) -> List[str]:
+        """The OCR texts, rebuilt from the line store on first access."""
+        if "texts" not in self._decoded:
+            texts: List[str] = [""] * len(self)
+            for source, pool in enumerate(self.pools):
+                positions = np.flatnonzero(self.sources == source).tolist()
+                if not positions:
+                    continue
+                wanted = np.concatenate(
+                    [self.line_ids[self.line_offsets[i] : self.line_offsets[i + 1]] for i in positions]
+                )
+                with pool.reader() as conn:
+                    lines = text_store.load_lines(conn.cursor(), np.unique(wanted).tolist())
+                for i in positions:
+                    row = self.line_ids[self.line_offsets[i] : self.line_offsets[i + 1]].tolist()
+                    texts[i] = "\n".join(lines.get(line_id, "") for line_id in row)
+            self._decoded["texts"] = texts
+        return self._decoded["texts"]
+
+    def _names(self, table: str, ids: np.ndarray, column: str = "name") -> List[Optional[str]]:
+        """Decodes a column of ids through a table of the hot database, which keeps every row."""
+        if table not in self._decoded:
+            unique = np.unique(ids[ids >= 0]).tolist()
+            names: Dict[int, str] = {}
+            with _connections().reader() as conn:
+                for start in range(0, len(unique), BATCH_SIZE):
+                    chunk = unique[start : start + BATCH_SIZE]
+                    placeholders = ",".join("?" * len(chunk))
+                    names.update(
+                        conn.execute(
+                            f"SELECT id, {column} FROM {table} WHERE id IN ({placeholders})", chunk
+                        ).fetchall()
+                    )
+            self._decoded[table] = [names.get(value) for value in ids.tolist()]
+        return self._decoded[table]
+
+    def __getitem__(self, i: int) -> Entry:
+        return Entry(
+            id=int(self.ids[i]),
+            app=self.apps[i],
+            title=self.titles[i],
+            text=self.texts[i],
+            timestamp=int(self.timestamps[i]),
+            embedding=self.embeddings[i] if self.embeddings is not None else None,
+            language=self.languages[i],
+        )
+
+    def __iter__(self) -> Iterator[Entry]:
+        return (self[i] for i in range(len(self)))
+
+
+def get_entry_batch(
+    app: Optional[str] = None,
+    language: Optional[str] = None,
+    start_time: Optional[int] = None,
+    end_time: Optional[int] = None,
+    limit: Optional[int] = None,
+    ascending: bool = False,
+    include_embedding: bool = False,
+    entry_ids: Optional[np.ndarray] = None,
+    after_id: Optional[int] = None,
+) -> EntryBatch:
+    """
+    Reads the entries matching optional filters as a columnar `EntryBatch`.
+
+    The filters are those of `query_entries`. Only ids are read for the
+    apps, languages, titles and texts, which the batch decodes on demand.
+
+    Args:
+        app (Optional[str]): Only entries recorded in this app.
+        language (Optional[str]): Only entries in this language.
+        start_time (Optional[int]): Only entries at or after this timestamp.
+        end_time (Optional[int]): Only entries at or before this timestamp.
+        limit (Optional[int]): The maximum number of entries.
+        ascending (bool): Whether to return the oldest entries first.
+        include_embedding (bool): Whether to read the embedding matrix.
+        entry_ids (Optional[np.ndarray]): If given, only these entries are
+                                          read, e.g. to post-filter ranked ids.
+        after_id (Optional[int]): Only entries with a greater id, i.e.
+                                  inserted later.
+
+    Returns:
+        EntryBatch: The entries, ordered by timestamp.
+    """
+    columns = "id, timestamp, app_id, language_id, title_id, text_line_ids"
+    if include_embedding:
+        columns += ", embedding"
+    order = f" ORDER BY timestamp {'ASC' if ascending else 'DESC'}"
+    id_chunks: List[Optional[List[int]]] = [None]
+    min_id = None
+    if entry_ids is not None:
+        wanted = np.unique(np.asarray(entry_ids, dtype=np.int64)).tolist()
+        id_chunks = [wanted[start : start + BATCH_SIZE] for start in range(0, len(wanted), BATCH_SIZE)]
+        min_id = wanted[0] if wanted else None
+    if after_id is not None:
+        min_id = max(min_id or 0, after_id + 1)
+    batches: List[EntryBatch] = []
+    try:
+        sources = _sources(
+            app=app, language=language, start_time=start_time, end_time=end_time, min_id=min_id
+        )
+        for pool, _ in sources:
+            with pool.reader() as conn:
+                where = _filter_clause(conn, app, language, start_time, end_time)
+                if where is None:
+                    continue
+                if after_id is not None:
+                    where = (where[0] + (" AND " if where[0] else " WHERE ") + "id > ?", where[1] + [after_id])
+                rows = []
+                for chunk in id_chunks:
+                    sql, params = f"SELECT {columns} FROM entries{where[0]}", where[1]
+                    if chunk is not None:
+                        sql += (" AND " if where[0] else " WHERE ") + f"id IN ({','.join('?' * len(chunk))})"
+                        params = params + chunk
+                    sql += order
+                    if limit is not None:
+                        sql += " LIMIT ?"
+                        params = params + [limit]
+                    rows.extend(conn.execute(sql, params).fetchall())
+            batches.append(_rows_to_batch(rows, pool, include_embedding))
+    except sqlite3.Error as e:
+        print(f"Database error while reading entries: {e}")
+    return EntryBatch.concat(batches).sort(ascending, limit)
+
+
+def _rows_to_batch(
+    rows: List[Tuple[Any, ...]], pool: ConnectionPool, include_embedding: bool
+) -> EntryBatch:
+    """Builds a batch from rows selected by `get_entry_batch` in one database."""
+    if not rows:
+        return EntryBatch.empty()
+    columns = list(zip(*rows))
+
+    def ids(values: Tuple[Optional[int], ...]) -> np.ndarray:
+        return np.array([-1 if value is None else value for value in values], dtype=np.int64)
+
+    line_arrays = [text_store.unpack_line_ids(blob) for blob in columns[5]]
+    offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+    np.cumsum([len(array) for array in line_arrays], out=offsets[1:])
+    embeddings = None
+    if include_embedding:
+        blobs = columns[6]
+        if len({len(blob) for blob in blobs}) == 1:
+            embeddings = np.frombuffer(b"".join(blobs), dtype=np.float32).reshape(len(rows), -1)
+        else:
+            embeddings = np.empty(len(rows), dtype=object)
+            embeddings[:] = [np.frombuffer(blob, dtype=np.float32) for blob in blobs]
+    return EntryBatch(
+        np.array(columns[0], dtype=np.int64),
+        np.array(columns[1], dtype=np.int64),
+        ids(columns[2]),
+        ids(columns[3]),
+        ids(columns[4]),
+        offsets,
+        np.concatenate(line_arrays) if line_arrays else np.empty(0, dtype=text_store.LINE_ID_DTYPE),
+        np.zeros(len(rows), dtype=np.int64),
+        [pool],
+        embeddings,
+    )
+
+
+def get_timestamp_bounds() -> Optional[Tuple[int, int]]:
+    """
+    Returns the first and last recorded timestamps, or None without entries.
+
+    Sealed shards are answered from their summaries and the hot database
+    from the ends of the timestamp index, so this is cheap at any size.
+    """
+    bounds: List[int] = []
+    for shard in _shard_set().shards():
+        if shard.entry_count:
+            bounds += [shard.first_timestamp, shard.last_timestamp]
+    try:
+        with _connections().reader() as conn:
+            first, last = conn.execute("SELECT MIN(timestamp), MAX(timestamp) FROM entries").fetchone()
+    except sqlite3.Error as e:
+        print(f"Database error while fetching the timestamp range: {e}")
+        first = last = None
+    if first is not None:
+        bounds += [first, last]
+    return (min(bounds), max(bounds)) if bounds else None
+
+
+def get_timeline_buckets(
+    zoom: str,
+    start_time: Optional[int] = None,
+    end_time: Optional[int] = None,
+    utc_offset: int = 0,
+) -> List[Tuple[int, int]]:
+    """
+    Counts the entries per time bucket, for drawing a timeline.
+
+    Day and hour buckets are summed from the hourly rollups, so their cost
+    depends on the number of active hours rather than of entries; minute
+    buckets (and buckets in time zones that are not whole hours from UTC)
+    are counted from the timestamp index over the requested range.
+
+    Args:
+        zoom (str): "day", "hour" or "minute"; see TIMELINE_ZOOMS.
+        start_time (Optional[int]): Only entries at or after this timestamp.
+        end_time (Optional[int]): Only entries at or before this timestamp.
+        utc_offset (int): The local time zone's offset from UTC in seconds,
+                          so that day buckets start at local midnight.
+
+    Returns:
+        List[Tuple[int, int]]: (bucket start timestamp, entry count) pairs in
+                               ascending order, for non-empty buckets only.
+    """
+    size = TIMELINE_ZOOMS[zoom]
+    counts: Counter = Counter()
+    try:
+        if size >= SECONDS_PER_HOUR and utc_offset % SECONDS_PER_HOUR == 0:
+            # Hours partially inside the range are counted whole
+            conditions, params = [], []
+            if start_time is not None:
+                conditions.append("hour >= ?")
+                params.append(start_time // SECONDS_PER_HOUR)
+            if end_time is not None:
+                conditions.append("hour <= ?")
+                params.append(end_time // SECONDS_PER_HOUR)
+            sql = "SELECT hour, SUM(count) FROM app_hourly"
+            if conditions:
+                sql += " WHERE " + " AND ".join(conditions)
+            with _connections().reader() as conn:
+                for hour, count in conn.execute(sql + " GROUP BY hour", params):
+                    local = hour * SECONDS_PER_HOUR + utc_offset
+                    counts[local // size * size - utc_offset] += count
+        else:
+            for pool, _ in _sources(start_time=start_time, end_time=end_time):
+                with pool.reader() as conn:
+                    where = _filter_clause(conn, None, None, start_time, end_time)
+                    rows = conn.execute(
+                        f"SELECT (timestamp + ?) / ? * ? - ?, COUNT(*) FROM entries{where[0]} GROUP BY 1",
+                        [utc_offset, size, size, utc_offset] + where[1],
+                    ).fetchall()
+                counts.update(dict(rows))
+    except sqlite3.Error as e:
+        print(f"Database error while counting timeline buckets: {e}")
+        return []
+    return sorted(counts.items())
+
+
+def get_frames(
+    start_time: Optional[int] = None,
+    end_time: Optional[int] = None,
+    limit: Optional[int] = None,
+    ascending: bool = True,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Returns the ids and timestamps of the entries in a time window.
+
+    Only the timestamp index is read, which holds both columns.
+
+    Args:
+        start_time (Optional[int]): Only entries at or after this timestamp.
+        end_time (Optional[int]): Only entries at or before this timestamp.
+        limit (Optional[int]): The maximum number of entries.
+        ascending (bool): Whether to return the oldest entries first; with a
+                          limit, this also picks which end of the window is
+                          returned.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The int64 ids and timestamps.
+    """
+    sources = _sources(start_time=start_time, end_time=end_time)
+    if not ascending:
+        sources.reverse()
+    rows: List[Tuple[int, int]] = []
+    try:
+        for pool, shard in sources:
+            if limit is not None and len(rows) >= limit and shard is not None:
+                # Shards do not overlap in time: stop once the next one is
+                # entirely past the last row kept
+                last = rows[limit - 1][1]
+                if (shard.first_timestamp > last) if ascending else (shard.last_timestamp < last):
+                    break
+            with pool.reader() as conn:
+                where = _filter_clause(conn, None, None, start_time, end_time)
+                sql = f"SELECT id, timestamp FROM entries{where[0]} ORDER BY timestamp {'ASC' if ascending else 'DESC'}"
+                params = where[1]
+                if limit is not None:
+                    sql += " LIMIT ?"
+                    params = params + [limit]
+                rows.extend(conn.execute(sql, params).fetchall())
+            rows.sort(key=lambda row: row[1], reverse=not ascending)
+            if limit is not None:
+                del rows[limit:]
+    except sqlite3.Error as e:
+        print(f"Database error while fetching frames: {e}")
+    ids = np.array([row[0] for row in rows], dtype=np.int64)
+    timestamps = np.array([row[1] for row in rows], dtype=np.int64)
+    return ids, timestamps
+
+
+def seek_timestamp(timestamp: int, direction: str = "nearest") -> Optional[Tuple[int, int]]:
+    """
+    Finds the entry closest to a point in time with the timestamp index.
+
+    Args:
+        timestamp (int): The time to seek to.
+        direction (str): "before" (the last entry at or before `timestamp`),
+                         "after" (the first at or after it) or "nearest".
+
+    Returns:
+        Optional[Tuple[int, int]]: The entry's id and timestamp, or None if
+                                   there is no such entry.
+    """
+    candidates = []
+    if direction in ("before", "nearest"):
+        ids, timestamps = get_frames(end_time=timestamp, limit=1, ascending=False)
+        candidates += list(zip(ids.tolist(), timestamps.tolist()))
+    if direction in ("after", "nearest"):
+        ids, timestamps = get_frames(start_time=timestamp, limit=1)
+        candidates += list(zip(ids.tolist(), timestamps.tolist()))
+    if not candidates:
+        return None
+    return min(candidates, key=lambda candidate: abs(candidate[1] - timestamp))
+
+
+def insert_entry(
+    text: str,
+    timestamp: int,
+    embedding: np.ndarray,
+    app: str,
+    title: str,
+    language: str,
+    line_hashes: Optional[List[str]] = None,
+    model: Optional[str] = None,
+) -> Optional[int]:
+    """
+    Inserts a new entry into the database.
+
+    Args:
+        text (str): The extracted text content.
+        timestamp (int): The Unix timestamp of the screenshot.
+        embedding (np.ndarray): The embedding vector for the text.
+        app (str): The name of the active application.
+        title (str): The title of the active window.
+        language (str): The detected language of the text.
+        line_hashes (Optional[List[str]]): Hashes of the entry's lines in the
+                                           line_embeddings table. Lines that are
+                                           not stored there are skipped.
+        model (Optional[str]): The name of the model that produced `embedding`.
+
+    Returns:
+        Optional[int]: The ID of the newly inserted row, or None if insertion fails.
+                       Prints an error message to stderr on failure.
+    """
+    return insert_entries(
+        [NewEntry(text, timestamp, embedding, app, title, language, line_hashes, model)]
+    )[0]
+
+
+def insert_entries(batch: List[NewEntry]) -> List[Optional[int]]:
+    """
+    Inserts several entries in a single transaction.
+
+    Rows are written with one `executemany` and one commit, so a batch costs a
+    single fsync. Entries whose timestamp already exists (in the database or
+    earlier in the batch) are skipped. The new entries are matched against
+    the standing queries in the same transaction, and the matches passed to
+    the registry's listeners once committed.
+
+    Args:
+        batch (List[NewEntry]): The entries to insert.
+
+    Returns:
+        List[Optional[int]]: The new row id of each entry, in order, or None
+                             for skipped entries and when the transaction fails.
+    """
+    if not batch:
+        return []
+    timestamps = [entry.timestamp for entry in batch]
+    ids: List[Optional[int]] = [None] * len(batch)
+    try:
+        with _connections().writer() as conn:
+            cursor = conn.cursor()
+            existing = set()
+            for start in range(0, len(timestamps), BATCH_SIZE):
+                chunk = timestamps[start : start + BATCH_SIZE]
+                placeholders = ",".join("?" * len(chunk))
+                cursor.execute(
+                    f"SELECT timestamp FROM entries WHERE timestamp IN ({placeholders})",
+                    chunk,
+                )
+                existing.update(row[0] for row in cursor.fetchall())
+
+            title_ids: Dict[Tuple[str, str], int] = {}
+            dimension_ids: Dict[Tuple[str, Optional[str]], Optional[int]] = {}
+            text_blobs = text_store.store_texts(cursor, [entry.text for entry in batch])
+            rows = []
+            for entry in batch:
+                key = (entry.app, entry.title)
+                if key not in title_ids:
+                    title_ids[key] = _get_or_create_title_id(cursor, *key)
+                for table, name in (("apps", entry.app), ("languages", entry.language)):
+                    if (table, name) not in dimension_ids:
+                        dimension_ids[(table, name)] = _get_or_create_dimension_id(cursor, table, name)
+                rows.append(
+                    (
+                        text_blobs[len(rows)],
+                        entry.timestamp,
+                        entry.embedding.astype(np.float32).tobytes(),  # Ensure consistent dtype
+                        dimension_ids[("apps", entry.app)],
+                        dimension_ids[("languages", entry.language)],
+                        entry.model,
+                        title_ids[key],
+                    )
+                )
+            cursor.executemany(
+                """INSERT INTO entries (text_line_ids, timestamp, embedding, app_id, language_id, model, title_id)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)
+                   ON CONFLICT(timestamp) DO NOTHING""",  # Avoid duplicates based on timestamp
+                rows,
+            )
+
+            # Timestamps are unique, so they identify the rows just inserted
+            inserted = {}
+            new_timestamps = [ts for ts in dict.fromkeys(timestamps) if ts not in existing]
+            for start in range(0, len(new_timestamps), BATCH_SIZE):
+                chunk = new_timestamps[start : start + BATCH_SIZE]
+                placeholders = ",".join("?" * len(chunk))
+                cursor.execute(
+                    f"SELECT timestamp, id FROM entries WHERE timestamp IN ({placeholders})",
+                    chunk,
+                )
+                inserted.update(cursor.fetchall())
+            for i, entry in enumerate(batch):
+                # Only the first entry with a given timestamp was inserted
+                entry_id = inserted.pop(entry.timestamp, None)
+                ids[i] = entry_id
+                if entry_id is not None and entry.line_hashes:
+                    _insert_entry_lines(cursor, entry_id, entry.line_hashes)
+            text_store.add_references(
+                cursor, (row[0] for entry_id, row in zip(ids, rows) if entry_id is not None)
+            )
+            line_size = text_store.LINE_ID_DTYPE.itemsize
+            session_rows = sorted(
+                (
+                    (entry_id, row[1], row[3], row[6], len(row[0]) // line_size)
+                    for entry_id, row in zip(ids, rows)
+                    if entry_id is not None
+                ),
+                key=lambda row: row[1],
+            )
+            _extend_sessions(cursor, session_rows, _last_session(cursor))
+            if not standing_queries.is_loaded:
+                standing_queries.load(_read_standing_queries(cursor))
+            new = [(entry_id, entry) for entry_id, entry in zip(ids, batch) if entry_id is not None]
+            matches = standing_queries.match(
+                [entry_id for entry_id, _ in new],
+                [entry.timestamp for _, entry in new],
+                [entry.embedding for _, entry in new],
+                [entry.model for _, entry in new],
+                [entry.app for _, entry in new],
+                [entry.text for _, entry in new],
+            )
+            cursor.executemany(
+                "INSERT OR IGNORE INTO query_matches (query_id, entry_id, timestamp, score) VALUES (?, ?, ?, ?)",
+                matches,
+            )
+            if _has_fts(cursor):
+                cursor.executemany(
+                    "INSERT INTO entries_fts (rowid, text, title) VALUES (?, ?, ?)",
+                    [
+                        (entry_id, entry.text, entry.title)
+                        for entry_id, entry in zip(ids, batch)
+                        if entry_id is not None
+                    ],
+                )
+            _update_rollups(
+                cursor,
+                [
+                    (entry.timestamp, entry.app, entry.text)
+                    for entry_id, entry in zip(ids, batch)
+                    if entry_id is not None
+                ],
+            )
+
+    except sqlite3.Error as e:
+        # More specific error handling can be added (e.g., IntegrityError for UNIQUE constraint)
+        print(f"Database error during insertion: {e}")
+        return [None] * len(batch)
+
+    _invalidate_facets()
+    inserted_ids = [entry_id for entry_id in ids if entry_id is not None]
+    if inserted_ids:
+        _bump_ingest_version(last_id=max(inserted_ids))
+    for entry_id, entry in zip(ids, batch):
+        if entry_id is not None:
+            embedding_store.append(entry_id, entry.embedding, entry.model)
+            ann_index.add(np.array([entry_id]), entry.embedding.reshape(1, -1))
+    standing_queries.notify(matches)
+    return ids
+
+
+def _insert_entry_lines(
+    cursor: sqlite3.Cursor, entry_id: int, line_hashes: List[str]
+) -> None:
+    """Records which stored line embeddings make up an entry."""
+    line_ids = _entry_line_ids(cursor, line_hashes)
+    if line_ids is not None:
+        cursor.execute(
+            "INSERT OR REPLACE INTO entry_lines (entry_id, line_ids) VALUES (?, ?)",
+            (entry_id, line_ids),
+        )
+
+
+def _entry_line_ids(cursor: sqlite3.Cursor, line_hashes: List[str]) -> Optional[bytes]:
+    """Returns the sorted line_embeddings rowids of the given lines, packed, or None."""
+    line_ids: List[int] = []
+    unique_hashes = list(dict.fromkeys(line_hashes))
+    for start in range(0, len(unique_hashes), BATCH_SIZE):
+        chunk = unique_hashes[start : start + BATCH_SIZE]
+        placeholders = ",".join("?" * len(chunk))
+        cursor.execute(
+            f"SELECT rowid FROM line_embeddings WHERE hash IN ({placeholders})", chunk
+        )
+        line_ids.extend(row[0] for row in cursor.fetchall())
+    if not line_ids:
+        return None
+    return np.array(sorted(line_ids), dtype=np.int64).tobytes()
+
+
+def _delete_rows(cursor: sqlite3.Cursor, entry_ids: List[int]) -> int:
+    """
+    Deletes entries and their keyword index and line rows.
+
+    The keyword index stores no text of its own, so each entry is removed
+    with the text and title it was indexed with. Stored lines that no
+    remaining entry uses are deleted too.
+    """
+    deleted = 0
+    released: Set[int] = set()
+    has_fts = _has_fts(cursor)
+    for start in range(0, len(entry_ids), BATCH_SIZE):
+        chunk = list(entry_ids[start : start + BATCH_SIZE])
+        placeholders = ",".join("?" * len(chunk))
+        rows = cursor.execute(
+            f"SELECT entries.id, titles.title, entries.text, entries.text_line_ids FROM {ENTRY_SOURCE} WHERE entries.id IN ({placeholders})",
+            chunk,
+        ).fetchall()
+        if has_fts:
+            texts = _resolve_texts(cursor, [(row[2], row[3]) for row in rows])
+            cursor.executemany(
+                "INSERT INTO entries_fts (entries_fts, rowid, text, title) VALUES ('delete', ?, ?, ?)",
+                [(row[0], text, row[1]) for row, text in zip(rows, texts)],
+            )
+        released |= text_store.add_references(cursor, (row[3] for row in rows), -1)
+        cursor.execute(f"DELETE FROM entry_lines WHERE entry_id IN ({placeholders})", chunk)
+        cursor.execute(f"DELETE FROM entries WHERE id IN ({placeholders})", chunk)
+        deleted += cursor.rowcount
+    text_store.delete_unreferenced(cursor, released)
+    return deleted
+
+
+def seal_shards(months: int, now: Optional[int] = None) -> List[str]:
+    """
+    Moves the entries of past partitions into sealed, read-only shards.
+
+    The current partition of `months` calendar months stays in the hot
+    database, which takes all writes. Each older partition is copied into a
+    shard file of its own, which is compacted, given a summary (time and id
+    range, apps and languages, see `shards.Shard`) and made read-only; its
+    entries are then deleted from the hot database. Reads fan out over the
+    shards whose summary may match, so the cost of maintaining the hot
+    database no longer grows with the whole history.
+
+    Entry ids are kept, and the rollups, sessions, standing query matches,
+    titles and line embeddings stay in the hot database, so the digest, the
+    embedding store and the search indexes are unaffected. After a model
+    change, sealed entries are re-embedded into a staging table, which
+    `apply_shard_embeddings` writes back into their shards. Sealing waits
+    for `shard_lock`, which the re-embedding job holds while it runs.
+
+    Args:
+        months (int): The length of a partition. 0 disables sealing.
+        now (Optional[int]): The current timestamp; defaults to the clock.
+
+    Returns:
+        List[str]: The paths of the shards written.
+    """
+    if months <= 0:
+        return []
+    with shard_lock:
+        return _seal_past_partitions(months, now)
+
+
+def _seal_past_partitions(months: int, now: Optional[int]) -> List[str]:
+    """Seals every partition before the current one; see `seal_shards`."""
+    cutoff = period_bounds(int(time.time()) if now is None else now, months)[0]
+    written: List[str] = []
+    while True:
+        try:
+            with _connections().reader() as conn:
+                oldest = conn.execute(
+                    "SELECT MIN(timestamp) FROM entries WHERE timestamp < ?", (cutoff,)
+                ).fetchone()[0]
+        except sqlite3.Error as e:
+            print(f"Database error while looking for entries to seal: {e}")
+            break
+        if oldest is None:
+            break
+        path = _seal_partition(*period_bounds(oldest, months))
+        if path is None:
+            break
+        written.append(path)
+    return written
+
+
+def _seal_partition(start: int, end: int) -> Optional[str]:
+    """Writes the shard of the partition [start, end) and empties it in the hot database."""
+    shard_set = _shard_set()
+    path = shard_set.path_for(start)
+    tmp_path = path + ".tmp"
+    try:
+        os.makedirs(shard_set.path, exist_ok=True)
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        if os.path.exists(path):
+            # Entries recorded late for a sealed partition: reseal it with them
+            shutil.copyfile(path, tmp_path)
+        conn = sqlite3.connect(tmp_path)
+        try:
+            cursor = conn.cursor()
+            _create_schema(cursor)
+            conn.commit()
+            cursor.execute("ATTACH DATABASE ? AS hot", (db_path,))
+            _copy_partition(cursor, start, end)
+            conn.commit()
+            cursor.execute("DETACH DATABASE hot")
+            write_meta(cursor, _summarize_shard(cursor, start, end))
+            moved = [
+                row[0]
+                for row in cursor.execute(
+                    "SELECT id FROM entries WHERE timestamp >= ? AND timestamp < ?", (start, end)
+                )
+            ]
+            conn.commit()
+            cursor.execute("VACUUM")
+        finally:
+            conn.close()
+        os.chmod(tmp_path, 0o444)
+        if os.path.exists(path):
+            os.chmod(path, 0o644)  # Replacing a read-only file fails on Windows
+        _drop_pool(path)
+        os.replace(tmp_path, path)
+    except (sqlite3.Error, OSError) as e:
+        print(f"Database error while sealing {path}: {e}")
+        return None
+
+    try:
+        with _connections().writer() as conn:
+            cursor = conn.cursor()
+            _delete_rows(cursor, moved)
+    except sqlite3.Error as e:
+        print(f"Database error while removing sealed entries: {e}")
+        return None
+    _invalidate_facets()
+    return path
+
+
+def _copy_partition(cursor: sqlite3.Cursor, start: int, end: int) -> None:
+    """Copies a partition's entries, and the rows they reference, from the attached hot database."""
+
+    def copy(table: str, condition: str, params: Tuple[Any, ...] = ()) -> None:
+        shard_columns = [row[1] for row in cursor.execute(f"PRAGMA main.table_info({table})")]
+        hot_columns = {row[1] for row in cursor.execute(f"PRAGMA hot.table_info({table})")}
+        columns = ", ".join(column for column in shard_columns if column in hot_columns)
+        cursor.execute(
+            f"INSERT OR IGNORE INTO main.{table} ({columns}) SELECT {columns} FROM hot.{table} WHERE {condition}",
+            params,
+        )
+
+    copy("entries", "timestamp >= ? AND timestamp < ?", (start, end))
+    for column, table in DIMENSION_TABLES.items():
+        copy(table, f"id IN (SELECT {column}_id FROM main.entries)")
+        cursor.execute(
+            f"UPDATE main.{table} SET entry_count = (SELECT COUNT(*) FROM main.entries WHERE {column}_id = {table}.id)"
+        )
+    copy("titles", "id IN (SELECT title_id FROM main.entries)")
+    copy("entry_lines", "entry_id IN (SELECT id FROM main.entries)")
+    blobs = cursor.execute(
+        "SELECT text_line_ids FROM main.entries WHERE text_line_ids IS NOT NULL"
+    ).fetchall()
+    line_ids = sorted(text_store.referenced_line_ids(row[0] for row in blobs))
+    for offset in range(0, len(line_ids), BATCH_SIZE):
+        chunk = line_ids[offset : offset + BATCH_SIZE]
+        copy("text_lines", f"id IN ({','.join('?' * len(chunk))})", tuple(chunk))
+    # Count only the references of the shard's own entries
+    cursor.execute("UPDATE main.text_lines SET ref_count = 0")
+    text_store.add_references(cursor, (row[0] for row in blobs))
+    if _has_fts(cursor):
+        cursor.execute("INSERT INTO entries_fts (entries_fts) VALUES ('delete-all')")
+        _index_entries(cursor)
+
+
+def _summarize_shard(cursor: sqlite3.Cursor, start: int, end: int) -> Dict[str, Any]:
+    """Builds the summary stored in a shard and read by `shards.Shard`."""
+    first_timestamp, last_timestamp, first_id, last_id, count = cursor.execute(
+        "SELECT MIN(timestamp), MAX(timestamp), MIN(id), MAX(id), COUNT(*) FROM entries"
+    ).fetchone()
+    meta: Dict[str, Any] = {
+        "start": start,
+        "end": end,
+        "first_timestamp": first_timestamp,
+        "last_timestamp": last_timestamp,
+        "first_id": first_id,
+        "last_id": last_id,
+        "entry_count": count,
+    }
+    for table in DIMENSION_TABLES.values():
+        meta[table] = dict(
+            cursor.execute(f"SELECT name, entry_count FROM {table} WHERE entry_count > 0").fetchall()
+        )
+    return meta
+
+
+def query_entries(
+    app: Optional[str] = None,
+    language: Optional[str] = None,
+    start_time: Optional[int] = None,
+    end_time: Optional[int] = None,
+    limit: Optional[int] = None,
+    columns: Optional[List[str]] = None,
+    ascending: bool = False,
+) -> List[Dict[str, Any]]:
+    """
+    Retrieves entries matching optional filters, as indexed SQL.
+
+    App and language names are resolved to their dimension ids first, so the
+    filters use the (app_id, timestamp) and (language_id, timestamp) indexes
+    and only the matching rows are read.
+
+    Args:
+        app (Optional[str]): Only entries recorded in this app.
+        language (Optional[str]): Only entries in this language.
+        start_time (Optional[int]): Only entries at or after this timestamp.
+        end_time (Optional[int]): Only entries at or before this timestamp.
+        limit (Optional[int]): The maximum number of entries.
+        columns (Optional[List[str]]): The columns to return, from
+                                       EXPORT_COLUMNS. Defaults to every column
+                                       except the embedding.
+        ascending (bool): Whether to return the oldest entries first.
+
+    Returns:
+        List[Dict[str, Any]]: One dict per entry, ordered by timestamp. The
+                              embedding, if selected, is raw float32 bytes.
+    """
+    if columns is None:
+        columns = [column for column in EXPORT_COLUMNS if column != "embedding"]
+    unknown = set(columns) - set(EXPORT_COLUMNS)
+    if unknown:
+        raise ValueError(f"Unknown entry columns: {sorted(unknown)}")
+
+    # The ordering column is read even if not requested, to merge shards
+    selected = list(dict.fromkeys(list(columns) + ["timestamp"]))
+    sources = _sources(app=app, language=language, start_time=start_time, end_time=end_time)
+    if not ascending:
+        sources.reverse()
+    results: List[Dict[str, Any]] = []
+    try:
+        for pool, shard in sources:
+            if limit is not None and len(results) >= limit and shard is not None:
+                # Shards do not overlap in time: stop once the next one is
+                # entirely past the last row kept
+                last = results[limit - 1]["timestamp"]
+                if (shard.first_timestamp > last) if ascending else (shard.last_timestamp < last):
+                    break
+            with pool.reader() as conn:
+                rows = _query_source(
+                    conn, selected, app, language, start_time, end_time, limit, ascending
+                )
+            results.extend(rows)
+            if limit is not None:
+                results.sort(key=lambda row: row["timestamp"], reverse=not ascending)
+                del results[limit:]
+    except sqlite3.Error as e:
+        print(f"Database error while querying entries: {e}")
+    results.sort(key=lambda row: row["timestamp"], reverse=not ascending)
+    if "timestamp" not in columns:
+        for row in results:
+            del row["timestamp"]
+    return results
+
+
+def _filter_clause(
+    conn: sqlite3.Connection,
+    app: Optional[str],
+    language: Optional[str],
+    start_time: Optional[int],
+    end_time: Optional[int],
+) -> Optional[Tuple[str, List[Any]]]:
+    """
+    Builds the WHERE clause of the entry filters for one database.
+
+    App and language names are resolved to their dimension ids first, so the
+    filters use the (app_id, timestamp) and (language_id, timestamp) indexes.
+
+    Returns:
+        Optional[Tuple[str, List[Any]]]: The clause (empty without filters)
+            and its parameters, or None if a name is unknown, i.e. nothing
+            can match.
+    """
+    conditions: List[str] = []
+    params: List[Any] = []
+    for column, name in (("app", app), ("language", language)):
+        if name is None:
+            continue
+        found = conn.execute(
+            f"SELECT id FROM {DIMENSION_TABLES[column]} WHERE name = ?", (name,)
+        ).fetchone()
+        if found is None:
+            return None
+        conditions.append(f"entries.{column}_id = ?")
+        params.append(found[0])
+    if start_time is not None:
+        conditions.append("entries.timestamp >= ?")
+        params.append(start_time)
+    if end_time is not None:
+        conditions.append("entries.timestamp <= ?")
+        params.append(end_time)
+    return (" WHERE " + " AND ".join(conditions) if conditions else ""), params
+
+
+def _query_source(
+    conn: sqlite3.Connection,
+    columns: List[str],
+    app: Optional[str],
+    language: Optional[str],
+    start_time: Optional[int],
+    end_time: Optional[int],
+    limit: Optional[int],
+    ascending: bool,
+) -> List[Dict[str, Any]]:
+    """Runs `query_entries` against one database."""
+    where = _filter_clause(conn, app, language, start_time, end_time)
+    if where is None:
+        return []
+    sql = f"SELECT {_select_list(columns)} FROM {ENTRY_SOURCE}{where[0]}"
+    params = where[1]
+    sql += f" ORDER BY entries.timestamp {'ASC' if ascending else 'DESC'}"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    cursor = conn.cursor()
+    cursor.row_factory = sqlite3.Row
+    return _rows_to_dicts(cursor, cursor.execute(sql, params).fetchall())
+
+
+def get_entries_page(
+    after_timestamp: Optional[int] = None,
+    limit: int = BATCH_SIZE,
+    columns: Optional[List[str]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Retrieves one page of entries in ascending timestamp order.
+
+    Pages are addressed by the last timestamp of the previous page (keyset
+    pagination), which uses the timestamp index and costs the same for every
+    page, unlike OFFSET.
+
+    Args:
+        after_timestamp (Optional[int]): Only entries with a greater timestamp
+                                         are returned. None starts at the oldest.
+        limit (int): The maximum number of entries.
+        columns (Optional[List[str]]): The columns to return, from
+                                       EXPORT_COLUMNS. Defaults to every column
+                                       except the embedding.
+
+    Returns:
+        List[Dict[str, Any]]: One dict per entry. The embedding, if selected,
+                              is returned as raw float32 bytes.
+    """
+    if columns is None:
+        columns = [column for column in EXPORT_COLUMNS if column != "embedding"]
+    # The cursor column is always read so that callers can request the next page
+    return query_entries(
+        start_time=after_timestamp + 1 if after_timestamp is not None else None,
+        limit=limit,
+        columns=list(dict.fromkeys(["timestamp"] + list(columns))),
+        ascending=True,
+    )
+
+
+def iter_entries(
+    after_timestamp: Optional[int] = None,
+    columns: Optional[List[str]] = None,
+    page_size: int = BATCH_SIZE,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Yields all entries after `after_timestamp`, reading one page at a time.
+
+    Only one page is held in memory, so the whole history can be streamed.
+    See `get_entries_page` for the arguments and the shape of each entry.
+    """
+    while True:
+        page = get_entries_page(after_timestamp, page_size, columns)
+        yield from page
+        if len(page) < page_size:
+            return
+        after_timestamp = page[-1]["timestamp"]
+
+
+def get_embeddings_after(
+    last_id: int, dim: int, model: Optional[str] = None
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Retrieves the float32 embeddings of all entries newer than `last_id`.
 
+    Args:
+        last_id (int): Only entries with a greater id are returned.
+        dim (int): The expected embedding dimension. Rows of another dimension
+                   (e.g. written by a different model) are skipped.
+        model (Optional[str]): If given, only rows embedded by this model
+                               are returned.
 
-def create_db() -> None:
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The entry ids in ascending order and an
+                                       (n, dim) float32 matrix.
     """
-    Creates the SQLite database and the 'entries' table if they don't exist.
+    if embedding_store.is_current(model, dim):
+        return embedding_store.after(last_id)
+    return _read_embeddings_after(last_id, dim, model)
 
-    The table schema includes columns for an auto-incrementing ID, application name,
-    window title, extracted text, timestamp, and text embedding.
+
+def _read_embeddings_after(
+    last_id: int, dim: int, model: Optional[str] = None, limit: int = -1
+) -> Tuple[np.ndarray, np.ndarray]:
+    """Reads embeddings newer than `last_id` from SQLite, at most `limit` rows."""
+    rows: List[Tuple[int, bytes]] = []
+    try:
+        for pool, _ in _sources(min_id=last_id + 1):
+            with pool.reader() as conn:
+                query = "SELECT id, embedding FROM entries WHERE id > ? AND length(embedding) = ?"
+                params: List[Any] = [last_id, dim * np.dtype(np.float32).itemsize]
+                if model is not None:
+                    query += " AND model = ?"
+                    params.append(model)
+                rows.extend(conn.execute(f"{query} ORDER BY id LIMIT ?", params + [limit]).fetchall())
+    except sqlite3.Error as e:
+        print(f"Database error while fetching new embeddings: {e}")
+    rows.sort()
+    if limit >= 0:
+        del rows[limit:]
+
+    ids = np.array([row[0] for row in rows], dtype=np.int64)
+    matrix = np.frombuffer(b"".join(row[1] for row in rows), dtype=np.float32)
+    return ids, matrix.reshape(len(rows), dim)
+
+
+def sync_embedding_store(model: str, dim: int) -> bool:
+    """
+    Checks the memory-mapped embedding store and rebuilds it if it is stale.
+
+    The store is consistent when it holds exactly the ids of the entries
+    embedded by `model`, in ascending order. Otherwise it is rewritten from
+    the database in batches.
+
+    Args:
+        model (str): The model whose embeddings the store should hold.
+        dim (int): The embedding dimension of `model`.
+
+    Returns:
+        bool: True if the store is usable afterwards.
     """
+    count, first_id, last_id = 0, None, None
     try:
-        with sqlite3.connect(db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                """CREATE TABLE IF NOT EXISTS entries (
-                       id INTEGER PRIMARY KEY AUTOINCREMENT,
-                       app TEXT,
-                       title TEXT,
-                       text TEXT,
-                       timestamp INTEGER UNIQUE,
-                       embedding BLOB,
-                       language TEXT
-                   )"""
-            )
-            # Add index on timestamp for faster lookups
-            cursor.execute(
-                "CREATE INDEX IF NOT EXISTS idx_timestamp ON entries (timestamp)"
-            )
-            conn.commit()
+        for pool, _ in _sources():
+            with pool.reader() as conn:
+                source_count, source_first, source_last = conn.execute(
+                    "SELECT COUNT(*), MIN(id), MAX(id) FROM entries WHERE model = ? AND length(embedding) = ?",
+                    (model, dim * np.dtype(np.float32).itemsize),
+                ).fetchone()
+            if source_count:
+                count += source_count
+                first_id = source_first if first_id is None else min(first_id, source_first)
+                last_id = source_last if last_id is None else max(last_id, source_last)
     except sqlite3.Error as e:
-        print(f"Database error during table creation: {e}")
+        print(f"Database error while checking the embedding store: {e}")
+        return False
+    if embedding_store.verify(model, dim, count, first_id, last_id):
+        return True
+    return rebuild_embedding_store(model, dim)
 
 
-def get_all_entries() -> List[Entry]:
+def rebuild_embedding_store(model: str, dim: int) -> bool:
     """
-    Retrieves all entries from the database.
+    Rewrites the memory-mapped embedding store from the database.
+
+    Args:
+        model (str): The model whose embeddings the store should hold.
+        dim (int): The embedding dimension of `model`.
 
     Returns:
-        List[Entry]: A list of all entries as Entry namedtuples.
-                     Returns an empty list if the table is empty or an error occurs.
+        bool: True if the store was rebuilt.
     """
-    entries: List[Entry] = []
+
+    def batches() -> Iterable[Tuple[np.ndarray, np.ndarray]]:
+        last_id = 0
+        while True:
+            ids, matrix = _read_embeddings_after(last_id, dim, model, limit=BATCH_SIZE)
+            if len(ids) == 0:
+                return
+            yield ids, matrix
+            last_id = int(ids[-1])
+
     try:
-        with sqlite3.connect(db_path) as conn:
-            conn.row_factory = sqlite3.Row  # Return rows as dictionary-like objects
-            cursor = conn.cursor()
-            cursor.execute(
-                "SELECT id, app, title, text, timestamp, embedding, language FROM entries ORDER BY timestamp DESC"
-            )
-            results = cursor.fetchall()
-            for row in results:
-                # Deserialize the embedding blob back into a NumPy array
-                embedding = np.frombuffer(
-                    row["embedding"], dtype=np.float32
-                )  # Assuming float32, adjust if needed
-                entries.append(
-                    Entry(
-                        id=row["id"],
-                        app=row["app"],
-                        title=row["title"],
-                        text=row["text"],
-                        timestamp=row["timestamp"],
-                        embedding=embedding,
-                        language=row["language"],
-                    )
+        embedding_store.rebuild(model, dim, batches())
+    except (OSError, ValueError) as e:
+        print(f"Error while rebuilding the embedding store: {e}")
+        return False
+    return True
+
+
+def get_facets(column: str) -> List[Tuple[str, int]]:
+    """
+    Returns the values of a dimension column with their entry counts.
+
+    The (small) dimension table is read once and cached in memory until the
+    next insert, so repeated calls, e.g. to fill the search filters, are free.
+    Entries in sealed shards are counted from the shards' summaries.
+
+    Args:
+        column (str): "app" or "language".
+
+    Returns:
+        List[Tuple[str, int]]: (name, number of entries) pairs ordered by
+                               name, for names used by at least one entry.
+    """
+    table = DIMENSION_TABLES[column]
+    with _facet_lock:
+        facets = _facet_cache.get(table)
+    if facets is not None:
+        return facets
+    counts: Counter = Counter()
+    for shard in _shard_set().shards():
+        counts.update(shard.apps if column == "app" else shard.languages)
+    try:
+        with _connections().reader() as conn:
+            counts.update(
+                dict(
+                    conn.execute(
+                        f"SELECT name, entry_count FROM {table} WHERE entry_count > 0"
+                    ).fetchall()
                 )
+            )
     except sqlite3.Error as e:
-        print(f"Database error while fetching all entries: {e}")
-    return entries
+        print(f"Database error while fetching {table}: {e}")
+        return []
+    facets = sorted(counts.items())
+    with _facet_lock:
+        _facet_cache[table] = facets
+    return facets
 
 
-def get_timestamps() -> List[int]:
+def get_hourly_counts() -> Tuple[np.ndarray, np.ndarray]:
     """
-    Retrieves all timestamps from the database, ordered descending.
+    Returns the number of entries recorded in each hour, from the rollups.
 
     Returns:
-        List[int]: A list of all timestamps.
-                   Returns an empty list if the table is empty or an error occurs.
+        Tuple[np.ndarray, np.ndarray]: The hours (timestamp divided by
+            SECONDS_PER_HOUR) in ascending order and their entry counts.
     """
-    timestamps: List[int] = []
+    rows: List[Tuple[int, int]] = []
     try:
-        with sqlite3.connect(db_path) as conn:
-            cursor = conn.cursor()
-            # Use the index for potentially faster retrieval
-            cursor.execute("SELECT timestamp FROM entries ORDER BY timestamp DESC")
-            results = cursor.fetchall()
-            timestamps = [result[0] for result in results]
+        with _connections().reader() as conn:
+            rows = conn.execute(
+                "SELECT hour, SUM(count) FROM app_hourly GROUP BY hour ORDER BY hour"
+            ).fetchall()
     except sqlite3.Error as e:
-        print(f"Database error while fetching timestamps: {e}")
-    return timestamps
+        print(f"Database error while fetching hourly counts: {e}")
+    hours = np.array([row[0] for row in rows], dtype=np.int64)
+    counts = np.array([row[1] for row in rows], dtype=np.int64)
+    return hours, counts
 
 
-def insert_entry(
-    text: str,
-    timestamp: int,
+def get_sessions(
+    start_time: Optional[int] = None,
+    end_time: Optional[int] = None,
+    app: Optional[str] = None,
+    limit: Optional[int] = None,
+    ascending: bool = False,
+) -> List[Session]:
+    """
+    Retrieves the activity sessions overlapping a time range.
+
+    Args:
+        start_time (Optional[int]): Only sessions ending at or after this timestamp.
+        end_time (Optional[int]): Only sessions starting at or before this timestamp.
+        app (Optional[str]): Only sessions in this app.
+        limit (Optional[int]): The maximum number of sessions.
+        ascending (bool): Whether to return the oldest sessions first.
+
+    Returns:
+        List[Session]: The sessions, ordered by start time.
+    """
+    conditions: List[str] = []
+    params: List[Any] = []
+    if start_time is not None:
+        conditions.append("sessions.end_time >= ?")
+        params.append(start_time)
+    if end_time is not None:
+        conditions.append("sessions.start_time <= ?")
+        params.append(end_time)
+    if app is not None:
+        conditions.append("apps.name = ?")
+        params.append(app)
+    sql = SESSION_QUERY
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += f" ORDER BY sessions.start_time {'ASC' if ascending else 'DESC'}"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    try:
+        with _connections().reader() as conn:
+            return [Session(*row) for row in conn.execute(sql, params).fetchall()]
+    except sqlite3.Error as e:
+        print(f"Database error while fetching sessions: {e}")
+        return []
+
+
+def get_session(session_id: int) -> Optional[Session]:
+    """Returns one activity session, or None if there is no such session."""
+    try:
+        with _connections().reader() as conn:
+            row = conn.execute(
+                f"{SESSION_QUERY} WHERE sessions.id = ?", (session_id,)
+            ).fetchone()
+    except sqlite3.Error as e:
+        print(f"Database error while fetching session {session_id}: {e}")
+        return None
+    return Session(*row) if row is not None else None
+
+
+def add_standing_query(
+    name: str,
+    query: str,
     embedding: np.ndarray,
-    app: str,
-    title: str,
-    language: str,
+    model: str,
+    threshold: float = DEFAULT_THRESHOLD,
+    keywords: Optional[str] = None,
+    app: Optional[str] = None,
+    webhook: Optional[str] = None,
 ) -> Optional[int]:
     """
-    Inserts a new entry into the database.
+    Saves a search that every new entry is matched against.
 
     Args:
-        text (str): The extracted text content.
-        timestamp (int): The Unix timestamp of the screenshot.
-        embedding (np.ndarray): The embedding vector for the text.
-        app (str): The name of the active application.
-        title (str): The title of the active window.
+        name (str): A label for the query.
+        query (str): The search text.
+        embedding (np.ndarray): The embedding of `query`.
+        model (str): The model that produced `embedding`; only entries
+                     embedded by the same model can match.
+        threshold (float): The cosine similarity an entry needs to match.
+        keywords (Optional[str]): Whitespace-separated words that must all
+                                  appear in a matching entry's text.
+        app (Optional[str]): Only entries recorded in this app match.
+        webhook (Optional[str]): A URL the matches are POSTed to as JSON.
 
     Returns:
-        Optional[int]: The ID of the newly inserted row, or None if insertion fails.
-                       Prints an error message to stderr on failure.
+        Optional[int]: The id of the new query, or None on failure.
     """
-    embedding_bytes: bytes = embedding.astype(
-        np.float32
-    ).tobytes()  # Ensure consistent dtype
-    last_row_id: Optional[int] = None
     try:
-        with sqlite3.connect(db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute(
-                """INSERT INTO entries (text, timestamp, embedding, app, title, language)
-                   VALUES (?, ?, ?, ?, ?, ?)
-                   ON CONFLICT(timestamp) DO NOTHING""",  # Avoid duplicates based on timestamp
-                (text, timestamp, embedding_bytes, app, title, language),
+        with _connections().writer() as conn:
+            cursor = conn.execute(
+                """INSERT INTO standing_queries (name, query, embedding, model, threshold, keywords, app, webhook)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?)""",
+                (
+                    name,
+                    query,
+                    np.asarray(embedding, dtype=np.float32).tobytes(),
+                    model,
+                    threshold,
+                    keywords,
+                    app,
+                    webhook,
+                ),
             )
-            conn.commit()
-            if cursor.rowcount > 0:  # Check if insert actually happened
-                last_row_id = cursor.lastrowid
-            # else:
-            # Optionally log that a duplicate timestamp was encountered
-            # print(f"Skipped inserting entry with duplicate timestamp: {timestamp}")
+            query_id = cursor.lastrowid
+    except sqlite3.Error as e:
+        print(f"Database error while saving a standing query: {e}")
+        return None
+    standing_queries.reset()
+    return query_id
+
 
+def delete_standing_query(query_id: int) -> bool:
+    """Deletes a standing query and its matches; returns whether it existed."""
+    try:
+        with _connections().writer() as conn:
+            deleted = conn.execute(
+                "DELETE FROM standing_queries WHERE id = ?", (query_id,)
+            ).rowcount
+            conn.execute("DELETE FROM query_matches WHERE query_id = ?", (query_id,))
     except sqlite3.Error as e:
-        # More specific error handling can be added (e.g., IntegrityError for UNIQUE constraint)
-        print(f"Database error during insertion: {e}")
-    return last_row_id
+        print(f"Database error while deleting standing query {query_id}: {e}")
+        return False
+    standing_queries.reset()
+    return deleted > 0
 
 
-def get_entries_by_time_range(start_time: int, end_time: int) -> List[Entry]:
-    with sqlite3.connect(db_path) as conn:
-        c = conn.cursor()
-        results = c.execute(
-            "SELECT * FROM entries WHERE timestamp BETWEEN ? AND ? ORDER BY timestamp DESC",
-            (start_time, end_time),
-        ).fetchall()
-        return [Entry(*result) for result in results]
+def get_standing_queries() -> List[StandingQuery]:
+    """Returns every standing query, oldest first."""
+    try:
+        with _connections().reader() as conn:
+            return _read_standing_queries(conn.cursor())
+    except sqlite3.Error as e:
+        print(f"Database error while fetching standing queries: {e}")
+        return []
+
+
+def get_query_matches(
+    query_id: Optional[int] = None,
+    after_timestamp: Optional[int] = None,
+    limit: Optional[int] = None,
+) -> List[QueryMatch]:
+    """
+    Retrieves the recorded matches of standing queries, newest first.
+
+    Args:
+        query_id (Optional[int]): Only the matches of this query.
+        after_timestamp (Optional[int]): Only entries recorded after this
+                                         timestamp, e.g. the last one seen.
+        limit (Optional[int]): The maximum number of matches.
+
+    Returns:
+        List[QueryMatch]: The matches, ordered by entry timestamp.
+    """
+    conditions: List[str] = []
+    params: List[Any] = []
+    if query_id is not None:
+        conditions.append("query_id = ?")
+        params.append(query_id)
+    if after_timestamp is not None:
+        conditions.append("timestamp > ?")
+        params.append(after_timestamp)
+    sql = "SELECT query_id, entry_id, timestamp, score FROM query_matches"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += " ORDER BY timestamp DESC"
+    if limit is not None:
+        sql += " LIMIT ?"
+        params.append(limit)
+    try:
+        with _connections().reader() as conn:
+            return [QueryMatch(*row) for row in conn.execute(sql, params).fetchall()]
+    except sqlite3.Error as e:
+        print(f"Database error while fetching standing query matches: {e}")
+        return []
+
+
+def get_shard_stats() -> Dict[str, Any]:
+    """Returns the number of sealed shards and of the entries they hold."""
+    return _shard_set().stats()
+
+
+def get_ingest_version() -> IngestVersion:
+    """
+    Returns counters telling whether cached search results are still valid.
+
+    `version` grows with every committed change to the entries. `epoch`
+    only grows with changes other than inserts (deletions, re-embedding),
+    after which results cannot be updated incrementally. `last_id` is the
+    highest entry id ever assigned, so that the entries inserted after a
+    given version are those with a greater id. The counters live in memory
+    and restart with the process.
+
+    Returns:
+        IngestVersion: The (epoch, version, last_id) counters.
+    """
+    global _ingest_version
+    with _ingest_lock:
+        if _ingest_version.last_id is not None:
+            return _ingest_version
+    try:
+        with _connections().reader() as conn:
+            # Entry ids come from AUTOINCREMENT, which records the highest id
+            # even after the entries moved to shards
+            row = conn.execute(
+                "SELECT seq FROM sqlite_sequence WHERE name = 'entries'"
+            ).fetchone()
+    except sqlite3.Error as e:
+        print(f"Database error while reading the last entry id: {e}")
+        row = None
+    with _ingest_lock:
+        if _ingest_version.last_id is None:
+            _ingest_version = _ingest_version._replace(last_id=row[0] if row else 0)
+        return _ingest_version
+
+
+def _bump_ingest_version(last_id: Optional[int] = None, rewrite: bool = False) -> None:
+    """Records a change to the entries: an insert up to `last_id`, or a rewrite."""
+    global _ingest_version
+    with _ingest_lock:
+        epoch, version, known_id = _ingest_version
+        if last_id is not None and known_id is not None:
+            known_id = max(known_id, last_id)
+        _ingest_version = IngestVersion(epoch + rewrite, version + 1, known_id)
+
+
+def _invalidate_facets() -> None:
+    """Drops the cached facets after entries changed."""
+    with _facet_lock:
+        _facet_cache.clear()
 
 
 def get_unique_apps() -> List[str]:
@@ -166,16 +2335,7 @@ def get_unique_apps() -> List[str]:
     Returns:
         List[str]: A list of unique application names.
     """
-    apps: List[str] = []
-    try:
-        with sqlite3.connect(db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT DISTINCT app FROM entries ORDER BY app")
-            results = cursor.fetchall()
-            apps = [result[0] for result in results]
-    except sqlite3.Error as e:
-        print(f"Database error while fetching unique apps: {e}")
-    return apps
+    return [name for name, _ in get_facets("app")]
 
 
 def get_unique_languages() -> List[str]:
@@ -185,22 +2345,16 @@ def get_unique_languages() -> List[str]:
     Returns:
         List[str]: A list of unique languages.
     """
-    languages: List[str] = []
-    try:
-        with sqlite3.connect(db_path) as conn:
-            cursor = conn.cursor()
-            cursor.execute("SELECT DISTINCT language FROM entries ORDER BY language")
-            results = cursor.fetchall()
-            languages = [result[0] for result in results]
-    except sqlite3.Error as e:
-        print(f"Database error while fetching unique languages: {e}")
-    return languages
+    return [name for name, _ in get_facets("language")]
 
 
 def get_activity_digest(time_range: str) -> dict:
     """
     Retrieves a digest of the user's activity over a given time range.
 
+    The counts are summed from the per-hour rollup tables, so the range
+    starts at the beginning of the hour 24 hours (or 7 days) ago.
+
     Args:
         time_range (str): The time range for the digest ("day" or "week").
 
@@ -213,29 +2367,484 @@ def get_activity_digest(time_range: str) -> dict:
         start_time = int(time.time()) - 604800
     else:
         return {}
+    start_hour = start_time // SECONDS_PER_HOUR
 
     digest = {"apps": [], "words": []}
     try:
-        with sqlite3.connect(db_path) as conn:
+        with _connections().reader() as conn:
             cursor = conn.cursor()
             # Most frequent apps
             cursor.execute(
-                "SELECT app, COUNT(*) as count FROM entries WHERE timestamp >= ? GROUP BY app ORDER BY count DESC LIMIT 5",
-                (start_time,),
+                "SELECT app, SUM(count) as count FROM app_hourly WHERE hour >= ? GROUP BY app ORDER BY count DESC LIMIT 5",
+                (start_hour,),
             )
             digest["apps"] = cursor.fetchall()
             # Most frequent words
             cursor.execute(
-                "SELECT text FROM entries WHERE timestamp >= ?", (start_time,)
+                "SELECT token, SUM(count) as count FROM token_hourly WHERE hour >= ? GROUP BY token ORDER BY count DESC LIMIT 10",
+                (start_hour,),
             )
-            words = " ".join([row[0] for row in cursor.fetchall()]).split()
-            word_counts = {}
-            for word in words:
-                word_counts[word] = word_counts.get(word, 0) + 1
-            sorted_words = sorted(
-                word_counts.items(), key=lambda item: item[1], reverse=True
-            )
-            digest["words"] = sorted_words[:10]
+            digest["words"] = cursor.fetchall()
     except sqlite3.Error as e:
         print(f"Database error while fetching activity digest: {e}")
     return digest
+
+
+def get_line_embeddings(hashes: List[str]) -> Dict[str, np.ndarray]:
+    """
+    Looks up cached OCR line embeddings by their line hash.
+
+    Args:
+        hashes (List[str]): The line hashes to look up.
+
+    Returns:
+        Dict[str, np.ndarray]: A mapping of the hashes that were found to their
+                               float32 embeddings. Missing hashes are omitted.
+    """
+    found: Dict[str, np.ndarray] = {}
+    if not hashes:
+        return found
+    try:
+        with _connections().reader() as conn:
+            cursor = conn.cursor()
+            # Stay well below SQLite's host parameter limit
+            for start in range(0, len(hashes), BATCH_SIZE):
+                chunk = hashes[start : start + BATCH_SIZE]
+                placeholders = ",".join("?" * len(chunk))
+                cursor.execute(
+                    f"SELECT hash, embedding FROM line_embeddings WHERE hash IN ({placeholders})",
+                    chunk,
+                )
+                for line_hash, blob in cursor.fetchall():
+                    found[line_hash] = np.frombuffer(blob, dtype=np.float32)
+    except sqlite3.Error as e:
+        print(f"Database error while fetching line embeddings: {e}")
+    return found
+
+
+def insert_line_embeddings(items: Iterable[Tuple[str, np.ndarray]]) -> None:
+    """
+    Stores OCR line embeddings keyed by their line hash.
+
+    Args:
+        items (Iterable[Tuple[str, np.ndarray]]): (hash, embedding) pairs.
+                                                  Existing hashes are left untouched.
+    """
+    rows = [
+        (line_hash, embedding.astype(np.float32).tobytes())
+        for line_hash, embedding in items
+    ]
+    if not rows:
+        return
+    try:
+        with _connections().writer() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO line_embeddings (hash, embedding) VALUES (?, ?)",
+                rows,
+            )
+    except sqlite3.Error as e:
+        print(f"Database error while storing line embeddings: {e}")
+
+
+def get_line_embeddings_after(
+    last_line_id: int, dim: int
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Retrieves stored line embeddings with a rowid greater than `last_line_id`.
+
+    Args:
+        last_line_id (int): Only lines with a greater rowid are returned.
+        dim (int): The expected embedding dimension; other rows are skipped.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The line rowids in ascending order and
+                                       an (n, dim) float32 matrix.
+    """
+    rows: List[Tuple[int, bytes]] = []
+    try:
+        with _connections().reader() as conn:
+            rows = conn.execute(
+                "SELECT rowid, embedding FROM line_embeddings WHERE rowid > ? AND length(embedding) = ? ORDER BY rowid",
+                (last_line_id, dim * np.dtype(np.float32).itemsize),
+            ).fetchall()
+    except sqlite3.Error as e:
+        print(f"Database error while fetching new line embeddings: {e}")
+
+    ids = np.array([row[0] for row in rows], dtype=np.int64)
+    matrix = np.frombuffer(b"".join(row[1] for row in rows), dtype=np.float32)
+    return ids, matrix.reshape(len(rows), dim)
+
+
+def get_entry_lines_after(
+    last_entry_id: int, model: Optional[str] = None
+) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Retrieves the line references of entries newer than `last_entry_id`.
+
+    Args:
+        last_entry_id (int): Only entries with a greater id are returned.
+        model (Optional[str]): If given, only entries embedded by this model
+                               are returned.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray, np.ndarray]: The entry ids in ascending
+            order, the offset of each entry's first line in the third array,
+            and the concatenated line rowids of all entries.
+    """
+    rows: List[Tuple[int, bytes]] = []
+    try:
+        # Shards keep the references; the line embeddings stay in the hot database
+        for pool, _ in _sources(min_id=last_entry_id + 1):
+            with pool.reader() as conn:
+                query = "SELECT entry_id, line_ids FROM entry_lines WHERE entry_id > ?"
+                params: List[Any] = [last_entry_id]
+                if model is not None:
+                    query += " AND entry_id IN (SELECT id FROM entries WHERE model = ?)"
+                    params.append(model)
+                rows.extend(conn.execute(f"{query} ORDER BY entry_id", params).fetchall())
+    except sqlite3.Error as e:
+        print(f"Database error while fetching entry lines: {e}")
+    rows.sort()
+
+    entry_ids = np.array([row[0] for row in rows], dtype=np.int64)
+    line_ids = np.frombuffer(b"".join(row[1] for row in rows), dtype=np.int64)
+    counts = [len(row[1]) // np.dtype(np.int64).itemsize for row in rows]
+    offsets = np.cumsum([0] + counts[:-1]).astype(np.int64) if rows else np.empty(0, dtype=np.int64)
+    return entry_ids, offsets, line_ids
+
+
+def count_entries_needing_model(model: str) -> int:
+    """
+    Counts the entries whose embedding was not produced by `model`.
+
+    Sealed entries count too, unless their new embedding is already staged
+    (see `update_entry_embeddings`).
+
+    Args:
+        model (str): The current model name.
+
+    Returns:
+        int: The number of entries to re-embed, or 0 on error.
+    """
+    count = 0
+    try:
+        for pool, _ in _sources():
+            with pool.reader() as conn:
+                count += conn.execute(
+                    "SELECT COUNT(*) FROM entries WHERE model IS NOT ?", (model,)
+                ).fetchone()[0]
+        with _connections().reader() as conn:
+            count -= conn.execute(
+                "SELECT COUNT(*) FROM shard_embeddings WHERE model = ?", (model,)
+            ).fetchone()[0]
+    except sqlite3.Error as e:
+        print(f"Database error while counting entries to re-embed: {e}")
+        return 0
+    return max(count, 0)
+
+
+def get_entries_needing_model(
+    model: str, after_id: int, limit: int
+) -> List[Tuple[int, str]]:
+    """
+    Retrieves the next chunk of entries whose embedding was not produced by `model`.
+
+    Sealed entries whose new embedding is already staged are skipped, so an
+    interrupted job resumes where it stopped.
+
+    Args:
+        model (str): The current model name.
+        after_id (int): Only entries with a greater id are returned.
+        limit (int): The maximum number of entries.
+
+    Returns:
+        List[Tuple[int, str]]: (id, text) pairs in ascending id order.
+    """
+    sql = "SELECT id, text, text_line_ids FROM entries WHERE model IS NOT ? AND id > ? ORDER BY id LIMIT ?"
+    entries: List[Tuple[int, str]] = []
+    try:
+        with _connections().reader() as hot:
+            for pool, shard in _sources(min_id=after_id + 1):
+                with pool.reader() as conn:
+                    cursor = conn.cursor()
+                    rows: List[Tuple[int, Optional[str], Optional[bytes]]] = []
+                    last_id = after_id
+                    while len(rows) < limit:
+                        page = cursor.execute(sql, (model, last_id, limit)).fetchall()
+                        if shard is not None and page:
+                            staged = _staged_embedding_ids(hot, [row[0] for row in page], model)
+                            rows.extend(row for row in page if row[0] not in staged)
+                        else:
+                            rows.extend(page)
+                        if len(page) < limit:
+                            break
+                        last_id = page[-1][0]
+                    del rows[limit:]
+                    texts = _resolve_texts(cursor, [(text, blob) for _, text, blob in rows])
+                    entries.extend((row[0], text) for row, text in zip(rows, texts))
+    except sqlite3.Error as e:
+        print(f"Database error while fetching entries to re-embed: {e}")
+        return []
+    entries.sort(key=lambda entry: entry[0])
+    return entries[:limit]
+
+
+def _staged_embedding_ids(conn: sqlite3.Connection, entry_ids: List[int], model: str) -> Set[int]:
+    """Returns those of the entry ids whose `model` embedding is staged for their shard."""
+    staged: Set[int] = set()
+    for start in range(0, len(entry_ids), BATCH_SIZE):
+        chunk = entry_ids[start : start + BATCH_SIZE]
+        placeholders = ",".join("?" * len(chunk))
+        staged.update(
+            row[0]
+            for row in conn.execute(
+                f"SELECT entry_id FROM shard_embeddings WHERE model = ? AND entry_id IN ({placeholders})",
+                [model] + chunk,
+            )
+        )
+    return staged
+
+
+def update_entry_embeddings(
+    updates: List[Tuple[int, np.ndarray, List[str]]], model: str
+) -> bool:
+    """
+    Replaces the embeddings of existing entries in a single transaction.
+
+    Entries in the hot database are updated in place. Sealed entries are
+    read-only, so their embeddings are staged in `shard_embeddings` until
+    `apply_shard_embeddings` rewrites their shards.
+
+    Args:
+        updates (List[Tuple[int, np.ndarray, List[str]]]): (entry id, embedding,
+            line hashes) triples.
+        model (str): The name of the model that produced the embeddings.
+
+    Returns:
+        bool: True if the transaction was committed.
+    """
+    rows = [
+        (embedding.astype(np.float32).tobytes(), model, entry_id)
+        for entry_id, embedding, _ in updates
+    ]
+    try:
+        with _connections().writer() as conn:
+            cursor = conn.cursor()
+            cursor.executemany(
+                "UPDATE entries SET embedding = ?, model = ? WHERE id = ?",
+                rows,
+            )
+            hot_ids: Set[int] = set()
+            for start in range(0, len(updates), BATCH_SIZE):
+                chunk = [entry_id for entry_id, _, _ in updates[start : start + BATCH_SIZE]]
+                placeholders = ",".join("?" * len(chunk))
+                cursor.execute(f"SELECT id FROM entries WHERE id IN ({placeholders})", chunk)
+                hot_ids.update(row[0] for row in cursor.fetchall())
+            for (entry_id, _, line_hashes), row in zip(updates, rows):
+                if entry_id in hot_ids:
+                    cursor.execute("DELETE FROM entry_lines WHERE entry_id = ?", (entry_id,))
+                    if line_hashes:
+                        _insert_entry_lines(cursor, entry_id, line_hashes)
+                else:
+                    cursor.execute(
+                        "INSERT OR REPLACE INTO shard_embeddings (entry_id, embedding, model, line_ids) VALUES (?, ?, ?, ?)",
+                        (entry_id, row[0], model, _entry_line_ids(cursor, line_hashes or [])),
+                    )
+    except sqlite3.Error as e:
+        print(f"Database error while updating embeddings: {e}")
+        return False
+    # Re-embedded rows keep their ids, so appends cannot bring the store up to date
+    embedding_store.mark_stale()
+    _bump_ingest_version(rewrite=True)
+    return True
+
+
+def apply_shard_embeddings() -> int:
+    """
+    Writes the staged embeddings of sealed entries into their shards.
+
+    Each shard with staged entries is copied, updated, compacted and made
+    read-only again, then replaces the original, like a reseal. Its summary
+    does not depend on the embeddings and is kept. Applied rows leave the
+    staging table; a shard that fails keeps its rows staged.
+
+    Returns:
+        int: The number of entries updated.
+    """
+    applied = 0
+    with shard_lock:
+        for shard in _shard_set().shards():
+            try:
+                with _connections().reader() as conn:
+                    staged = conn.execute(
+                        "SELECT entry_id, embedding, model, line_ids FROM shard_embeddings WHERE entry_id BETWEEN ? AND ?",
+                        (shard.first_id, shard.last_id),
+                    ).fetchall()
+            except sqlite3.Error as e:
+                print(f"Database error while reading staged embeddings: {e}")
+                break
+            if not staged:
+                continue
+            updated = _rewrite_shard_embeddings(shard, staged)
+            if updated is None:
+                continue
+            try:
+                with _connections().writer() as conn:
+                    conn.executemany(
+                        "DELETE FROM shard_embeddings WHERE entry_id = ?",
+                        [(entry_id,) for entry_id in updated],
+                    )
+            except sqlite3.Error as e:
+                print(f"Database error while clearing staged embeddings: {e}")
+                break
+            applied += len(updated)
+    if applied:
+        embedding_store.mark_stale()
+        _bump_ingest_version(rewrite=True)
+    return applied
+
+
+def _rewrite_shard_embeddings(
+    shard: Shard, staged: List[Tuple[int, bytes, str, Optional[bytes]]]
+) -> Optional[List[int]]:
+    """Writes staged embeddings into a copy of a shard and swaps it in; returns the ids found."""
+    path = shard.path
+    tmp_path = path + ".tmp"
+    try:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        shutil.copyfile(path, tmp_path)
+        os.chmod(tmp_path, 0o644)
+        conn = sqlite3.connect(tmp_path)
+        try:
+            cursor = conn.cursor()
+            updated: List[int] = []
+            for entry_id, embedding, model, line_ids in staged:
+                cursor.execute(
+                    "UPDATE entries SET embedding = ?, model = ? WHERE id = ?",
+                    (embedding, model, entry_id),
+                )
+                if cursor.rowcount == 0:
+                    continue  # Held by another shard
+                updated.append(entry_id)
+                cursor.execute("DELETE FROM entry_lines WHERE entry_id = ?", (entry_id,))
+                if line_ids is not None:
+                    cursor.execute(
+                        "INSERT INTO entry_lines (entry_id, line_ids) VALUES (?, ?)",
+                        (entry_id, line_ids),
+                    )
+            conn.commit()
+            cursor.execute("VACUUM")
+        finally:
+            conn.close()
+        os.chmod(tmp_path, 0o444)
+        os.chmod(path, 0o644)  # Replacing a read-only file fails on Windows
+        _drop_pool(path)
+        os.replace(tmp_path, path)
+    except (sqlite3.Error, OSError) as e:
+        print(f"Database error while rewriting {path}: {e}")
+        return None
+    return updated
+
+
+def get_titles_needing_embedding(model: str, limit: int) -> List[Tuple[int, str, str]]:
+    """
+    Retrieves (app, title) pairs that have no embedding from `model` yet.
+
+    Args:
+        model (str): The current model name.
+        limit (int): The maximum number of pairs.
+
+    Returns:
+        List[Tuple[int, str, str]]: (id, app, title) triples in ascending id order.
+    """
+    try:
+        with _connections().reader() as conn:
+            return conn.execute(
+                "SELECT id, app, title FROM titles WHERE model IS NOT ? ORDER BY id LIMIT ?",
+                (model, limit),
+            ).fetchall()
+    except sqlite3.Error as e:
+        print(f"Database error while fetching titles to embed: {e}")
+        return []
+
+
+def set_title_embeddings(items: List[Tuple[int, np.ndarray]], model: str) -> None:
+    """
+    Stores the embeddings of (app, title) pairs.
+
+    Args:
+        items (List[Tuple[int, np.ndarray]]): (title id, embedding) pairs.
+        model (str): The name of the model that produced the embeddings.
+    """
+    rows = [
+        (embedding.astype(np.float32).tobytes(), model, title_id)
+        for title_id, embedding in items
+    ]
+    try:
+        with _connections().writer() as conn:
+            conn.executemany(
+                "UPDATE titles SET embedding = ?, model = ? WHERE id = ?", rows
+            )
+    except sqlite3.Error as e:
+        print(f"Database error while storing title embeddings: {e}")
+
+
+def get_title_embeddings_after(
+    last_title_id: int, dim: int, model: str
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Retrieves the title embeddings from `model` with an id above `last_title_id`.
+
+    Args:
+        last_title_id (int): Only titles with a greater id are returned.
+        dim (int): The expected embedding dimension; other rows are skipped.
+        model (str): Only embeddings produced by this model are returned.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The title ids in ascending order and an
+                                       (n, dim) float32 matrix.
+    """
+    rows: List[Tuple[int, bytes]] = []
+    try:
+        with _connections().reader() as conn:
+            rows = conn.execute(
+                "SELECT id, embedding FROM titles WHERE id > ? AND model = ? AND length(embedding) = ? ORDER BY id",
+                (last_title_id, model, dim * np.dtype(np.float32).itemsize),
+            ).fetchall()
+    except sqlite3.Error as e:
+        print(f"Database error while fetching title embeddings: {e}")
+
+    ids = np.array([row[0] for row in rows], dtype=np.int64)
+    matrix = np.frombuffer(b"".join(row[1] for row in rows), dtype=np.float32)
+    return ids, matrix.reshape(len(rows), dim)
+
+
+def get_entry_titles_after(last_entry_id: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Retrieves the (app, title) pair of each entry newer than `last_entry_id`.
+
+    Args:
+        last_entry_id (int): Only entries with a greater id are returned.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: The entry ids in ascending order and
+                                       their title ids.
+    """
+    rows: List[Tuple[int, int]] = []
+    try:
+        for pool, _ in _sources(min_id=last_entry_id + 1):
+            with pool.reader() as conn:
+                rows.extend(
+                    conn.execute(
+                        "SELECT id, title_id FROM entries WHERE id > ? AND title_id IS NOT NULL ORDER BY id",
+                        (last_entry_id,),
+                    ).fetchall()
+                )
+    except sqlite3.Error as e:
+        print(f"Database error while fetching entry titles: {e}")
+    rows.sort()
+
+    entry_ids = np.array([row[0] for row in rows], dtype=np.int64)
+    title_ids = np.array([row[1] for row in rows], dtype=np.int64)
+    return entry_ids, title_ids
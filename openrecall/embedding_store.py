@@ -0,0 +1,261 @@
+import logging
+import os
+import struct
+import threading
+import time
+from typing import Any, Dict, Iterable, Optional, Tuple
+
+import numpy as np
+
+from openrecall.config import embedding_store_path
+
+logger = logging.getLogger(__name__)
+
+MAGIC: bytes = b"ORECEMB1"
+HEADER_SIZE: int = 256  # Bytes reserved at the start of both files
+HEADER_FORMAT: str = "<8sIQI"  # magic, dim, generation, model name length
+VECTORS_FILE: str = "vectors.f32"
+IDS_FILE: str = "ids.i64"
+
+
+def _pack_header(dim: int, generation: int, model: str) -> bytes:
+    """Builds the fixed-size header shared by the vectors and ids files."""
+    name = model.encode("utf-8")
+    header = struct.pack(HEADER_FORMAT, MAGIC, dim, generation, len(name)) + name
+    if len(header) > HEADER_SIZE:
+        raise ValueError(f"Model name too long for the embedding store: {model}")
+    return header.ljust(HEADER_SIZE, b"\0")
+
+
+def _unpack_header(header: bytes) -> Optional[Tuple[int, int, str]]:
+    """Parses a header into (dim, generation, model), or None if invalid."""
+    fixed = struct.calcsize(HEADER_FORMAT)
+    if len(header) < HEADER_SIZE:
+        return None
+    magic, dim, generation, name_length = struct.unpack(HEADER_FORMAT, header[:fixed])
+    if magic != MAGIC or fixed + name_length > HEADER_SIZE:
+        return None
+    return dim, generation, header[fixed : fixed + name_length].decode("utf-8")
+
+
+class EmbeddingStore:
+    """
+    An append-only, memory-mapped store of entry embeddings for one model.
+
+    Embeddings are kept outside SQLite as a contiguous float32 matrix so that
+    the search indexes fill from one sequential read of a mapped file instead
+    of decoding one BLOB per row, which is what bounds search cold start. The
+    indexes still copy the rows into their own normalized matrix; the store
+    is not scored in place. The store is a directory of two raw files:
+
+    - `vectors.f32`: a header followed by (n, dim) float32 rows.
+    - `ids.i64`: the same header followed by the n ascending entry ids.
+
+    Both headers carry the generation (creation time) of the rebuild so that files from
+    different rebuilds are never paired. A row counts once both its vector
+    and its id are fully written, so a torn append is simply ignored.
+
+    The database remains the source of truth: the store is only used after
+    `verify` has checked it against the database, and it is marked stale
+    whenever it can no longer be kept in sync by appends.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Args:
+            path: The directory holding the store's files.
+        """
+        self.path = path
+        self.dim: Optional[int] = None
+        self.model: Optional[str] = None
+        self.is_verified = False
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._load_header()
+
+    @property
+    def vectors_path(self) -> str:
+        return os.path.join(self.path, VECTORS_FILE)
+
+    @property
+    def ids_path(self) -> str:
+        return os.path.join(self.path, IDS_FILE)
+
+    def _load_header(self) -> None:
+        """Reads the model and dimension of the files on disk, if they match."""
+        self.dim, self.model, self._generation = None, None, 0
+        try:
+            with open(self.vectors_path, "rb") as f:
+                vectors_header = _unpack_header(f.read(HEADER_SIZE))
+            with open(self.ids_path, "rb") as f:
+                ids_header = _unpack_header(f.read(HEADER_SIZE))
+        except OSError:
+            return
+        if vectors_header is None or vectors_header != ids_header:
+            return
+        self.dim, self._generation, self.model = vectors_header
+
+    def is_current(self, model: Optional[str], dim: int) -> bool:
+        """Returns True if the store can answer reads for `model` at `dim`."""
+        return self.is_verified and self.model == model and self.dim == dim
+
+    def __len__(self) -> int:
+        """Returns the number of complete rows."""
+        if self.dim is None:
+            return 0
+        try:
+            vector_bytes = os.path.getsize(self.vectors_path) - HEADER_SIZE
+            id_bytes = os.path.getsize(self.ids_path) - HEADER_SIZE
+        except OSError:
+            return 0
+        row_bytes = self.dim * np.dtype(np.float32).itemsize
+        return max(0, min(vector_bytes // row_bytes, id_bytes // np.dtype(np.int64).itemsize))
+
+    def load(self) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Maps the store into memory; rows are only read when accessed.
+
+        Returns:
+            Tuple[np.ndarray, np.ndarray]: Read-only views of the ascending
+                entry ids and the (n, dim) float32 embedding matrix.
+        """
+        with self._lock:
+            return self._views()
+
+    def _views(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Maps the complete rows; the caller holds the lock."""
+        dim = self.dim or 0
+        count = len(self)
+        if count == 0:
+            return np.empty(0, dtype=np.int64), np.empty((0, dim), dtype=np.float32)
+        ids = np.memmap(self.ids_path, dtype=np.int64, mode="r", offset=HEADER_SIZE, shape=(count,))
+        matrix = np.memmap(
+            self.vectors_path, dtype=np.float32, mode="r", offset=HEADER_SIZE, shape=(count, dim)
+        )
+        return ids, matrix
+
+    def after(self, last_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns memory-mapped views of the rows with an id greater than `last_id`."""
+        ids, matrix = self.load()
+        start = int(np.searchsorted(ids, last_id, side="right"))
+        return ids[start:], matrix[start:]
+
+    def append(self, entry_id: int, embedding: np.ndarray, model: Optional[str]) -> None:
+        """
+        Appends one entry's embedding if it belongs to this store.
+
+        Embeddings from another model or dimension are ignored. An id that is
+        not greater than the last stored id would break the ascending order,
+        so it marks the store stale instead, unless the id is already stored.
+        """
+        with self._lock:
+            if not self.is_verified or model != self.model:
+                return
+            vector = np.asarray(embedding, dtype=np.float32).reshape(-1)
+            if vector.shape[0] != self.dim:
+                return
+            ids, _ = self._views()
+            count = len(ids)
+            if count and entry_id <= int(ids[-1]):
+                # Already written by a concurrent rebuild, or out of order
+                row = int(np.searchsorted(ids, entry_id))
+                if row >= count or int(ids[row]) != entry_id:
+                    self.is_verified = False
+                return
+            try:
+                # The vector goes first: a row only counts once its id exists
+                self._truncate(count)
+                with open(self.vectors_path, "ab") as f:
+                    f.write(vector.tobytes())
+                with open(self.ids_path, "ab") as f:
+                    f.write(np.int64(entry_id).tobytes())
+            except OSError as e:
+                logger.error(f"Failed to append to the embedding store: {e}")
+                self.is_verified = False
+
+    def _truncate(self, count: int) -> None:
+        """Drops any partial row left behind by an interrupted append."""
+        vector_size = HEADER_SIZE + count * (self.dim or 0) * np.dtype(np.float32).itemsize
+        ids_size = HEADER_SIZE + count * np.dtype(np.int64).itemsize
+        if os.path.getsize(self.vectors_path) != vector_size:
+            os.truncate(self.vectors_path, vector_size)
+        if os.path.getsize(self.ids_path) != ids_size:
+            os.truncate(self.ids_path, ids_size)
+
+    def mark_stale(self) -> None:
+        """Stops serving reads until the store is verified or rebuilt again."""
+        self.is_verified = False
+
+    def verify(
+        self, model: str, dim: int, count: int, first_id: Optional[int], last_id: Optional[int]
+    ) -> bool:
+        """
+        Checks the store against the database's view of the same model.
+
+        Args:
+            model: The model whose embeddings the store should hold.
+            dim: The embedding dimension.
+            count: The number of entries embedded by `model` in the database.
+            first_id: The smallest id among those entries.
+            last_id: The largest id among those entries.
+
+        Returns:
+            bool: True if the store matches, in which case it starts serving
+                  reads and accepting appends.
+        """
+        ids, _ = self.load()
+        consistent = (
+            self.model == model
+            and self.dim == dim
+            and len(ids) == count
+            and (count == 0 or (int(ids[0]) == first_id and int(ids[-1]) == last_id))
+            and bool(np.all(np.diff(ids) > 0))
+        )
+        self.is_verified = consistent
+        return consistent
+
+    def rebuild(
+        self, model: str, dim: int, batches: Iterable[Tuple[np.ndarray, np.ndarray]]
+    ) -> int:
+        """
+        Replaces the store with the given embeddings.
+
+        Args:
+            model: The model that produced the embeddings.
+            dim: The embedding dimension.
+            batches: (ids, (n, dim) matrix) pairs in ascending id order.
+
+        Returns:
+            int: The number of rows written.
+        """
+        with self._lock:
+            self.is_verified = False
+            os.makedirs(self.path, exist_ok=True)
+            generation = time.time_ns()
+            header = _pack_header(dim, generation, model)
+            vectors_tmp, ids_tmp = self.vectors_path + ".tmp", self.ids_path + ".tmp"
+            count = 0
+            with open(vectors_tmp, "wb") as vectors, open(ids_tmp, "wb") as ids:
+                vectors.write(header)
+                ids.write(header)
+                for batch_ids, matrix in batches:
+                    vectors.write(np.ascontiguousarray(matrix, dtype=np.float32).tobytes())
+                    ids.write(np.asarray(batch_ids, dtype=np.int64).tobytes())
+                    count += len(batch_ids)
+            os.replace(vectors_tmp, self.vectors_path)
+            os.replace(ids_tmp, self.ids_path)
+            self.dim, self.model, self._generation = dim, model, generation
+            self.is_verified = True
+            return count
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns the store's model, size and state."""
+        return {
+            "model": self.model,
+            "dim": self.dim,
+            "rows": len(self),
+            "verified": self.is_verified,
+        }
+
+
+embedding_store = EmbeddingStore(embedding_store_path)
@@ -1,21 +1,60 @@
+import hashlib
+import json
 import numpy as np
 import os
 import logging
+import threading
+import torch
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 from sentence_transformers import SentenceTransformer
 
-from openrecall.config import model_cache_path
+from openrecall.ann import normalize_rows
+from openrecall.cache import LRUCache
+from openrecall.config import args, model_cache_path
+from openrecall.database import (
+    get_line_embeddings,
+    get_titles_needing_embedding,
+    insert_line_embeddings,
+    set_title_embeddings,
+)
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 # Constants
-MODEL_NAME: str = "all-MiniLM-L6-v2"
-EMBEDDING_DIM: int = 384  # Dimension for all-MiniLM-L6-v2
+MODEL_NAME: str = args.model
+DEFAULT_EMBEDDING_DIM: int = 384  # Dimension for all-MiniLM-L6-v2
+DEFAULT_TOP_K: int = 100  # Results returned by a semantic search
+TITLE_WEIGHT: float = 0.3  # Share of the window title in title-aware ranking
+TITLE_EMBED_BATCH: int = 256  # Titles embedded per batch
+RRF_K: int = 60  # Rank offset of reciprocal rank fusion
+KEYWORD_CANDIDATES: int = 1000  # Keyword hits fused with (or shortlisted for) semantic search
+QUANTIZED_AGREEMENT_SUFFIX: str = "-int8.json"  # File name suffix of recorded agreement checks
+MIN_QUANTIZED_AGREEMENT: float = 0.98  # Lowest accepted cosine vs. the float32 model
 
+# Typical screen text used to check that a quantized model still produces
+# embeddings that agree with the float32 model.
+AGREEMENT_SAMPLE: List[str] = [
+    "File Edit View Insert Format Tools Help",
+    "def insert_entry(text, timestamp, embedding, app, title):",
+    "Inbox (3) - Project update meeting moved to Thursday",
+    "Search results for python sqlite full text search",
+    "Q3 revenue grew 12% year over year driven by subscriptions",
+    "git commit -m \"Fix race condition in file watcher\"",
+    "Your order has shipped and will arrive on Monday",
+    "Slack | #general | Alice: can someone review my PR?",
+    "Temperature 18 C, light rain expected in the afternoon",
+    "Traceback (most recent call last): KeyError: 'timestamp'",
+    "Settings > Privacy > Screen Recording",
+    "Chapter 4: The Treaty of Westphalia and the modern state",
+]
 
-def get_model(model_name):
+
+def get_model(model_name, quantize=False):
+    if quantize:
+        return get_quantized_model(model_name)
     cache_path = os.path.join(model_cache_path, model_name)
     if os.path.isdir(cache_path):
         return SentenceTransformer(cache_path)
@@ -25,14 +64,184 @@ def get_model(model_name):
         return model
 
 
+def quantize_model(float_model: torch.nn.Module) -> torch.nn.Module:
+    """
+    Returns a copy of the model with its linear layers converted to int8.
+
+    Dynamic quantization stores the weights as int8 and quantizes activations
+    on the fly, which speeds up CPU inference of transformer encoders without
+    any calibration data.
+    """
+    return torch.quantization.quantize_dynamic(
+        float_model, {torch.nn.Linear}, dtype=torch.qint8
+    )
+
+
+def embedding_agreement(
+    reference: Any, candidate: Any, sentences: Optional[List[str]] = None
+) -> Dict[str, float]:
+    """
+    Measures how closely two models embed the same sentences.
+
+    Args:
+        reference: The model considered correct, usually the float32 one.
+        candidate: The model being checked, usually the quantized one.
+        sentences: The corpus to embed. Defaults to AGREEMENT_SAMPLE.
+
+    Returns:
+        A dict with the mean and minimum cosine similarity between the two
+        models' embeddings of each sentence.
+    """
+    sentences = AGREEMENT_SAMPLE if sentences is None else sentences
+    expected = normalize_rows(np.asarray(reference.encode(sentences), dtype=np.float32))
+    actual = normalize_rows(np.asarray(candidate.encode(sentences), dtype=np.float32))
+    similarities = np.sum(expected * actual, axis=1)
+    return {"mean": float(similarities.mean()), "min": float(similarities.min())}
+
+
+def get_quantized_model(model_name):
+    """
+    Returns the int8 version of a model, or the float32 model if it disagrees.
+
+    The quantized model is only used when its embeddings of AGREEMENT_SAMPLE
+    stay within MIN_QUANTIZED_AGREEMENT of the float32 model, so stored
+    embeddings remain comparable across both modes. Quantizing is cheap, but
+    the check embeds the sample twice, so its result (pass or fail, with the
+    measured similarities) is recorded per model name in a small JSON file
+    and later starts skip it. Only the verdict is stored: the quantized
+    weights are rebuilt from the float32 model on every start.
+    """
+    marker_file = os.path.join(model_cache_path, model_name + QUANTIZED_AGREEMENT_SUFFIX)
+    float_model = get_model(model_name)
+    passed = None
+    try:
+        with open(marker_file) as f:
+            passed = bool(json.load(f)["passed"])
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        logger.warning(f"Ignoring unreadable agreement record '{marker_file}': {e}")
+    if passed is False:
+        logger.info(f"Quantized model '{model_name}' failed its agreement check; using float32.")
+        return float_model
+    quantized = quantize_model(float_model)
+    if passed:
+        return quantized
+
+    agreement = embedding_agreement(float_model, quantized)
+    passed = agreement["min"] >= MIN_QUANTIZED_AGREEMENT
+    logger.info(
+        f"Quantized model '{model_name}' agreement with float32: "
+        f"mean {agreement['mean']:.4f}, min {agreement['min']:.4f}"
+    )
+    try:
+        os.makedirs(os.path.dirname(marker_file), exist_ok=True)
+        tmp_file = marker_file + ".tmp"
+        with open(tmp_file, "w") as f:
+            json.dump({"passed": passed, **agreement}, f)
+        os.replace(tmp_file, marker_file)
+    except OSError as e:
+        logger.warning(f"Failed to record the agreement check in '{marker_file}': {e}")
+    if not passed:
+        logger.warning(
+            f"Quantized model '{model_name}' disagrees with float32 "
+            f"(min cosine {agreement['min']:.4f}); using float32 instead."
+        )
+        return float_model
+    return quantized
+
+
 # Load the model globally to avoid reloading it on every call
 try:
-    model = get_model(MODEL_NAME)
+    model = get_model(MODEL_NAME, quantize=args.quantize_model)
     logger.info(f"SentenceTransformer model '{MODEL_NAME}' loaded successfully.")
 except Exception as e:
     logger.error(f"Failed to load SentenceTransformer model '{MODEL_NAME}': {e}")
     model = None
 
+EMBEDDING_DIM: int = (
+    model.get_sentence_embedding_dimension() if model is not None else DEFAULT_EMBEDDING_DIM
+)
+
+# Screen text repeats heavily between frames (menus, toolbars, unchanged
+# paragraphs), so line embeddings are cached in memory and, optionally, in the
+# database so that they survive restarts.
+line_cache = LRUCache(args.line_cache_size)
+persist_line_cache: bool = not args.no_line_cache_db
+
+# Ad-hoc texts such as search queries are repeated while paging or changing
+# filters; their embeddings are cached by (normalized text, model).
+query_cache = LRUCache(args.query_cache_size)
+
+
+def normalize_line(line: str) -> str:
+    """Collapses runs of whitespace so that OCR spacing noise maps to one key."""
+    return " ".join(line.split())
+
+
+def split_lines(text: str) -> List[str]:
+    """Splits text into its normalized, non-empty lines."""
+    return [normalize_line(line) for line in text.split("\n") if line.strip()]
+
+
+def get_line_hashes(text: str) -> List[str]:
+    """Returns the cache keys of the distinct lines of `text`, in order."""
+    return list(dict.fromkeys(line_hash(line) for line in split_lines(text)))
+
+
+def line_hash(line: str) -> str:
+    """
+    Returns the cache key of a normalized line.
+
+    The model name is part of the hash so that cached vectors from a different
+    model are never mixed into new embeddings.
+    """
+    return hashlib.sha1(f"{MODEL_NAME}\n{line}".encode("utf-8")).hexdigest()
+
+
+def encode_lines(lines: List[str]) -> np.ndarray:
+    """
+    Encodes normalized lines, running the model only on lines not seen before.
+
+    Lines are looked up in the in-memory LRU first, then in the persistent
+    line table. Only the remaining lines are passed to `model.encode`, and
+    their vectors are written back to both cache levels.
+
+    Args:
+        lines: The normalized, non-empty lines to encode.
+
+    Returns:
+        A float32 matrix with one embedding per input line, in input order.
+    """
+    hashes = [line_hash(line) for line in lines]
+    vectors: Dict[str, np.ndarray] = {}
+    pending: Dict[str, str] = {}
+    for key, line in zip(hashes, lines):
+        if key in vectors or key in pending:
+            continue
+        cached = line_cache.get(key)
+        if cached is not None:
+            vectors[key] = cached
+        else:
+            pending[key] = line
+
+    if pending and persist_line_cache:
+        for key, vector in get_line_embeddings(list(pending)).items():
+            line_cache.put(key, vector)
+            vectors[key] = vector
+            del pending[key]
+
+    if pending:
+        encoded = np.asarray(model.encode(list(pending.values())), dtype=np.float32)
+        fresh = list(zip(pending.keys(), encoded))
+        for key, vector in fresh:
+            line_cache.put(key, vector)
+            vectors[key] = vector
+        if persist_line_cache:
+            insert_line_embeddings(fresh)
+
+    return np.stack([vectors[key] for key in hashes])
+
 
 def get_embedding(text: str) -> np.ndarray:
     """
@@ -40,7 +249,8 @@ def get_embedding(text: str) -> np.ndarray:
 
     Splits the text into lines, encodes each line using the pre-loaded
     SentenceTransformer model, and returns the mean of the embeddings.
-    Handles empty input text by returning a zero vector.
+    Line embeddings are served from the line cache where possible (see
+    `encode_lines`). Handles empty input text by returning a zero vector.
 
     Args:
         text: The input string to embed.
@@ -59,7 +269,7 @@ def get_embedding(text: str) -> np.ndarray:
         return np.zeros(EMBEDDING_DIM, dtype=np.float32)
 
     # Split text into non-empty lines
-    sentences = [line for line in text.split("\n") if line.strip()]
+    sentences = split_lines(text)
 
     if not sentences:
         logger.warning(
@@ -68,7 +278,7 @@ def get_embedding(text: str) -> np.ndarray:
         return np.zeros(EMBEDDING_DIM, dtype=np.float32)
 
     try:
-        sentence_embeddings = model.encode(sentences)
+        sentence_embeddings = encode_lines(sentences)
         # Calculate the mean embedding
         mean_embedding = np.mean(sentence_embeddings, axis=0, dtype=np.float32)
         return mean_embedding
@@ -77,6 +287,94 @@ def get_embedding(text: str) -> np.ndarray:
         return np.zeros(EMBEDDING_DIM, dtype=np.float32)
 
 
+def embed_texts(texts: List[str]) -> Tuple[np.ndarray, List[List[str]]]:
+    """
+    Embeds many texts at once, encoding their distinct lines in one batch.
+
+    This is the bulk counterpart of `get_embedding`: the lines of all texts
+    are pooled, so a line shared by many texts is encoded once, and the model
+    sees one large batch instead of one small batch per text.
+
+    Args:
+        texts: The input strings to embed.
+
+    Returns:
+        An (n, EMBEDDING_DIM) float32 matrix of mean line embeddings (zero rows
+        for texts without lines), and the line hashes of each text.
+
+    Raises:
+        RuntimeError: If the model is not loaded.
+    """
+    if model is None:
+        raise RuntimeError("SentenceTransformer model is not loaded.")
+    lines_per_text = [split_lines(text or "") for text in texts]
+    pooled = list(dict.fromkeys(line for lines in lines_per_text for line in lines))
+    embeddings = np.zeros((len(texts), EMBEDDING_DIM), dtype=np.float32)
+    if pooled:
+        vectors = encode_lines(pooled)
+        rows = {line: i for i, line in enumerate(pooled)}
+        for i, lines in enumerate(lines_per_text):
+            if lines:
+                embeddings[i] = np.mean(
+                    vectors[[rows[line] for line in lines]], axis=0, dtype=np.float32
+                )
+    hashes = [list(dict.fromkeys(line_hash(line) for line in lines)) for lines in lines_per_text]
+    return embeddings, hashes
+
+
+def embed_new_titles() -> int:
+    """
+    Embeds the (app, title) pairs that have no embedding from the current model.
+
+    Titles repeat across thousands of entries but are embedded only once each,
+    so this work grows with the number of distinct titles, not with frames.
+
+    Returns:
+        The number of titles embedded.
+    """
+    if model is None:
+        return 0
+    count = 0
+    while True:
+        pending = get_titles_needing_embedding(MODEL_NAME, TITLE_EMBED_BATCH)
+        if not pending:
+            return count
+        embeddings, _ = embed_texts([f"{app} {title}" for _, app, title in pending])
+        set_title_embeddings(
+            [(title_id, embeddings[i]) for i, (title_id, _, _) in enumerate(pending)],
+            MODEL_NAME,
+        )
+        count += len(pending)
+
+
+def get_query_embedding(text: str) -> np.ndarray:
+    """
+    Returns the embedding of an ad-hoc text such as a search query, cached.
+
+    The cache key is the whitespace-normalized text together with the model
+    name. Zero vectors (empty input or a failed model) are not cached.
+
+    Args:
+        text: The query string to embed.
+
+    Returns:
+        The float32 embedding of the query, as returned by `get_embedding`.
+    """
+    key = (normalize_line(text), MODEL_NAME)
+    embedding = query_cache.get(key)
+    if embedding is not None:
+        return embedding
+    embedding = get_embedding(text)
+    if np.any(embedding):
+        query_cache.put(key, embedding)
+    return embedding
+
+
+def get_cache_stats() -> Dict[str, Dict[str, Any]]:
+    """Returns the size and hit/miss counters of the embedding caches."""
+    return {"line": line_cache.stats(), "query": query_cache.stats()}
+
+
 def cosine_similarity(a: np.ndarray, b: np.ndarray) -> float:
     """
     Calculates the cosine similarity between two numpy vectors.
@@ -101,3 +399,492 @@ def cosine_similarity(a: np.ndarray, b: np.ndarray) -> float:
     similarity = np.dot(a, b) / (norm_a * norm_b)
     # Clip values to handle potential floating-point inaccuracies slightly outside [-1, 1]
     return float(np.clip(similarity, -1.0, 1.0))
+
+
+def reciprocal_rank_fusion(
+    rankings: List[np.ndarray], k: int = RRF_K, limit: Optional[int] = None
+) -> np.ndarray:
+    """
+    Fuses several rankings of entry ids with reciprocal rank fusion.
+
+    Each id scores the sum of 1 / (k + rank) over the rankings it appears in,
+    so items ranked well by several methods rise to the top without having
+    to calibrate their raw scores (e.g. BM25 against cosine similarity).
+
+    Args:
+        rankings: Arrays of entry ids, best first.
+        k: The rank offset; larger values flatten the contribution of the
+            first positions.
+        limit: The maximum number of ids returned.
+
+    Returns:
+        np.ndarray: The fused ids, best first. Ties keep the order of first
+                    appearance.
+    """
+    rankings = [np.asarray(ranking, dtype=np.int64) for ranking in rankings]
+    if not rankings or not any(len(ranking) for ranking in rankings):
+        return np.empty(0, dtype=np.int64)
+    ids = np.concatenate(rankings)
+    contributions = np.concatenate(
+        [1.0 / (k + np.arange(1, len(ranking) + 1)) for ranking in rankings]
+    )
+    unique_ids, first, inverse = np.unique(ids, return_index=True, return_inverse=True)
+    scores = np.bincount(inverse, weights=contributions)
+    order = np.lexsort((first, -scores))
+    return unique_ids[order][:limit]
+
+
+class EmbeddingIndex:
+    """
+    An in-memory, exact semantic search index.
+
+    Embeddings are L2-normalized once on insertion and kept in a contiguous
+    float32 matrix with a parallel array of entry ids, so a query is scored
+    against every row with a single matrix-vector product. The buffers grow
+    geometrically, so appending new entries is amortized O(1) per row.
+
+    The matrix is resident: rows read from the memory-mapped embedding store
+    are copied and normalized on `add`, so the index takes n * dim * 4 bytes
+    of memory on top of the page cache.
+    """
+
+    def __init__(self, dim: int = EMBEDDING_DIM, capacity: int = 1024) -> None:
+        """
+        Args:
+            dim: The embedding dimension.
+            capacity: The number of rows allocated up front.
+        """
+        self.dim = dim
+        self._matrix = np.empty((capacity, dim), dtype=np.float32)
+        self._ids = np.empty(capacity, dtype=np.int64)
+        self._size = 0
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def last_id(self) -> int:
+        """The id of the most recently added row, or 0 if the index is empty."""
+        return int(self._ids[self._size - 1]) if self._size else 0
+
+    def add(self, ids: np.ndarray, embeddings: np.ndarray) -> None:
+        """
+        Appends embeddings to the index.
+
+        Args:
+            ids: The entry ids, in ascending order.
+            embeddings: An (n, dim) matrix of raw (not normalized) embeddings.
+
+        Raises:
+            ValueError: If the embeddings do not match the index dimension.
+        """
+        if len(ids) == 0:
+            return
+        embeddings = np.asarray(embeddings, dtype=np.float32).reshape(len(ids), -1)
+        if embeddings.shape[1] != self.dim:
+            raise ValueError(
+                f"Expected embeddings of dimension {self.dim}, got {embeddings.shape[1]}."
+            )
+        with self._lock:
+            needed = self._size + len(ids)
+            if needed > len(self._ids):
+                capacity = max(needed, 2 * len(self._ids))
+                matrix = np.empty((capacity, self.dim), dtype=np.float32)
+                matrix[: self._size] = self._matrix[: self._size]
+                row_ids = np.empty(capacity, dtype=np.int64)
+                row_ids[: self._size] = self._ids[: self._size]
+                self._matrix, self._ids = matrix, row_ids
+            self._matrix[self._size : needed] = normalize_rows(embeddings)
+            self._ids[self._size : needed] = ids
+            self._size = needed
+
+    def snapshot(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Returns views of the indexed ids and their normalized embeddings."""
+        with self._lock:
+            return self._ids[: self._size], self._matrix[: self._size]
+
+    def sync(self, fetch_after: Callable[[int], Tuple[np.ndarray, np.ndarray]]) -> int:
+        """
+        Appends the entries added to the database since the last sync.
+
+        Args:
+            fetch_after: Returns the ids and embeddings of all entries with an
+                id greater than the given one, in ascending id order.
+
+        Returns:
+            The number of rows added.
+        """
+        with self._sync_lock:
+            ids, embeddings = fetch_after(self.last_id)
+            self.add(ids, embeddings)
+            return len(ids)
+
+    def search(
+        self,
+        query_embedding: np.ndarray,
+        k: int = DEFAULT_TOP_K,
+        candidate_ids: Optional[np.ndarray] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the k entries most similar to the query.
+
+        Args:
+            query_embedding: The query vector.
+            k: The maximum number of results.
+            candidate_ids: If given, only these entry ids are considered.
+
+        Returns:
+            The entry ids and their cosine similarities, most similar first.
+        """
+        ids, scores = self.scores(query_embedding, candidate_ids)
+        top = _top_k(scores, k)
+        return ids[top], scores[top]
+
+    def scores(
+        self,
+        query_embedding: np.ndarray,
+        candidate_ids: Optional[np.ndarray] = None,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the cosine similarity of the query to every (candidate) entry.
+
+        Args:
+            query_embedding: The query vector.
+            candidate_ids: If given, only these entry ids are scored.
+
+        Returns:
+            The entry ids in ascending order and their cosine similarities.
+        """
+        with self._lock:
+            # Slices are views; a concurrent add() swaps in new buffers
+            # rather than resizing these ones, so they stay valid.
+            matrix = self._matrix[: self._size]
+            ids = self._ids[: self._size]
+
+        query = _normalize_query(query_embedding)
+        if candidate_ids is None:
+            return ids, matrix @ query
+        rows = _candidate_rows(ids, candidate_ids)
+        return ids[rows], matrix[rows] @ query
+
+
+def _normalize_query(query_embedding: np.ndarray) -> np.ndarray:
+    """Returns the query as a unit-length float32 vector (zero stays zero)."""
+    query = query_embedding.astype(np.float32)
+    query_norm = np.linalg.norm(query)
+    return query / query_norm if query_norm > 0 else query
+
+
+def _candidate_rows(ids: np.ndarray, candidate_ids: np.ndarray) -> np.ndarray:
+    """
+    Returns the sorted positions of `candidate_ids` in the ascending `ids`.
+
+    Candidates are located by binary search, so the cost grows with the
+    number of candidates rather than with the size of the index.
+    """
+    candidate_ids = np.asarray(candidate_ids, dtype=np.int64)
+    rows = np.searchsorted(ids, candidate_ids)
+    found = rows < len(ids)
+    rows, candidate_ids = rows[found], candidate_ids[found]
+    return np.unique(rows[ids[rows] == candidate_ids])
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Returns the positions of the k highest scores, highest first."""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top], kind="stable")]
+
+
+class _Int64Buffer:
+    """An append-only int64 array that grows geometrically."""
+
+    def __init__(self, capacity: int = 1024) -> None:
+        self._data = np.empty(capacity, dtype=np.int64)
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def extend(self, values: np.ndarray) -> None:
+        needed = self._size + len(values)
+        if needed > len(self._data):
+            data = np.empty(max(needed, 2 * len(self._data)), dtype=np.int64)
+            data[: self._size] = self._data[: self._size]
+            self._data = data
+        self._data[self._size : needed] = values
+        self._size = needed
+
+    def view(self) -> np.ndarray:
+        return self._data[: self._size]
+
+
+class MultiVectorIndex:
+    """
+    Line-level semantic search over entries.
+
+    Averaging all lines of a busy screen dilutes a single relevant line. This
+    index scores each entry by its best-matching line(s) instead. Distinct
+    lines are stored once in an `EmbeddingIndex`, and each entry holds the
+    positions of its lines in a flat reference array. A query takes one
+    matrix-vector product over the distinct lines, gathers the scores per
+    reference, and reduces them per entry segment.
+    """
+
+    def __init__(self, dim: int = EMBEDDING_DIM) -> None:
+        """
+        Args:
+            dim: The embedding dimension.
+        """
+        self.lines = EmbeddingIndex(dim)
+        self._entry_ids = _Int64Buffer()
+        self._offsets = _Int64Buffer()
+        self._positions = _Int64Buffer()
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entry_ids)
+
+    @property
+    def last_id(self) -> int:
+        """The id of the most recently added entry, or 0 if there is none."""
+        entry_ids = self._entry_ids.view()
+        return int(entry_ids[-1]) if len(entry_ids) else 0
+
+    def add(self, entry_ids: np.ndarray, offsets: np.ndarray, line_ids: np.ndarray) -> None:
+        """
+        Appends entries whose lines are already in `self.lines`.
+
+        Line ids that are not indexed (e.g. of another dimension) are dropped,
+        and entries left without lines are skipped.
+
+        Args:
+            entry_ids: The entry ids, in ascending order.
+            offsets: The start of each entry's lines within `line_ids`.
+            line_ids: The concatenated line ids of all entries.
+        """
+        if len(entry_ids) == 0:
+            return
+        indexed_ids, _ = self.lines.snapshot()
+        counts = np.diff(np.append(offsets, len(line_ids)))
+        segments = np.repeat(np.arange(len(entry_ids)), counts)
+        positions = np.searchsorted(indexed_ids, line_ids)
+        found = positions < len(indexed_ids)
+        found[found] = indexed_ids[positions[found]] == line_ids[found]
+        positions, segments = positions[found], segments[found]
+
+        counts = np.bincount(segments, minlength=len(entry_ids))
+        keep = counts > 0
+        with self._lock:
+            start = len(self._positions)
+            self._offsets.extend(start + np.cumsum(counts)[keep] - counts[keep])
+            self._entry_ids.extend(np.asarray(entry_ids, dtype=np.int64)[keep])
+            self._positions.extend(positions)
+
+    def sync(
+        self,
+        fetch_lines_after: Callable[[int], Tuple[np.ndarray, np.ndarray]],
+        fetch_entries_after: Callable[[int], Tuple[np.ndarray, np.ndarray, np.ndarray]],
+    ) -> int:
+        """
+        Appends the lines and entries added to the database since the last sync.
+
+        Args:
+            fetch_lines_after: Returns the ids and embeddings of all lines with
+                an id greater than the given one, in ascending id order.
+            fetch_entries_after: Returns the entry ids, offsets and line ids of
+                all entries with an id greater than the given one.
+
+        Returns:
+            The number of entries fetched.
+        """
+        with self._sync_lock:
+            self.lines.sync(fetch_lines_after)
+            entry_ids, offsets, line_ids = fetch_entries_after(self.last_id)
+            self.add(entry_ids, offsets, line_ids)
+            return len(entry_ids)
+
+    def search(
+        self,
+        query_embedding: np.ndarray,
+        k: int = DEFAULT_TOP_K,
+        candidate_ids: Optional[np.ndarray] = None,
+        reduce: str = "max",
+        top_n: int = 3,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the k entries whose lines best match the query.
+
+        Args:
+            query_embedding: The query vector.
+            k: The maximum number of results.
+            candidate_ids: If given, only these entry ids are returned.
+            reduce: "max" scores an entry by its best line; "top_n" by the
+                mean of its `top_n` best lines.
+            top_n: The number of lines averaged when `reduce` is "top_n".
+
+        Returns:
+            The entry ids and their scores, best first.
+
+        Raises:
+            ValueError: If `reduce` is not a known reduction.
+        """
+        with self._lock:
+            entry_ids = self._entry_ids.view()
+            offsets = self._offsets.view()
+            positions = self._positions.view()
+        # Lines only grow and are synced before entries, so taking this
+        # snapshot second covers every position referenced above.
+        _, line_matrix = self.lines.snapshot()
+        if len(entry_ids) == 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+        ref_scores = (line_matrix @ _normalize_query(query_embedding))[positions]
+        if reduce == "max":
+            scores = np.maximum.reduceat(ref_scores, offsets)
+        elif reduce == "top_n":
+            counts = np.diff(np.append(offsets, len(positions)))
+            segments = np.repeat(np.arange(len(entry_ids)), counts)
+            # Sort by segment, then by descending score within each segment
+            order = np.lexsort((-ref_scores, segments))
+            rank = np.arange(len(order)) - offsets[segments]
+            best = rank < top_n
+            sums = np.bincount(
+                segments[best], weights=ref_scores[order][best], minlength=len(entry_ids)
+            )
+            scores = (sums / np.minimum(counts, top_n)).astype(np.float32)
+        else:
+            raise ValueError(f"Unknown reduction '{reduce}'.")
+
+        rows = (
+            np.arange(len(entry_ids))
+            if candidate_ids is None
+            else _candidate_rows(entry_ids, candidate_ids)
+        )
+        top = _top_k(scores[rows], k)
+        return entry_ids[rows[top]], scores[rows[top]]
+
+
+class TitleIndex:
+    """
+    Window title similarity for title-aware ranking.
+
+    Distinct (app, title) pairs are held in a small `EmbeddingIndex`, and a
+    parallel pair of arrays maps each entry to its title. A query scores only
+    the distinct titles, and each entry inherits the score of its title.
+    """
+
+    def __init__(self, dim: int = EMBEDDING_DIM) -> None:
+        """
+        Args:
+            dim: The embedding dimension.
+        """
+        self.titles = EmbeddingIndex(dim)
+        self._entry_ids = _Int64Buffer()
+        self._title_ids = _Int64Buffer()
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entry_ids)
+
+    @property
+    def last_id(self) -> int:
+        """The id of the most recently added entry, or 0 if there is none."""
+        entry_ids = self._entry_ids.view()
+        return int(entry_ids[-1]) if len(entry_ids) else 0
+
+    def add(self, entry_ids: np.ndarray, title_ids: np.ndarray) -> None:
+        """
+        Appends entry to title mappings.
+
+        Args:
+            entry_ids: The entry ids, in ascending order.
+            title_ids: The title id of each entry.
+        """
+        with self._lock:
+            self._entry_ids.extend(entry_ids)
+            self._title_ids.extend(title_ids)
+
+    def sync(
+        self,
+        fetch_titles_after: Callable[[int], Tuple[np.ndarray, np.ndarray]],
+        fetch_entries_after: Callable[[int], Tuple[np.ndarray, np.ndarray]],
+    ) -> int:
+        """
+        Appends the titles and entries added to the database since the last sync.
+
+        Args:
+            fetch_titles_after: Returns the ids and embeddings of all titles
+                with an id greater than the given one, in ascending id order.
+            fetch_entries_after: Returns the entry ids and title ids of all
+                entries with an id greater than the given one.
+
+        Returns:
+            The number of entries fetched.
+        """
+        with self._sync_lock:
+            self.titles.sync(fetch_titles_after)
+            entry_ids, title_ids = fetch_entries_after(self.last_id)
+            self.add(entry_ids, title_ids)
+            return len(entry_ids)
+
+    def entry_scores(self, query_embedding: np.ndarray, entry_ids: np.ndarray) -> np.ndarray:
+        """
+        Returns the title similarity of each given entry.
+
+        Args:
+            query_embedding: The query vector.
+            entry_ids: The entry ids to score, in ascending order.
+
+        Returns:
+            One score per entry id; entries without an indexed title score 0.
+        """
+        with self._lock:
+            known_entries = self._entry_ids.view()
+            entry_titles = self._title_ids.view()
+        title_ids, title_scores = self.titles.scores(query_embedding)
+
+        scores = np.zeros(len(entry_ids), dtype=np.float32)
+        rows = np.searchsorted(known_entries, entry_ids)
+        found = rows < len(known_entries)
+        found[found] = known_entries[rows[found]] == entry_ids[found]
+        titles = entry_titles[rows[found]]
+        positions = np.searchsorted(title_ids, titles)
+        indexed = positions < len(title_ids)
+        indexed[indexed] = title_ids[positions[indexed]] == titles[indexed]
+        matched = np.flatnonzero(found)[indexed]
+        scores[matched] = title_scores[positions[indexed]]
+        return scores
+
+    def rank(
+        self,
+        query_embedding: np.ndarray,
+        text_index: EmbeddingIndex,
+        k: int = DEFAULT_TOP_K,
+        candidate_ids: Optional[np.ndarray] = None,
+        title_weight: float = TITLE_WEIGHT,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Ranks entries by a blend of title similarity and text similarity.
+
+        Args:
+            query_embedding: The query vector.
+            text_index: The index holding the entries' text embeddings.
+            k: The maximum number of results.
+            candidate_ids: If given, only these entry ids are considered.
+            title_weight: The share of the title score, between 0 and 1.
+
+        Returns:
+            The entry ids and their blended scores, best first.
+        """
+        ids, text_scores = text_index.scores(query_embedding, candidate_ids)
+        title_scores = self.entry_scores(query_embedding, ids)
+        scores = (1.0 - title_weight) * text_scores + title_weight * title_scores
+        top = _top_k(scores, k)
+        return ids[top], scores[top]
@@ -0,0 +1,195 @@
+import math
+import threading
+import time
+from collections import namedtuple
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+import numpy as np
+
+from openrecall.database import SECONDS_PER_HOUR, get_facets, get_hourly_counts
+
+# Estimated cost of each unit of work, in microseconds per row. They only
+# need to be right relative to each other.
+FILTER_ROW_COST: float = 1.0  # Reading one matching row from indexed SQL
+CANDIDATE_ROW_COST: float = 0.5  # Gathering and scoring one candidate embedding
+SCAN_ROW_COST: float = 0.05  # Scoring one row of a full matrix-vector scan
+LOOKUP_ROW_COST: float = 2.0  # Checking one ranked id against the filters
+OVERFETCH: float = 2.0  # Ranked results fetched per result expected to pass the filters
+STATS_TTL: float = 60.0  # Seconds the selectivity statistics are reused
+
+FILTER_FIRST: str = "filter-first"
+VECTOR_FIRST: str = "vector-first"
+
+Plan = namedtuple(
+    "Plan",
+    ["strategy", "total_rows", "estimated_rows", "selectivity", "fetch_k", "costs"],
+)
+
+
+class SelectivityStats:
+    """
+    Entry counts per app, per language and per hour.
+
+    The fraction of entries matching several filters is estimated as the
+    product of their individual fractions, i.e. the filters are assumed to
+    be independent.
+    """
+
+    def __init__(
+        self,
+        apps: Dict[str, int],
+        languages: Dict[str, int],
+        hours: np.ndarray,
+        hour_counts: np.ndarray,
+    ) -> None:
+        """
+        Args:
+            apps: The number of entries per app name.
+            languages: The number of entries per language.
+            hours: The hours with entries (timestamp // SECONDS_PER_HOUR), ascending.
+            hour_counts: The number of entries in each of those hours.
+        """
+        self.apps = apps
+        self.languages = languages
+        self.hours = hours
+        self._cumulative = np.concatenate([[0], np.cumsum(hour_counts)])
+        self.total = int(self._cumulative[-1])
+
+    @classmethod
+    def load(cls) -> "SelectivityStats":
+        """Reads the statistics from the facets and the hourly rollups."""
+        hours, counts = get_hourly_counts()
+        return cls(dict(get_facets("app")), dict(get_facets("language")), hours, counts)
+
+    def selectivity(
+        self,
+        app: Optional[str] = None,
+        language: Optional[str] = None,
+        start_time: Optional[int] = None,
+        end_time: Optional[int] = None,
+    ) -> float:
+        """Returns the estimated fraction of entries matching the filters."""
+        if self.total == 0:
+            return 0.0
+        fraction = 1.0
+        for name, counts in ((app, self.apps), (language, self.languages)):
+            if name is not None:
+                fraction *= counts.get(name, 0) / max(1, sum(counts.values()))
+        if start_time is not None or end_time is not None:
+            first = 0
+            last = len(self.hours)
+            if start_time is not None:
+                first = int(np.searchsorted(self.hours, start_time // SECONDS_PER_HOUR))
+            if end_time is not None:
+                last = int(np.searchsorted(self.hours, end_time // SECONDS_PER_HOUR, side="right"))
+            in_range = self._cumulative[max(first, last)] - self._cumulative[first]
+            fraction *= in_range / self.total
+        return fraction
+
+
+class SearchPlanner:
+    """
+    Chooses how a filtered semantic search is executed.
+
+    - filter-first: the filters run as indexed SQL and only the matching
+      entries are scored. Cheap when the filters are selective.
+    - vector-first: the whole index (or the approximate index) is ranked and
+      the best results are checked against the filters afterwards, fetching
+      more of them the less selective the filters are. Cheap when most
+      entries match, since no candidate list has to be built.
+
+    The choice compares the estimated cost of both strategies, computed from
+    selectivity statistics that are refreshed every `ttl` seconds.
+    """
+
+    def __init__(
+        self,
+        load_stats: Callable[[], SelectivityStats] = SelectivityStats.load,
+        ttl: float = STATS_TTL,
+    ) -> None:
+        """
+        Args:
+            load_stats: Returns fresh statistics.
+            ttl: How long statistics are reused, in seconds.
+        """
+        self._load_stats = load_stats
+        self.ttl = ttl
+        self._stats: Optional[SelectivityStats] = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def stats(self) -> SelectivityStats:
+        """Returns the current statistics, reloading them when they expired."""
+        with self._lock:
+            if self._stats is None or time.monotonic() - self._loaded_at > self.ttl:
+                self._stats = self._load_stats()
+                self._loaded_at = time.monotonic()
+            return self._stats
+
+    def plan(
+        self,
+        limit: int,
+        app: Optional[str] = None,
+        language: Optional[str] = None,
+        start_time: Optional[int] = None,
+        end_time: Optional[int] = None,
+    ) -> Plan:
+        """
+        Returns the cheaper strategy for a query.
+
+        Args:
+            limit: The number of results wanted.
+            app, language, start_time, end_time: The query's filters.
+
+        Returns:
+            Plan: The strategy, the estimates it is based on, and for
+                vector-first, the number of ranked results to post-filter.
+        """
+        stats = self.stats()
+        total = stats.total
+        unfiltered = app is None and language is None and start_time is None and end_time is None
+        selectivity = 1.0 if unfiltered else stats.selectivity(app, language, start_time, end_time)
+        estimated = selectivity * total
+        if unfiltered:
+            fetch_k = limit
+        elif selectivity > 0:
+            fetch_k = max(limit, min(total, math.ceil(limit * OVERFETCH / selectivity)))
+        else:
+            fetch_k = max(limit, total)
+        costs = {
+            FILTER_FIRST: estimated * (FILTER_ROW_COST + CANDIDATE_ROW_COST),
+            VECTOR_FIRST: total * SCAN_ROW_COST + fetch_k * LOOKUP_ROW_COST,
+        }
+        if unfiltered:
+            strategy = VECTOR_FIRST
+        else:
+            strategy = min(costs, key=costs.get)
+        return Plan(strategy, total, int(round(estimated)), selectivity, fetch_k, costs)
+
+
+class QueryTrace:
+    """Records the stages of one query and how long each took, for `explain`."""
+
+    def __init__(self) -> None:
+        self.stages: List[Dict[str, Any]] = []
+        self.notes: List[str] = []
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[Dict[str, Any]]:
+        """Times a stage; the caller may add details (e.g. row counts) to the yielded dict."""
+        record: Dict[str, Any] = {"stage": name}
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record["ms"] = round((time.perf_counter() - start) * 1000, 3)
+            self.stages.append(record)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Returns the stages, their total time and any notes."""
+        return {
+            "stages": self.stages,
+            "total_ms": round(sum(stage["ms"] for stage in self.stages), 3),
+            "notes": self.notes,
+        }
@@ -0,0 +1,159 @@
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, Optional
+
+from openrecall import nlp
+from openrecall.database import (
+    apply_shard_embeddings,
+    count_entries_needing_model,
+    get_entries_needing_model,
+    shard_lock,
+    update_entry_embeddings,
+)
+
+logger = logging.getLogger(__name__)
+
+# Constants
+REEMBED_CHUNK_SIZE: int = 256  # Entries read, encoded and committed together
+
+
+class ReembedJob:
+    """
+    Re-embeds every entry whose embedding was produced by another model.
+
+    The job streams entry text in id order, chunk by chunk. The distinct
+    lines of a whole chunk are encoded in one batch (see `nlp.embed_texts`),
+    and each chunk is written back in a single transaction, so the recorder
+    keeps inserting meanwhile. The `model` column is the checkpoint: an
+    interrupted job simply resumes with the entries that still carry another
+    model name.
+
+    Sealed entries are re-embedded too. Their embeddings are staged in the
+    hot database and written into the shards once all entries are done, and
+    the job holds `shard_lock` throughout, so no entry is sealed meanwhile.
+    """
+
+    def __init__(
+        self,
+        model_name: str = nlp.MODEL_NAME,
+        chunk_size: int = REEMBED_CHUNK_SIZE,
+        on_complete: Optional[Callable[[], None]] = None,
+    ) -> None:
+        """
+        Args:
+            model_name: The model the entries are migrated to.
+            chunk_size: The number of entries processed per transaction.
+            on_complete: Called once all entries have been re-embedded.
+        """
+        self.model_name = model_name
+        self.chunk_size = chunk_size
+        self.on_complete = on_complete
+        self.state = "idle"
+        self.total = 0
+        self.done = 0
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self) -> bool:
+        """
+        Starts the job in a background thread.
+
+        Returns:
+            False if the job is already running or the model is not loaded.
+        """
+        with self._lock:
+            if self.is_running:
+                return False
+            if nlp.model is None:
+                logger.error("Cannot re-embed entries: the model is not loaded.")
+                return False
+            self._stop.clear()
+            self._thread = threading.Thread(target=self.run, daemon=True)
+            self._thread.start()
+            return True
+
+    def stop(self) -> None:
+        """Asks the job to stop after the current chunk."""
+        self._stop.set()
+
+    def run(self) -> None:
+        """Re-embeds all outdated entries; blocks until done or stopped."""
+        with shard_lock:
+            self._run()
+
+    def _run(self) -> None:
+        """Runs the job while entries cannot move between databases."""
+        self.state = "running"
+        self.total = count_entries_needing_model(self.model_name)
+        self.done = 0
+        self.started_at = time.time()
+        self.finished_at = None
+        logger.info(f"Re-embedding {self.total} entries with '{self.model_name}'.")
+
+        try:
+            self._run_chunks()
+            if not self._stop.is_set():
+                apply_shard_embeddings()
+        except Exception as e:
+            logger.error(f"Re-embedding failed after {self.done} entries: {e}")
+            self.finished_at = time.time()
+            self.state = "failed"
+            return
+
+        self.finished_at = time.time()
+        if self._stop.is_set():
+            self.state = "stopped"
+            return
+        self.state = "completed"
+        logger.info(f"Re-embedding finished: {self.done} entries updated.")
+        if self.on_complete is not None:
+            self.on_complete()
+
+    def _run_chunks(self) -> None:
+        """Processes chunks until no outdated entry is left or a stop is requested."""
+        after_id = 0
+        while not self._stop.is_set():
+            rows = get_entries_needing_model(self.model_name, after_id, self.chunk_size)
+            if not rows:
+                break
+            embeddings, line_hashes = nlp.embed_texts([text for _, text in rows])
+            updates = [
+                (entry_id, embeddings[i], line_hashes[i])
+                for i, (entry_id, _) in enumerate(rows)
+            ]
+            if update_entry_embeddings(updates, self.model_name):
+                self.done += len(rows)
+            after_id = rows[-1][0]
+            logger.info(
+                f"Re-embedded {self.done}/{self.total} entries "
+                f"({self.entries_per_second():.1f} entries/s)."
+            )
+
+    def entries_per_second(self) -> float:
+        """Returns the throughput since the job started."""
+        if self.started_at is None:
+            return 0.0
+        elapsed = (self.finished_at or time.time()) - self.started_at
+        return self.done / elapsed if elapsed > 0 else 0.0
+
+    def status(self) -> Dict[str, Any]:
+        """Returns the job state, progress and throughput."""
+        rate = self.entries_per_second()
+        remaining = max(self.total - self.done, 0)
+        return {
+            "state": self.state,
+            "model": self.model_name,
+            "total": self.total,
+            "done": self.done,
+            "remaining": remaining,
+            "entries_per_second": rate,
+            "eta_seconds": remaining / rate if rate > 0 else None,
+        }
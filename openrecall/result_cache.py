@@ -0,0 +1,101 @@
+import threading
+from collections import namedtuple
+from typing import Any, Callable, Dict, Hashable, Optional
+
+import numpy as np
+
+from openrecall.cache import LRUCache
+
+# A cached ranking and the ingest counters it was computed at
+CachedResult = namedtuple("CachedResult", ["epoch", "version", "last_id", "ids"])
+
+
+class ResultCache:
+    """
+    Ranked entry ids of recent searches, kept valid as entries are inserted.
+
+    Each result records the ingest counters (see
+    `openrecall.database.get_ingest_version`) it was computed at:
+
+    - same version: nothing changed, the ids are returned as they are.
+    - same epoch, newer version: entries were only inserted. If the caller
+      can `extend` the ranking, only the cached ids and the new entries are
+      re-scored, which gives the same top-k as a full search when every
+      entry is scored independently of the others.
+    - otherwise the result is dropped.
+    """
+
+    def __init__(self, max_size: int, ttl: Optional[float] = None) -> None:
+        """
+        Args:
+            max_size: The maximum number of results kept.
+            ttl: How long a result is reused, in seconds.
+        """
+        self._cache = LRUCache(max_size, ttl)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.extended = 0
+        self.invalidated = 0
+
+    def get(
+        self,
+        key: Hashable,
+        epoch: int,
+        version: int,
+        last_id: int,
+        extend: Optional[Callable[[np.ndarray, int], np.ndarray]] = None,
+    ) -> Optional[np.ndarray]:
+        """
+        Returns the ranked ids cached under `key`, brought up to date.
+
+        Args:
+            key: The search's query, filters and model.
+            epoch, version, last_id: The current ingest counters.
+            extend: Re-ranks the cached ids together with the entries
+                    inserted after the given id; None if the ranking cannot
+                    be extended.
+
+        Returns:
+            Optional[np.ndarray]: The ranked ids, or None on a miss.
+        """
+        cached = self._cache.get(key)
+        if cached is None:
+            return None
+        if cached.version == version:
+            with self._lock:
+                self.hits += 1
+            return cached.ids
+        if cached.epoch != epoch or extend is None:
+            self._cache.pop(key)
+            with self._lock:
+                self.invalidated += 1
+            return None
+        ids = extend(cached.ids, cached.last_id)
+        self.put(key, epoch, version, last_id, ids)
+        with self._lock:
+            self.extended += 1
+        return ids
+
+    def put(self, key: Hashable, epoch: int, version: int, last_id: int, ids: np.ndarray) -> None:
+        """Caches a ranking computed at the given ingest counters."""
+        self._cache.put(key, CachedResult(epoch, version, last_id, ids))
+
+    def clear(self) -> None:
+        self._cache.clear()
+        with self._lock:
+            self.hits = self.extended = self.invalidated = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns the cache's size and bounds and how lookups were answered."""
+        stats = self._cache.stats()
+        lookups = stats["hits"] + stats["misses"]
+        stats.update(
+            {
+                "hits": self.hits,
+                "extended": self.extended,
+                "invalidated": self.invalidated,
+                "misses": lookups - self.hits - self.extended,
+                "hit_rate": (self.hits + self.extended) / lookups if lookups else 0.0,
+            }
+        )
+        return stats
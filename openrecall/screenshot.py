@@ -8,14 +8,15 @@ import numpy as np
 from PIL import Image
 
 from openrecall.config import screenshots_path, args
-from openrecall.database import insert_entry
-from openrecall.nlp import get_embedding
+from openrecall.database import NewEntry
+from openrecall.nlp import MODEL_NAME, get_embedding, get_line_hashes
 from openrecall.ocr import extract_text_from_image
 from openrecall.utils import (
     get_active_app_name,
     get_active_window_title,
     is_user_active,
 )
+from openrecall.writer import entry_writer
 
 # A global flag to control the recording state
 recording_paused = threading.Event()
@@ -171,13 +172,17 @@ def record_screenshots_thread() -> None:
                     active_window_title: str = (
                         get_active_window_title() or "Unknown Title"
                     )
-                    insert_entry(
-                        text,
-                        timestamp,
-                        embedding,
-                        active_app_name,
-                        active_window_title,
-                        language,
+                    entry_writer.submit(
+                        NewEntry(
+                            text,
+                            timestamp,
+                            embedding,
+                            active_app_name,
+                            active_window_title,
+                            language,
+                            line_hashes=get_line_hashes(text),
+                            model=MODEL_NAME,
+                        )
                     )
 
         time.sleep(3)  # Wait before taking the next screenshot
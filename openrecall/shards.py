@@ -0,0 +1,163 @@
+import datetime
+import json
+import logging
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.request import pathname2url
+
+logger = logging.getLogger(__name__)
+
+SHARD_PREFIX: str = "recall-"
+SHARD_SUFFIX: str = ".db"
+META_TABLE: str = "shard_meta"  # Key/value summary stored inside each shard
+
+
+def period_bounds(timestamp: int, months: int) -> Tuple[int, int]:
+    """
+    Returns the partition holding `timestamp`, as [start, end) timestamps.
+
+    Partitions are aligned runs of `months` calendar months in local time,
+    counted from year 0, so monthly partitions start on the 1st of each month
+    and quarterly ones in January, April, July and October.
+    """
+    moment = datetime.datetime.fromtimestamp(timestamp)
+    index = (moment.year * 12 + moment.month - 1) // months * months
+    end_index = index + months
+    start = datetime.datetime(index // 12, index % 12 + 1, 1)
+    end = datetime.datetime(end_index // 12, end_index % 12 + 1, 1)
+    return int(start.timestamp()), int(end.timestamp())
+
+
+def shard_name(start: int) -> str:
+    """Returns the file name of the shard whose partition starts at `start`."""
+    return SHARD_PREFIX + datetime.datetime.fromtimestamp(start).strftime("%Y-%m") + SHARD_SUFFIX
+
+
+def write_meta(cursor: sqlite3.Cursor, meta: Dict[str, Any]) -> None:
+    """Replaces the summary stored in a shard."""
+    cursor.execute(f"CREATE TABLE IF NOT EXISTS {META_TABLE} (key TEXT PRIMARY KEY, value TEXT)")
+    cursor.execute(f"DELETE FROM {META_TABLE}")
+    cursor.executemany(
+        f"INSERT INTO {META_TABLE} (key, value) VALUES (?, ?)",
+        [(key, json.dumps(value)) for key, value in meta.items()],
+    )
+
+
+class Shard:
+    """
+    A sealed, read-only database file holding the entries of one partition.
+
+    Its summary is read once from the file, so a query can tell from memory
+    whether the shard may hold matching entries.
+    """
+
+    def __init__(self, path: str, meta: Dict[str, Any]) -> None:
+        """
+        Args:
+            path: The shard's database file.
+            meta: The summary written by `write_meta` when it was sealed.
+        """
+        self.path = path
+        self.start: int = meta["start"]
+        self.end: int = meta["end"]
+        self.first_timestamp: Optional[int] = meta.get("first_timestamp")
+        self.last_timestamp: Optional[int] = meta.get("last_timestamp")
+        self.first_id: Optional[int] = meta.get("first_id")
+        self.last_id: Optional[int] = meta.get("last_id")
+        self.entry_count: int = meta.get("entry_count", 0)
+        self.apps: Dict[str, int] = meta.get("apps", {})
+        self.languages: Dict[str, int] = meta.get("languages", {})
+
+    @classmethod
+    def open(cls, path: str) -> Optional["Shard"]:
+        """Reads a shard's summary, or returns None if the file is not a sealed shard."""
+        try:
+            conn = sqlite3.connect(f"file:{pathname2url(path)}?mode=ro&immutable=1", uri=True)
+            try:
+                rows = conn.execute(f"SELECT key, value FROM {META_TABLE}").fetchall()
+            finally:
+                conn.close()
+            return cls(path, {key: json.loads(value) for key, value in rows})
+        except (sqlite3.Error, KeyError, ValueError) as e:
+            logger.warning(f"Ignoring unreadable shard {path}: {e}")
+            return None
+
+    def may_contain(
+        self,
+        start_time: Optional[int] = None,
+        end_time: Optional[int] = None,
+        app: Optional[str] = None,
+        language: Optional[str] = None,
+        min_id: Optional[int] = None,
+        max_id: Optional[int] = None,
+    ) -> bool:
+        """Returns False if no entry of the shard can match the filters."""
+        if self.entry_count == 0:
+            return False
+        if start_time is not None and self.last_timestamp < start_time:
+            return False
+        if end_time is not None and self.first_timestamp > end_time:
+            return False
+        if min_id is not None and self.last_id < min_id:
+            return False
+        if max_id is not None and self.first_id > max_id:
+            return False
+        if app is not None and app not in self.apps:
+            return False
+        return language is None or language in self.languages
+
+
+class ShardSet:
+    """
+    The sealed shards in one directory, oldest first.
+
+    The directory is listed again whenever its modification time changes,
+    i.e. when a shard is sealed or replaced.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Args:
+            path: The directory holding the shard files.
+        """
+        self.path = path
+        self._shards: List[Shard] = []
+        self._mtime: Optional[int] = None
+        self._lock = threading.Lock()
+
+    def path_for(self, start: int) -> str:
+        """Returns the file path of the shard whose partition starts at `start`."""
+        return os.path.join(self.path, shard_name(start))
+
+    def shards(self) -> List[Shard]:
+        """Returns all sealed shards, ordered by time."""
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except OSError:
+            return []
+        with self._lock:
+            if mtime != self._mtime:
+                names = sorted(
+                    name
+                    for name in os.listdir(self.path)
+                    if name.startswith(SHARD_PREFIX) and name.endswith(SHARD_SUFFIX)
+                )
+                opened = [Shard.open(os.path.join(self.path, name)) for name in names]
+                self._shards = [shard for shard in opened if shard is not None]
+                self._mtime = mtime
+            return list(self._shards)
+
+    def select(self, **filters: Any) -> List[Shard]:
+        """Returns the shards that may hold entries matching `Shard.may_contain` filters."""
+        return [shard for shard in self.shards() if shard.may_contain(**filters)]
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns the number of shards and of the entries they hold."""
+        shards = self.shards()
+        return {
+            "shards": len(shards),
+            "entries": sum(shard.entry_count for shard in shards),
+            "oldest": shards[0].first_timestamp if shards else None,
+        }
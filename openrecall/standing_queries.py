@@ -0,0 +1,195 @@
+import json
+import logging
+import threading
+from collections import namedtuple
+from typing import Callable, Dict, List, Optional, Sequence
+from urllib.parse import urlsplit
+from urllib.request import Request, urlopen
+
+import numpy as np
+
+from openrecall.ann import normalize_rows
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_THRESHOLD: float = 0.5  # Cosine similarity an entry needs to match a standing query
+WEBHOOK_TIMEOUT: float = 5.0  # Seconds to wait for a webhook to accept a match
+WEBHOOK_SCHEMES: tuple = ("http", "https")  # urlopen would also read file: and ftp: URLs
+
+# A saved search; see `openrecall.database.add_standing_query` for the fields
+StandingQuery = namedtuple(
+    "StandingQuery",
+    ["id", "name", "query", "embedding", "model", "threshold", "keywords", "app", "webhook"],
+)
+# An entry matching a standing query when it was inserted
+QueryMatch = namedtuple("QueryMatch", ["query_id", "entry_id", "timestamp", "score"])
+
+
+class StandingQueryRegistry:
+    """
+    The standing queries, held in memory and scored against new entries.
+
+    The query embeddings of each model are stacked into one normalized
+    matrix, so a batch of new entries is scored against every query with a
+    single matrix product; app and keyword filters are then applied to the
+    few (entry, query) pairs above their thresholds. The cost of an insert
+    grows with the number of new entries and queries, never with history.
+
+    The registry is filled from the database on first use and reset
+    whenever a query is added or removed.
+    """
+
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._queries: List[StandingQuery] = []
+        # Per model: positions in `_queries` and their stacked embeddings
+        self._matrices: Dict[str, tuple] = {}
+        self._listeners: List[Callable[[List[QueryMatch]], None]] = []
+
+    @property
+    def is_loaded(self) -> bool:
+        return self._loaded
+
+    def __len__(self) -> int:
+        return len(self._queries)
+
+    def load(self, queries: List[StandingQuery]) -> None:
+        """Replaces the registered queries."""
+        by_model: Dict[str, List[int]] = {}
+        for position, query in enumerate(queries):
+            by_model.setdefault(query.model, []).append(position)
+        matrices = {}
+        for model, positions in by_model.items():
+            dims = {len(queries[position].embedding) for position in positions}
+            # Queries embedded with another dimension than the most recent one
+            # cannot be stacked; they match again once re-created
+            dim = len(queries[positions[-1]].embedding)
+            if len(dims) > 1:
+                logger.warning(f"Ignoring standing queries of {model} with another dimension than {dim}")
+                positions = [p for p in positions if len(queries[p].embedding) == dim]
+            matrix = normalize_rows(
+                np.stack([queries[p].embedding for p in positions]).astype(np.float32)
+            )
+            thresholds = np.array([queries[p].threshold for p in positions], dtype=np.float32)
+            matrices[model] = (np.array(positions), matrix, thresholds)
+        with self._lock:
+            self._queries = list(queries)
+            self._matrices = matrices
+            self._loaded = True
+
+    def reset(self) -> None:
+        """Forgets the loaded queries, so that they are read again on next use."""
+        with self._lock:
+            self._queries = []
+            self._matrices = {}
+            self._loaded = False
+
+    def match(
+        self,
+        entry_ids: Sequence[int],
+        timestamps: Sequence[int],
+        embeddings: Sequence[np.ndarray],
+        models: Sequence[Optional[str]],
+        apps: Sequence[Optional[str]],
+        texts: Sequence[str],
+    ) -> List[QueryMatch]:
+        """
+        Scores new entries against every standing query.
+
+        Args:
+            entry_ids: The ids of the new entries.
+            timestamps: Their timestamps.
+            embeddings: Their embeddings.
+            models: The models that produced the embeddings. Entries are only
+                    compared with queries embedded by the same model.
+            apps: Their app names, for queries filtered by app.
+            texts: Their OCR texts, for queries with keywords.
+
+        Returns:
+            List[QueryMatch]: The (query, entry) pairs that match.
+        """
+        with self._lock:
+            queries, matrices = self._queries, self._matrices
+        matches: List[QueryMatch] = []
+        if not queries or not len(entry_ids):
+            return matches
+        lowered: Dict[int, str] = {}
+        for model, (positions, matrix, thresholds) in matrices.items():
+            rows = [
+                i
+                for i, entry_model in enumerate(models)
+                if entry_model == model and len(embeddings[i]) == matrix.shape[1]
+            ]
+            if not rows:
+                continue
+            scores = normalize_rows(np.stack([embeddings[i] for i in rows]).astype(np.float32)) @ matrix.T
+            for row, column in zip(*np.nonzero(scores >= thresholds)):
+                i = rows[row]
+                query = queries[positions[column]]
+                if query.app is not None and apps[i] != query.app:
+                    continue
+                if query.keywords:
+                    if i not in lowered:
+                        lowered[i] = (texts[i] or "").lower()
+                    if not all(word in lowered[i] for word in query.keywords.lower().split()):
+                        continue
+                matches.append(
+                    QueryMatch(query.id, int(entry_ids[i]), int(timestamps[i]), float(scores[row, column]))
+                )
+        return matches
+
+    def add_listener(self, listener: Callable[[List[QueryMatch]], None]) -> None:
+        """Calls `listener` with the matches of every insert; it should return quickly."""
+        with self._lock:
+            self._listeners.append(listener)
+
+    def remove_listener(self, listener: Callable[[List[QueryMatch]], None]) -> None:
+        with self._lock:
+            if listener in self._listeners:
+                self._listeners.remove(listener)
+
+    def notify(self, matches: List[QueryMatch]) -> None:
+        """Passes recorded matches to the listeners and posts them to webhooks."""
+        if not matches:
+            return
+        with self._lock:
+            listeners = list(self._listeners)
+            webhooks = {query.id: query.webhook for query in self._queries if query.webhook}
+        for listener in listeners:
+            try:
+                listener(matches)
+            except Exception as e:
+                logger.error(f"Standing query listener failed: {e}")
+        by_webhook: Dict[str, List[QueryMatch]] = {}
+        for match in matches:
+            if match.query_id in webhooks:
+                by_webhook.setdefault(webhooks[match.query_id], []).append(match)
+        for url, posted in by_webhook.items():
+            threading.Thread(target=_post_matches, args=(url, posted), daemon=True).start()
+
+
+def is_valid_webhook(url: str) -> bool:
+    """Returns True if `url` is an http(s) URL with a host."""
+    try:
+        parts = urlsplit(url)
+    except ValueError:
+        return False
+    return parts.scheme.lower() in WEBHOOK_SCHEMES and bool(parts.netloc)
+
+
+def _post_matches(url: str, matches: List[QueryMatch]) -> None:
+    """POSTs matches to a webhook as a JSON list."""
+    if not is_valid_webhook(url):
+        logger.warning(f"Not posting standing query matches to invalid webhook {url!r}")
+        return
+    body = json.dumps([match._asdict() for match in matches]).encode("utf-8")
+    request = Request(url, data=body, headers={"Content-Type": "application/json"})
+    try:
+        with urlopen(request, timeout=WEBHOOK_TIMEOUT):
+            pass
+    except OSError as e:
+        logger.warning(f"Could not post standing query matches to {url}: {e}")
+
+
+standing_queries = StandingQueryRegistry()
@@ -0,0 +1,216 @@
+import hashlib
+import sqlite3
+import zlib
+from typing import Dict, Iterable, List, Optional, Sequence, Set
+
+import numpy as np
+
+from openrecall.cache import LRUCache
+
+LINE_ID_DTYPE = np.dtype("<u4")  # Entries reference their lines as uint32 ids
+LOOKUP_BATCH_SIZE: int = 500  # Line ids or hashes per IN (...) query
+LINE_CACHE_SIZE: int = 100000  # Decoded lines kept in memory for display
+RAW: bytes = b"\x00"  # Marker of a line stored as plain UTF-8
+DEFLATE: bytes = b"\x01"  # Marker of a zlib-compressed line
+
+# Lines are immutable once stored, so decoded lines can be cached by id.
+line_cache = LRUCache(LINE_CACHE_SIZE)
+
+
+def create_table(cursor: sqlite3.Cursor) -> None:
+    """
+    Creates the content-addressed table of unique OCR lines.
+
+    Each distinct line is stored once, keyed by a 16-byte BLAKE2 digest of its
+    text, and compressed when that makes it smaller. `ref_count` is the
+    number of entries using the line (see `add_references`), so that lines
+    can be dropped without scanning every entry.
+
+    Args:
+        cursor (sqlite3.Cursor): A cursor on an open connection.
+    """
+    cursor.execute(
+        """CREATE TABLE IF NOT EXISTS text_lines (
+               id INTEGER PRIMARY KEY,
+               hash BLOB UNIQUE,
+               data BLOB,
+               ref_count INTEGER NOT NULL DEFAULT 0
+           )"""
+    )
+
+
+def line_key(line: str) -> bytes:
+    """Returns the content address of a line."""
+    return hashlib.blake2b(line.encode("utf-8"), digest_size=16).digest()
+
+
+def encode_line(line: str) -> bytes:
+    """Compresses a line if that saves space; short lines are kept as is."""
+    raw = line.encode("utf-8")
+    compressed = zlib.compress(raw, 9)
+    if len(compressed) < len(raw):
+        return DEFLATE + compressed
+    return RAW + raw
+
+
+def decode_line(data: bytes) -> str:
+    """Reverses `encode_line`."""
+    if data[:1] == DEFLATE:
+        return zlib.decompress(data[1:]).decode("utf-8")
+    return data[1:].decode("utf-8")
+
+
+def pack_line_ids(line_ids: Sequence[int]) -> bytes:
+    """Packs an entry's line ids, in text order, into a compact blob."""
+    return np.asarray(line_ids, dtype=LINE_ID_DTYPE).tobytes()
+
+
+def unpack_line_ids(blob: Optional[bytes]) -> np.ndarray:
+    """Reverses `pack_line_ids`."""
+    return np.frombuffer(blob or b"", dtype=LINE_ID_DTYPE)
+
+
+def store_texts(cursor: sqlite3.Cursor, texts: List[str]) -> List[bytes]:
+    """
+    Stores the lines of several texts and returns their packed line ids.
+
+    Every line, including empty ones, is referenced in order so that each
+    text can be reconstructed exactly.
+
+    Args:
+        cursor (sqlite3.Cursor): A cursor inside the writing transaction.
+        texts (List[str]): The entries' OCR texts.
+
+    Returns:
+        List[bytes]: The blobs to store in `entries.text_line_ids`, in order.
+    """
+    split = [text.split("\n") for text in texts]
+    keys = {line: line_key(line) for lines in split for line in lines}
+    cursor.executemany(
+        "INSERT OR IGNORE INTO text_lines (hash, data) VALUES (?, ?)",
+        [(key, encode_line(line)) for line, key in keys.items()],
+    )
+    ids_by_key: Dict[bytes, int] = {}
+    unique_keys = list(set(keys.values()))
+    for start in range(0, len(unique_keys), LOOKUP_BATCH_SIZE):
+        chunk = unique_keys[start : start + LOOKUP_BATCH_SIZE]
+        placeholders = ",".join("?" * len(chunk))
+        cursor.execute(
+            f"SELECT hash, id FROM text_lines WHERE hash IN ({placeholders})", chunk
+        )
+        ids_by_key.update(cursor.fetchall())
+    return [pack_line_ids([ids_by_key[keys[line]] for line in lines]) for lines in split]
+
+
+def load_texts(
+    cursor: sqlite3.Cursor, blobs: List[Optional[bytes]]
+) -> List[Optional[str]]:
+    """
+    Reconstructs entry texts from their packed line ids.
+
+    All lines of the batch are fetched with a few IN (...) queries, and
+    decoded lines are cached, so displaying consecutive frames of the same
+    window mostly hits memory.
+
+    Args:
+        cursor (sqlite3.Cursor): A cursor on an open connection.
+        blobs (List[Optional[bytes]]): `entries.text_line_ids` values. None
+                                       yields None.
+
+    Returns:
+        List[Optional[str]]: The texts, in the same order.
+    """
+    id_arrays = [unpack_line_ids(blob) if blob is not None else None for blob in blobs]
+    lines = load_lines(
+        cursor, {int(line_id) for ids in id_arrays if ids is not None for line_id in ids}
+    )
+    return [
+        "\n".join(lines.get(int(line_id), "") for line_id in ids) if ids is not None else None
+        for ids in id_arrays
+    ]
+
+
+def load_lines(cursor: sqlite3.Cursor, line_ids: Iterable[int]) -> Dict[int, str]:
+    """Returns the decoded lines with the given ids, from the cache when possible."""
+    lines: Dict[int, str] = {}
+    missing = []
+    for line_id in line_ids:
+        line = line_cache.get(line_id)
+        if line is None:
+            missing.append(line_id)
+        else:
+            lines[line_id] = line
+    for start in range(0, len(missing), LOOKUP_BATCH_SIZE):
+        chunk = missing[start : start + LOOKUP_BATCH_SIZE]
+        placeholders = ",".join("?" * len(chunk))
+        cursor.execute(
+            f"SELECT id, data FROM text_lines WHERE id IN ({placeholders})", chunk
+        )
+        for line_id, data in cursor.fetchall():
+            line = decode_line(data)
+            lines[line_id] = line
+            line_cache.put(line_id, line)
+    return lines
+
+
+def referenced_line_ids(blobs: Iterable[Optional[bytes]]) -> Set[int]:
+    """Returns the line ids used by a set of `entries.text_line_ids` values."""
+    arrays = [unpack_line_ids(blob) for blob in blobs if blob]
+    return set(np.unique(np.concatenate(arrays)).tolist()) if arrays else set()
+
+
+def add_references(
+    cursor: sqlite3.Cursor, blobs: Iterable[Optional[bytes]], delta: int = 1
+) -> Set[int]:
+    """
+    Adds `delta` to the reference counts of the lines used by entries.
+
+    A line counts once per entry, however often it appears in its text.
+
+    Args:
+        cursor (sqlite3.Cursor): A cursor inside the writing transaction.
+        blobs (Iterable[Optional[bytes]]): The entries' `text_line_ids`.
+        delta (int): 1 for entries being added, -1 for entries being removed.
+
+    Returns:
+        Set[int]: The ids of the lines whose counts changed.
+    """
+    arrays = [np.unique(unpack_line_ids(blob)) for blob in blobs if blob]
+    if not arrays:
+        return set()
+    line_ids, counts = np.unique(np.concatenate(arrays), return_counts=True)
+    cursor.executemany(
+        "UPDATE text_lines SET ref_count = ref_count + ? WHERE id = ?",
+        [(delta * int(count), int(line_id)) for line_id, count in zip(line_ids, counts)],
+    )
+    return set(line_ids.tolist())
+
+
+def delete_unreferenced(cursor: sqlite3.Cursor, line_ids: Iterable[int]) -> int:
+    """
+    Deletes those of the given lines that no entry references any more.
+
+    Only the given ids are checked, usually the lines of entries just
+    removed, so the cost does not grow with the size of the store. The line
+    with the highest id is always kept: SQLite assigns new lines the highest
+    id plus one, so ids are never reused and cached lines (and copies of
+    lines in sealed shards) stay valid.
+
+    Args:
+        cursor (sqlite3.Cursor): A cursor inside the writing transaction.
+        line_ids (Iterable[int]): The ids of the lines to check.
+
+    Returns:
+        int: The number of lines deleted.
+    """
+    last_id = cursor.execute("SELECT MAX(id) FROM text_lines").fetchone()[0]
+    candidates = sorted(line_id for line_id in set(line_ids) if line_id != last_id)
+    deleted = 0
+    for start in range(0, len(candidates), LOOKUP_BATCH_SIZE):
+        chunk = candidates[start : start + LOOKUP_BATCH_SIZE]
+        placeholders = ",".join("?" * len(chunk))
+        cursor.execute(
+            f"DELETE FROM text_lines WHERE ref_count <= 0 AND id IN ({placeholders})", chunk
+        )
+        deleted += cursor.rowcount
+    return deleted
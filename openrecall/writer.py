@@ -0,0 +1,140 @@
+import atexit
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Callable, List, Optional, Tuple
+
+from openrecall.config import args
+from openrecall.database import NewEntry, insert_entries
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()  # Queue sentinel asking the writer thread to exit
+
+
+class BatchWriter:
+    """
+    Group-commits entries written from any thread.
+
+    Entries are queued and a background thread inserts them with
+    `insert_entries`, one transaction per group. A group is committed as soon
+    as it holds `max_batch` entries or its oldest entry has waited
+    `max_latency` seconds, so a single frame is delayed by at most
+    `max_latency` while a backlog is drained in large batches. Callers get a
+    Future per entry that resolves to the new row id (or None for a skipped
+    duplicate).
+    """
+
+    def __init__(
+        self,
+        max_batch: int,
+        max_latency: float,
+        insert: Callable[[List[NewEntry]], List[Optional[int]]] = insert_entries,
+    ) -> None:
+        """
+        Args:
+            max_batch: The maximum number of entries committed together.
+            max_latency: The longest time in seconds an entry waits in the
+                queue before its group is committed.
+            insert: The function writing a group; `insert_entries` by default.
+        """
+        self.max_batch = max(1, max_batch)
+        self.max_latency = max_latency
+        self._insert = insert
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._closed = False
+
+    def _ensure_started(self) -> None:
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("BatchWriter is closed")
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+
+    def submit(self, entry: NewEntry) -> Future:
+        """Queues one entry; the Future resolves to its row id."""
+        return self.insert_entries([entry])[0]
+
+    def insert_entries(self, batch: List[NewEntry]) -> List[Future]:
+        """Queues several entries; each Future resolves to a row id."""
+        self._ensure_started()
+        futures = []
+        for entry in batch:
+            future: Future = Future()
+            self._queue.put((entry, future))
+            futures.append(future)
+        return futures
+
+    def flush(self) -> None:
+        """Blocks until every entry queued so far has been committed."""
+        self.submit(None).result()
+
+    def close(self) -> None:
+        """Commits everything still queued and stops the writer thread."""
+        with self._lock:
+            if self._closed:
+                return
+            self._closed = True
+            thread = self._thread
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join()
+
+    def _run(self) -> None:
+        stopping = False
+        while not stopping:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            group = [item]
+            deadline = time.monotonic() + self.max_latency
+            # A flush marker (None entry) commits its group without waiting
+            while len(group) < self.max_batch and group[-1][0] is not None:
+                # Past the deadline, only entries already queued join the group
+                timeout = deadline - time.monotonic()
+                try:
+                    if timeout > 0:
+                        item = self._queue.get(timeout=timeout)
+                    else:
+                        item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                group.append(item)
+            self._commit(group)
+        # Entries queued after the stop request are still written
+        remaining = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not _STOP:
+                remaining.append(item)
+        for start in range(0, len(remaining), self.max_batch):
+            self._commit(remaining[start : start + self.max_batch])
+
+    def _commit(self, group: List[Tuple[Optional[NewEntry], Future]]) -> None:
+        """Inserts a group and resolves its futures; None entries are flush markers."""
+        entries = [entry for entry, _ in group if entry is not None]
+        try:
+            ids = iter(self._insert(entries) if entries else [])
+            for entry, future in group:
+                future.set_result(next(ids) if entry is not None else None)
+        except Exception as e:
+            logger.error(f"Failed to write a batch of {len(entries)} entries: {e}")
+            for _, future in group:
+                if not future.done():
+                    future.set_exception(e)
+
+
+entry_writer = BatchWriter(args.ingest_batch_size, args.ingest_max_latency)
+# Entries still queued at interpreter exit are committed, not dropped
+atexit.register(entry_writer.close)
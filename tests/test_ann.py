@@ -0,0 +1,72 @@
+import numpy as np
+from unittest import mock
+
+from openrecall import ann
+from openrecall.ann import IVFIndex, kmeans
+
+
+def _clustered_vectors(rng, centers, per_center):
+    vectors = np.repeat(centers, per_center, axis=0)
+    return (vectors + 0.05 * rng.standard_normal(vectors.shape)).astype(np.float32)
+
+
+def test_kmeans_recovers_separated_clusters():
+    rng = np.random.default_rng(1)
+    centers = np.eye(4, dtype=np.float32)
+    vectors = ann.normalize_rows(_clustered_vectors(rng, centers, 50))
+
+    centroids = kmeans(vectors, 4)
+
+    assert centroids.shape == (4, 4)
+    # Every true center has a centroid pointing almost exactly at it
+    assert np.all(np.max(centroids @ centers.T, axis=0) > 0.95)
+
+
+def test_ivf_candidates_come_from_nearest_list():
+    rng = np.random.default_rng(2)
+    vectors = _clustered_vectors(rng, np.eye(4, dtype=np.float32), 25)
+    ids = np.arange(1, len(vectors) + 1)
+    index = IVFIndex()
+    assert index.train(ids, vectors, nlist=4)
+
+    candidates = index.candidates(np.array([0.0, 0.0, 1.0, 0.0]), nprobe=1)
+
+    np.testing.assert_array_equal(candidates, np.arange(51, 76))
+    assert len(index.candidates(np.ones(4), nprobe=4)) == len(ids)
+
+
+def test_ivf_add_ignores_known_ids_and_untrained_index():
+    index = IVFIndex()
+    index.add(np.array([1]), np.ones((1, 2)))
+    assert len(index) == 0
+
+    index.train(np.array([1, 2]), np.array([[1.0, 0.0], [0.0, 1.0]]), nlist=2)
+    index.add(np.array([2, 3]), np.array([[0.0, 1.0], [0.9, 0.1]]))
+
+    assert len(index) == 3
+    assert index.last_id == 3
+    np.testing.assert_array_equal(index.candidates(np.array([1.0, 0.0]), 1), [1, 3])
+
+
+def test_ivf_sync_fetches_after_last_id():
+    index = IVFIndex()
+    index.train(np.array([1, 2]), np.array([[1.0, 0.0], [0.0, 1.0]]), nlist=2)
+    fetch = mock.Mock(return_value=(np.array([5]), np.array([[0.0, 1.0]])))
+
+    assert index.sync(fetch) == 1
+    fetch.assert_called_once_with(2)
+    assert index.last_id == 5
+
+
+def test_ivf_save_and_load(tmp_path):
+    path = str(tmp_path / "ann_index.npz")
+    index = IVFIndex(path)
+    index.train(np.array([1, 2, 3]), np.array([[1.0, 0.0], [0.0, 1.0], [0.8, 0.2]]), nlist=2)
+
+    loaded = IVFIndex(path)
+
+    assert loaded.is_trained
+    assert loaded.last_id == 3
+    np.testing.assert_array_equal(
+        loaded.candidates(np.array([1.0, 0.0]), 1), index.candidates(np.array([1.0, 0.0]), 1)
+    )
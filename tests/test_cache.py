@@ -0,0 +1,51 @@
+from openrecall.cache import LRUCache
+
+
+def test_lru_cache_get_and_put():
+    cache = LRUCache(2)
+    cache.put("a", 1)
+    assert cache.get("a") == 1
+    assert cache.get("b") is None
+    assert cache.hits == 1
+    assert cache.misses == 1
+
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)
+    assert "a" in cache
+    assert "b" not in cache
+    assert len(cache) == 2
+
+
+def test_lru_cache_zero_size_disables_caching():
+    cache = LRUCache(0)
+    cache.put("a", 1)
+    assert cache.get("a") is None
+    assert len(cache) == 0
+
+
+def test_lru_cache_stats():
+    cache = LRUCache(4)
+    cache.put("a", 1)
+    cache.get("a")
+    cache.get("missing")
+    stats = cache.stats()
+    assert stats["size"] == 1
+    assert stats["hit_rate"] == 0.5
+
+
+def test_lru_cache_expires_items_after_ttl(monkeypatch):
+    clock = [100.0]
+    monkeypatch.setattr("openrecall.cache.time.monotonic", lambda: clock[0])
+    cache = LRUCache(2, ttl=10)
+    cache.put("a", 1)
+    clock[0] += 10
+    assert cache.get("a") == 1
+    clock[0] += 1
+    assert cache.get("a") is None
+    assert "a" not in cache
+    assert cache.stats()["expired"] == 1
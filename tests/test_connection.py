@@ -0,0 +1,87 @@
+import sqlite3
+import threading
+
+import pytest
+
+from openrecall.connection import ConnectionPool
+
+
+@pytest.fixture
+def pool(tmp_path):
+    pool = ConnectionPool(str(tmp_path / "test.db"), max_idle_readers=2)
+    with pool.writer() as conn:
+        conn.execute("CREATE TABLE items (id INTEGER PRIMARY KEY, value TEXT)")
+    yield pool
+    pool.close()
+
+
+def test_writer_enables_wal_and_pragmas(pool):
+    with pool.writer() as conn:
+        assert conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+        assert conn.execute("PRAGMA synchronous").fetchone()[0] == 1  # NORMAL
+        assert conn.execute("PRAGMA temp_store").fetchone()[0] == 2  # MEMORY
+
+
+def test_writer_commits_and_rolls_back(pool):
+    with pool.writer() as conn:
+        conn.execute("INSERT INTO items (value) VALUES ('kept')")
+    with pytest.raises(RuntimeError):
+        with pool.writer() as conn:
+            conn.execute("INSERT INTO items (value) VALUES ('discarded')")
+            raise RuntimeError("boom")
+    with pool.reader() as conn:
+        assert conn.execute("SELECT value FROM items").fetchall() == [("kept",)]
+
+
+def test_readers_are_query_only_and_reused(pool):
+    with pool.reader() as conn:
+        first = conn
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute("INSERT INTO items (value) VALUES ('x')")
+    with pool.reader() as conn:
+        assert conn is first
+
+
+def test_read_during_open_write_transaction(pool):
+    with pool.writer() as conn:
+        conn.execute("INSERT INTO items (value) VALUES ('committed')")
+
+    writing = threading.Event()
+    done = threading.Event()
+
+    def write():
+        with pool.writer() as conn:
+            conn.execute("INSERT INTO items (value) VALUES ('pending')")
+            writing.set()
+            done.wait(5)
+
+    thread = threading.Thread(target=write)
+    thread.start()
+    writing.wait(5)
+    try:
+        # WAL readers see the last committed state without waiting for the writer
+        with pool.reader() as conn:
+            assert conn.execute("SELECT value FROM items").fetchall() == [("committed",)]
+    finally:
+        done.set()
+        thread.join()
+
+
+def test_immutable_pool_only_reads(tmp_path):
+    path = str(tmp_path / "sealed.db")
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE items (value TEXT)")
+    conn.execute("INSERT INTO items VALUES ('archived')")
+    conn.commit()
+    conn.close()
+
+    pool = ConnectionPool(path, immutable=True)
+    with pool.reader() as conn:
+        assert conn.execute("SELECT value FROM items").fetchall() == [("archived",)]
+        with pytest.raises(sqlite3.OperationalError):
+            conn.execute("INSERT INTO items VALUES ('x')")
+    with pytest.raises(sqlite3.OperationalError):
+        with pool.writer():
+            pass
+    pool.close()
+    assert not (tmp_path / "sealed.db-wal").exists()
@@ -1,6 +1,7 @@
 import unittest
 import sqlite3
 import os
+import shutil
 import tempfile
 import time
 import numpy as np
@@ -20,13 +21,52 @@ with patch('openrecall.config.db_path', mock_db_path):
     from openrecall.database import (
         create_db,
         insert_entry,
-        get_all_entries,
-        get_timestamps,
+        insert_entries,
+        NewEntry,
+        get_line_embeddings,
+        insert_line_embeddings,
+        get_embeddings_after,
+        get_entry_lines_after,
+        get_line_embeddings_after,
+        count_entries_needing_model,
+        get_entries_needing_model,
+        update_entry_embeddings,
+        apply_shard_embeddings,
+        get_titles_needing_embedding,
+        set_title_embeddings,
+        get_title_embeddings_after,
+        get_entry_titles_after,
+        keyword_search,
+        add_standing_query,
+        delete_standing_query,
+        get_entries_page,
+        iter_entries,
+        query_entries,
+        get_activity_digest,
+        get_facets,
+        get_shard_stats,
+        get_entry_batch,
+        get_frames,
+        get_hourly_counts,
+        get_ingest_version,
+        get_query_matches,
+        get_session,
+        get_sessions,
+        get_timeline_buckets,
+        get_timestamp_bounds,
+        EntryBatch,
+        seal_shards,
+        seek_timestamp,
+        get_unique_apps,
+        get_unique_languages,
+        tokenize,
         Entry,
     )
     # Also patch db_path within the database module itself if it was imported directly there
     import openrecall.database
+    import openrecall.text_store
     openrecall.database.db_path = mock_db_path
+    openrecall.database.shards_path = mock_db_path + "-shards"
 
 
 class TestDatabase(unittest.TestCase):
@@ -48,7 +88,11 @@ class TestDatabase(unittest.TestCase):
                 cls.conn.close()
         except Exception:
             pass # Ignore errors during cleanup
-        os.remove(cls.db_path)
+        openrecall.database.close_connections()
+        shutil.rmtree(openrecall.database.shards_path, ignore_errors=True)
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(cls.db_path + suffix):
+                os.remove(cls.db_path + suffix)
         # Clean up sys.path modification
         sys.path.pop(0)
 
@@ -58,7 +102,25 @@ class TestDatabase(unittest.TestCase):
         self.conn = sqlite3.connect(self.db_path)
         cursor = self.conn.cursor()
         cursor.execute("DELETE FROM entries")
+        cursor.execute("DELETE FROM entry_lines")
+        cursor.execute("DELETE FROM line_embeddings")
+        cursor.execute("DELETE FROM titles")
+        cursor.execute("DELETE FROM app_hourly")
+        cursor.execute("DELETE FROM token_hourly")
+        cursor.execute("DELETE FROM sessions")
+        cursor.execute("DELETE FROM standing_queries")
+        cursor.execute("DELETE FROM query_matches")
+        cursor.execute("DELETE FROM shard_embeddings")
+        cursor.execute("DELETE FROM apps")
+        cursor.execute("DELETE FROM languages")
+        cursor.execute("DELETE FROM text_lines")
+        cursor.execute("INSERT INTO entries_fts (entries_fts) VALUES ('delete-all')")
         self.conn.commit()
+        openrecall.database._invalidate_facets()
+        openrecall.database.standing_queries.reset()
+        openrecall.text_store.line_cache.clear()
+        openrecall.database.close_connections()
+        shutil.rmtree(openrecall.database.shards_path, ignore_errors=True)
         # No need to close here, will be handled by tearDown or next setUp potentially
 
     def tearDown(self):
@@ -95,14 +157,44 @@ class TestDatabase(unittest.TestCase):
         cursor.execute("SELECT * FROM entries WHERE id = ?", (inserted_id,))
         result = cursor.fetchone()
         self.assertIsNotNone(result)
-        # (id, app, title, text, timestamp, embedding_blob, language)
-        self.assertEqual(result[1], "TestApp")
-        self.assertEqual(result[2], "TestTitle")
-        self.assertEqual(result[3], "Test text")
+        # (id, app, title, text, timestamp, embedding_blob, language, ...)
+        self.assertIsNone(result[2])  # Read through title_id
+        self.assertIsNone(result[3])  # Text lives in the line store
+        self.assertEqual(get_entry_batch()[0].text, "Test text")
         self.assertEqual(result[4], ts)
         retrieved_embedding = np.frombuffer(result[5], dtype=np.float32)
         np.testing.assert_array_almost_equal(retrieved_embedding, embedding)
-        self.assertEqual(result[6], "en")
+        # App, language and title are stored as references to their tables
+        cursor.execute(
+            """SELECT apps.name, languages.name, titles.title FROM entries
+               JOIN apps ON apps.id = entries.app_id
+               JOIN languages ON languages.id = entries.language_id
+               JOIN titles ON titles.id = entries.title_id
+               WHERE entries.id = ?""",
+            (inserted_id,),
+        )
+        self.assertEqual(cursor.fetchone(), ("TestApp", "en", "TestTitle"))
+
+    def test_insert_entries_batch(self):
+        """Test that a batch is inserted in one call and duplicates are skipped."""
+        ts = int(time.time())
+        emb = np.array([0.1, 0.2], dtype=np.float32)
+        existing = insert_entry("Old", ts, emb, "App", "T", "en")
+        ids = insert_entries([
+            NewEntry("Dup of old", ts, emb, "App", "T", "en"),
+            NewEntry("A", ts + 1, emb, "App", "T", "en"),
+            NewEntry("Dup in batch", ts + 1, emb, "App", "T", "en"),
+            NewEntry("B", ts + 2, emb, "Other", "U", "en", model="m"),
+        ])
+        self.assertIsNone(ids[0])
+        self.assertIsNone(ids[2])
+        self.assertNotIn(None, (ids[1], ids[3]))
+        self.assertGreater(ids[3], ids[1])
+        self.assertGreater(ids[1], existing)
+
+        texts = {entry.id: entry.text for entry in get_entry_batch()}
+        self.assertEqual(texts, {existing: "Old", ids[1]: "A", ids[3]: "B"})
+        self.assertEqual(insert_entries([]), [])
 
     def test_insert_duplicate_timestamp(self):
         """Test inserting an entry with a duplicate timestamp (should be ignored)."""
@@ -123,16 +215,15 @@ class TestDatabase(unittest.TestCase):
         count = cursor.fetchone()[0]
         self.assertEqual(count, 1)
 
-        cursor.execute("SELECT text FROM entries WHERE timestamp = ?", (ts,))
-        text = cursor.fetchone()[0]
+        text = get_entry_batch()[0].text
         self.assertEqual(text, "First text") # Ensure the first one was kept
 
-    def test_get_all_entries_empty(self):
+    def test_get_entry_batch_empty(self):
         """Test getting entries from an empty database."""
-        entries = get_all_entries()
+        entries = list(get_entry_batch())
         self.assertEqual(entries, [])
 
-    def test_get_all_entries_multiple(self):
+    def test_get_entry_batch_multiple(self):
         """Test retrieving multiple entries."""
         ts1 = int(time.time())
         ts2 = ts1 + 10
@@ -145,7 +236,7 @@ class TestDatabase(unittest.TestCase):
         insert_entry("Text 2", ts2, emb2, "App2", "Title2", "en")
         insert_entry("Text 3", ts3, emb3, "App3", "Title3", "en")
 
-        entries = get_all_entries()
+        entries = list(get_entry_batch(include_embedding=True))
         self.assertEqual(len(entries), 3)
 
         # Entries should be ordered by timestamp DESC
@@ -165,26 +256,552 @@ class TestDatabase(unittest.TestCase):
         self.assertEqual(entries[2].text, "Text 3")
         np.testing.assert_array_almost_equal(entries[2].embedding, emb3)
 
-    def test_get_timestamps_empty(self):
-        """Test getting timestamps from an empty database."""
-        timestamps = get_timestamps()
-        self.assertEqual(timestamps, [])
+    def test_line_embeddings_roundtrip(self):
+        """Test storing and looking up cached line embeddings by hash."""
+        emb = np.array([0.5, 0.25], dtype=np.float32)
+        insert_line_embeddings([("hash-a", emb)])
+        # A second insert of the same hash must not overwrite the first
+        insert_line_embeddings([("hash-a", emb * 2)])
 
-    def test_get_timestamps_multiple(self):
-        """Test retrieving multiple timestamps."""
-        ts1 = int(time.time())
-        ts2 = ts1 + 10
-        ts3 = ts1 - 10
-        emb = np.array([0.1] * 5, dtype=np.float32) # Embedding content doesn't matter here
+        found = get_line_embeddings(["hash-a", "hash-missing"])
+        self.assertEqual(list(found), ["hash-a"])
+        np.testing.assert_array_almost_equal(found["hash-a"], emb)
+
+    def test_get_entry_batch_time_range_without_embedding(self):
+        """Test that a time-range read can skip the embedding column."""
+        ts = int(time.time())
+        insert_entry("In", ts, np.array([0.1], dtype=np.float32), "A", "T", "en")
+        insert_entry("Out", ts + 100, np.array([0.1], dtype=np.float32), "A", "T", "en")
+
+        entries = list(get_entry_batch(start_time=ts - 1, end_time=ts + 1, include_embedding=False))
+        self.assertEqual([entry.text for entry in entries], ["In"])
+        self.assertIsNone(entries[0].embedding)
+
+    def test_get_embeddings_after(self):
+        """Test incremental reads of embeddings in id order, by dimension."""
+        ts = int(time.time())
+        id1 = insert_entry("A", ts, np.array([1.0, 0.0], dtype=np.float32), "A", "A", "en")
+        id2 = insert_entry("B", ts + 1, np.array([0.0, 1.0], dtype=np.float32), "B", "B", "en")
+        insert_entry("C", ts + 2, np.array([1.0, 1.0, 1.0], dtype=np.float32), "C", "C", "en")
+
+        ids, matrix = get_embeddings_after(0, dim=2)
+        self.assertEqual(ids.tolist(), [id1, id2])
+        self.assertEqual(matrix.shape, (2, 2))
+
+        ids, matrix = get_embeddings_after(id1, dim=2)
+        self.assertEqual(ids.tolist(), [id2])
+        np.testing.assert_array_equal(matrix[0], [0.0, 1.0])
+
+    def test_embedding_store_sync_and_append(self):
+        """Test that the embedding store is rebuilt from the DB and then appended to."""
+        from openrecall.database import sync_embedding_store
+        from openrecall.embedding_store import EmbeddingStore
+
+        store = EmbeddingStore(tempfile.mkdtemp())
+        with patch("openrecall.database.embedding_store", store):
+            ts = int(time.time())
+            id1 = insert_entry("A", ts, np.array([1.0, 0.0], dtype=np.float32), "A", "A", "en", model="m")
+            insert_entry("B", ts + 1, np.array([1.0, 0.0, 0.0], dtype=np.float32), "B", "B", "en", model="m")
+            self.assertFalse(store.is_current("m", 2))
+
+            self.assertTrue(sync_embedding_store("m", 2))
+            self.assertTrue(store.is_current("m", 2))
+            id3 = insert_entry("C", ts + 2, np.array([0.0, 1.0], dtype=np.float32), "C", "C", "en", model="m")
+            ids, matrix = get_embeddings_after(0, dim=2, model="m")
+            self.assertIsInstance(matrix, np.memmap)
+            self.assertEqual(ids.tolist(), [id1, id3])
+            np.testing.assert_array_equal(matrix[1], [0.0, 1.0])
+
+            # An unchanged store passes the consistency check without a rebuild
+            with patch.object(store, "rebuild") as rebuild:
+                self.assertTrue(sync_embedding_store("m", 2))
+                rebuild.assert_not_called()
+
+            update_entry_embeddings([(id1, np.array([0.5, 0.5], dtype=np.float32), [])], "m")
+            self.assertFalse(store.is_current("m", 2))
+            ids, matrix = get_embeddings_after(0, dim=2, model="m")
+            np.testing.assert_array_equal(matrix[0], [0.5, 0.5])
+
+    def test_entries_page_and_iteration(self):
+        """Test keyset pagination, column selection and streaming iteration."""
+        ts = int(time.time())
+        emb = np.array([0.25, 0.5], dtype=np.float32)
+        for i in range(5):
+            insert_entry(f"Text {i}", ts + i, emb, "App", "T", "en")
+
+        page = get_entries_page(limit=2)
+        self.assertEqual([row["timestamp"] for row in page], [ts, ts + 1])
+        self.assertNotIn("embedding", page[0])
+        self.assertEqual(page[0]["text"], "Text 0")
 
-        insert_entry("T1", ts1, emb, "A1", "T1", "en")
-        insert_entry("T2", ts2, emb, "A2", "T2", "en")
-        insert_entry("T3", ts3, emb, "A3", "T3", "en")
+        page = get_entries_page(after_timestamp=ts + 1, limit=2, columns=["text", "embedding"])
+        self.assertEqual(set(page[0]), {"timestamp", "text", "embedding"})
+        np.testing.assert_array_equal(np.frombuffer(page[0]["embedding"], dtype=np.float32), emb)
 
-        timestamps = get_timestamps()
-        self.assertEqual(len(timestamps), 3)
-        # Timestamps should be ordered DESC
-        self.assertEqual(timestamps, [ts2, ts1, ts3])
+        with self.assertRaises(ValueError):
+            get_entries_page(columns=["text; DROP TABLE entries"])
+
+        rows = list(iter_entries(after_timestamp=ts, columns=["id"], page_size=2))
+        self.assertEqual([row["timestamp"] for row in rows], [ts + 1, ts + 2, ts + 3, ts + 4])
+
+    def test_facets_count_entries_and_refresh_on_insert(self):
+        """Test that app/language facets come from the dimension tables and stay current."""
+        ts = int(time.time())
+        emb = np.array([0.1], dtype=np.float32)
+        insert_entry("a", ts, emb, "Mail", "T", "en")
+        insert_entry("b", ts + 1, emb, "Mail", "T", "de")
+        self.assertEqual(get_facets("app"), [("Mail", 2)])
+        self.assertEqual(get_unique_languages(), ["de", "en"])
+
+        insert_entry("c", ts + 2, emb, "Browser", "T", "en")
+        self.assertEqual(get_facets("app"), [("Browser", 1), ("Mail", 2)])
+        self.assertEqual(get_unique_apps(), ["Browser", "Mail"])
+        self.assertEqual(dict(get_facets("language"))["en"], 2)
+
+    def test_create_db_moves_apps_and_languages_to_dimension_tables(self):
+        """Test that legacy app/language text is migrated to id references."""
+        self.conn.execute(
+            "INSERT INTO entries (app, title, text, timestamp, language) VALUES ('Legacy', 'T', 'x', 1, 'fr')"
+        )
+        self.conn.commit()
+
+        create_db()
+
+        row = self.conn.execute("SELECT app, language, app_id, language_id FROM entries").fetchone()
+        self.assertEqual(row[:2], (None, None))
+        self.assertIsNotNone(row[2])
+        self.assertEqual(get_facets("app"), [("Legacy", 1)])
+        entries = list(get_entry_batch())
+        self.assertEqual((entries[0].app, entries[0].language), ("Legacy", "fr"))
+
+    def test_tokenize(self):
+        """Test that digest tokens drop punctuation, digits and single letters."""
+        self.assertEqual(
+            tokenize("Hello, hello! Don't e-mail x 123 abc123 café"),
+            ["hello", "hello", "don't", "e-mail", "café"],
+        )
+
+    def test_activity_digest_from_rollups(self):
+        """Test that the digest sums the per-hour rollups maintained on insert."""
+        now = int(time.time())
+        emb = np.array([0.1], dtype=np.float32)
+        insert_entry("Invoice, invoice for ACME", now - 60, emb, "Mail", "T", "en")
+        insert_entry("invoice paid", now - 7200, emb, "Mail", "T", "en")
+        insert_entry("Sprint board", now - 120, emb, "Browser", "T", "en")
+        insert_entry("old invoice", now - 3 * 86400, emb, "Mail", "T", "en")
+        self.assertIsNotNone(insert_entry("no app", now - 4 * 86400, emb, None, "T", "en"))
+
+        day = get_activity_digest("day")
+        self.assertEqual(day["apps"], [("Mail", 2), ("Browser", 1)])
+        self.assertEqual(day["words"][0], ("invoice", 3))
+        week = get_activity_digest("week")
+        self.assertEqual(week["apps"][0], ("Mail", 3))
+        self.assertEqual(dict(week["words"])["invoice"], 4)
+        self.assertEqual(get_activity_digest("year"), {})
+
+    def test_create_db_backfills_rollups(self):
+        """Test that existing entries are counted when the rollups are created."""
+        now = int(time.time())
+        self.conn.execute(
+            "INSERT INTO entries (app, title, text, timestamp, language) VALUES ('App', 'T', 'alpha beta alpha', ?, 'en')",
+            (now,),
+        )
+        self.conn.execute("DROP TABLE app_hourly")
+        self.conn.execute("DROP TABLE token_hourly")
+        self.conn.commit()
+
+        create_db()
+
+        digest = get_activity_digest("day")
+        self.assertEqual(digest["apps"], [("App", 1)])
+        self.assertEqual(digest["words"], [("alpha", 2), ("beta", 1)])
+
+    def test_query_entries_filters_in_sql(self):
+        """Test the query builder's filters, ordering, limit and column selection."""
+        ts = int(time.time())
+        emb = np.array([0.1], dtype=np.float32)
+        insert_entry("a", ts, emb, "Mail", "T", "en")
+        insert_entry("b", ts + 10, emb, "Mail", "T", "de")
+        insert_entry("c", ts + 20, emb, "Browser", "T", "en")
+        insert_entry("d", ts + 30, emb, "Mail", "T", "en")
+
+        rows = query_entries(app="Mail", columns=["text"])
+        self.assertEqual(rows, [{"text": "d"}, {"text": "b"}, {"text": "a"}])
+        rows = query_entries(app="Mail", language="en", start_time=ts + 1, columns=["text", "app"])
+        self.assertEqual(rows, [{"text": "d", "app": "Mail"}])
+        rows = query_entries(end_time=ts + 20, limit=2, ascending=True, columns=["id", "timestamp"])
+        self.assertEqual([row["timestamp"] for row in rows], [ts, ts + 10])
+        self.assertEqual(query_entries(app="Unknown"), [])
+
+        plan = " ".join(
+            row[3] for row in self.conn.execute(
+                "EXPLAIN QUERY PLAN SELECT id FROM entries WHERE app_id = 1 AND timestamp >= 0 ORDER BY timestamp DESC"
+            )
+        )
+        self.assertIn("idx_app_timestamp", plan)
+
+    def test_keyword_search(self):
+        """Test BM25 keyword search over text and titles, restricted to candidates."""
+        ts = int(time.time())
+        emb = np.array([1.0, 0.0], dtype=np.float32)
+        id1 = insert_entry("Build failed with ERR-4021 in module", ts, emb, "Terminal", "make", "en")
+        id2 = insert_entry("All tests passed", ts + 1, emb, "Browser", "Ticket ERR-4021", "en")
+        id3 = insert_entry("Lunch menu", ts + 2, emb, "Mail", "Inbox", "en")
+
+        ids, scores = keyword_search("ERR-4021", 10)
+        self.assertEqual(set(ids.tolist()), {id1, id2})
+        self.assertTrue(np.all(np.diff(scores) <= 0))
+
+        ids, _ = keyword_search("ERR-4021", 10, candidate_ids=np.array([id2, id3]))
+        self.assertEqual(ids.tolist(), [id2])
+        ids, _ = keyword_search("ERR-4021", 1, candidate_ids=np.array([id3, id2, id1]))
+        self.assertEqual(len(ids), 1)
+        self.assertEqual(len(keyword_search("ERR-4021", 10, candidate_ids=np.array([], dtype=np.int64))[0]), 0)
+        # Only the best KEYWORD_SCAN_LIMIT matches are checked against the candidates
+        with patch("openrecall.database.KEYWORD_SCAN_LIMIT", 1):
+            best = keyword_search("ERR-4021", 1)[0].tolist()
+            other = ({id1, id2} - set(best)).pop()
+            self.assertEqual(keyword_search("ERR-4021", 10, candidate_ids=np.array([id1, id2]))[0].tolist(), best)
+            self.assertEqual(keyword_search("ERR-4021", 10, candidate_ids=np.array([other]))[0].tolist(), [other])
+        self.assertEqual(len(keyword_search('" OR *', 10)[0]), 0)
+        # A duplicate timestamp is neither stored nor indexed
+        self.assertIsNone(insert_entry("Lunch again", ts, emb, "Mail", "Inbox", "en"))
+        self.assertEqual(keyword_search("lunch", 10)[0].tolist(), [id3])
+
+    def test_text_is_stored_as_shared_lines(self):
+        """Test that repeated OCR lines are stored once and texts round-trip exactly."""
+        ts = int(time.time())
+        emb = np.array([0.1], dtype=np.float32)
+        texts = ["File  Edit\nHello world\n\nStatus: ok", "File  Edit\nHello again\n\nStatus: ok"]
+        for i, text in enumerate(texts):
+            insert_entry(text, ts + i, emb, "Editor", "T", "en")
+
+        lines = self.conn.execute("SELECT COUNT(*) FROM text_lines").fetchone()[0]
+        self.assertEqual(lines, 5)
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM entries WHERE text IS NOT NULL").fetchone()[0], 0)
+        entries = list(get_entry_batch())
+        self.assertEqual([entry.text for entry in entries], texts[::-1])
+        rows = query_entries(columns=["id", "text"], ascending=True)
+        self.assertEqual([row["text"] for row in rows], texts)
+        self.assertEqual(set(rows[0]), {"id", "text"})
+
+        # Each line counts the entries that use it
+        counts = self.conn.execute("SELECT ref_count FROM text_lines ORDER BY id").fetchall()
+        self.assertEqual([row[0] for row in counts], [2, 1, 2, 2, 1])
+
+    def test_create_db_moves_text_to_line_store(self):
+        """Test that legacy inline text is migrated and stays searchable."""
+        self.conn.execute(
+            "INSERT INTO entries (app, title, text, timestamp, language) VALUES ('App', 'T', 'quarterly report\ndraft', 7, 'en')"
+        )
+        self.conn.commit()
+
+        create_db()
+
+        row = self.conn.execute("SELECT text, text_line_ids FROM entries").fetchone()
+        self.assertIsNone(row[0])
+        self.assertEqual(len(row[1]), 8)
+        self.assertEqual([row[0] for row in self.conn.execute("SELECT ref_count FROM text_lines")], [1, 1])
+        self.assertEqual(get_entry_batch()[0].text, "quarterly report\ndraft")
+
+    def test_seal_shards_moves_past_months_and_reads_fan_out(self):
+        """Test that sealed entries leave the hot database but stay readable."""
+        now = int(time.time())
+        old = now - 90 * 86400
+        emb = np.array([1.0, 0.0], dtype=np.float32)
+        old_id = insert_entry("archived invoice\nfooter", old, emb, "Mail", "Inbox", "en", model="m")
+        new_id = insert_entry("current invoice\nfooter", now, emb, "Browser", "Tab", "en", model="m")
+
+        written = seal_shards(1, now=now)
+
+        self.assertEqual(len(written), 1)
+        self.assertEqual(os.stat(written[0]).st_mode & 0o222, 0)  # Read-only
+        hot_ids = [row[0] for row in self.conn.execute("SELECT id FROM entries")]
+        self.assertEqual(hot_ids, [new_id])
+        self.assertEqual(get_shard_stats()["entries"], 1)
+        self.assertEqual([entry.id for entry in get_entry_batch()], [new_id, old_id])
+        self.assertEqual(get_entry_batch()[1].text, "archived invoice\nfooter")
+        self.assertEqual(get_entry_batch().timestamps.tolist(), [now, old])
+        self.assertEqual(set(keyword_search("invoice", 10)[0].tolist()), {old_id, new_id})
+        self.assertEqual(keyword_search("archived", 10)[0].tolist(), [old_id])
+        rows = query_entries(app="Mail", columns=["id", "app"])
+        self.assertEqual(rows, [{"id": old_id, "app": "Mail"}])
+        rows = query_entries(limit=1, columns=["id"], ascending=True)
+        self.assertEqual(rows, [{"id": old_id}])
+        self.assertEqual(get_facets("app"), [("Browser", 1), ("Mail", 1)])
+        ids, _ = get_embeddings_after(0, 2, model="m")
+        self.assertEqual(ids.tolist(), [old_id, new_id])
+        self.assertEqual(get_entry_titles_after(0)[0].tolist(), [old_id, new_id])
+        # Lines only used by sealed entries leave the hot line store
+        self.assertEqual(self.conn.execute("SELECT COUNT(*) FROM text_lines").fetchone()[0], 2)
+        self.assertEqual(
+            [row[0] for row in self.conn.execute("SELECT ref_count FROM text_lines")], [1, 1]
+        )
+        self.assertEqual(seal_shards(1, now=now), [])
+
+    def test_reembedding_rewrites_sealed_shards(self):
+        """Test that sealed entries are re-embedded through the staging table."""
+        now = int(time.time())
+        emb = np.array([1.0, 0.0], dtype=np.float32)
+        old_id = insert_entry("archived\nfooter", now - 90 * 86400, emb, "Mail", "Inbox", "en", model="old")
+        new_id = insert_entry("current", now, emb, "Browser", "Tab", "en", model="old")
+        insert_line_embeddings([("line-a", np.array([0.0, 1.0], dtype=np.float32))])
+        [path] = seal_shards(1, now=now)
+
+        self.assertEqual(count_entries_needing_model("new"), 2)
+        self.assertEqual(get_entries_needing_model("new", 0, 10), [(old_id, "archived\nfooter"), (new_id, "current")])
+        updated = np.array([0.0, 1.0], dtype=np.float32)
+        self.assertTrue(update_entry_embeddings([(old_id, updated, ["line-a"])], "new"))
+        # Staged, so the job does not redo it, but the shard is untouched
+        self.assertEqual(count_entries_needing_model("new"), 1)
+        self.assertEqual(get_entries_needing_model("new", 0, 10), [(new_id, "current")])
+        self.assertEqual(get_embeddings_after(0, dim=2, model="new")[0].tolist(), [])
+
+        self.assertEqual(apply_shard_embeddings(), 1)
+        self.assertEqual(apply_shard_embeddings(), 0)
+        self.assertEqual(os.stat(path).st_mode & 0o222, 0)
+        ids, matrix = get_embeddings_after(0, dim=2, model="new")
+        self.assertEqual(ids.tolist(), [old_id])
+        np.testing.assert_array_equal(matrix[0], updated)
+        self.assertEqual(get_entry_lines_after(0)[0].tolist(), [old_id])
+        self.assertEqual(count_entries_needing_model("new"), 1)
+
+    def test_entry_batch_is_columnar_and_decodes_lazily(self):
+        """Test the columnar batch: arrays, lazy columns, subsets and shards."""
+        now = int(time.time())
+        emb = np.array([1.0, 0.0], dtype=np.float32)
+        old_id = insert_entry("old text\nshared", now - 90 * 86400, emb, "Mail", "Inbox", "en")
+        id1 = insert_entry("first\nshared", now, emb * 2, "Browser", "Docs", "de")
+        id2 = insert_entry("second", now + 1, emb * 3, "Browser", "Docs", None)
+        seal_shards(1, now=now)
+
+        batch = get_entry_batch(include_embedding=True)
+        self.assertIsInstance(batch, EntryBatch)
+        self.assertEqual(batch.ids.tolist(), [id2, id1, old_id])
+        self.assertEqual(batch.timestamps.dtype, np.int64)
+        self.assertEqual(batch.embeddings.shape, (3, 2))
+        self.assertEqual(batch._decoded, {})
+        self.assertEqual(batch.texts, ["second", "first\nshared", "old text\nshared"])
+        self.assertEqual(batch.apps, ["Browser", "Browser", "Mail"])
+        self.assertEqual(batch.languages, [None, "de", "en"])
+        self.assertEqual(batch.titles, ["Docs", "Docs", "Inbox"])
+
+        ranked = get_entry_batch().take_ids(np.array([old_id, 999, id1]))
+        self.assertEqual(ranked.ids.tolist(), [old_id, id1])
+        self.assertEqual(ranked.texts, ["old text\nshared", "first\nshared"])
+        self.assertIsNone(ranked.embeddings)
+        entry = list(ranked)[1]
+        self.assertEqual((entry.id, entry.app, entry.title, entry.timestamp), (id1, "Browser", "Docs", now))
+
+        filtered = get_entry_batch(app="Browser", limit=1, ascending=True)
+        self.assertEqual(filtered.ids.tolist(), [id1])
+        self.assertEqual(len(get_entry_batch(app="Nope")), 0)
+        self.assertEqual(len(get_entry_batch().take_ids(np.array([id1]))), 1)
+
+    def test_entry_batch_reads_only_given_ids(self):
+        """Test post-filtering ranked ids and the hourly counts used by the planner."""
+        now = int(time.time())
+        emb = np.array([1.0, 0.0], dtype=np.float32)
+        id1 = insert_entry("one", now, emb, "Browser", "Docs", "en")
+        id2 = insert_entry("two", now + 1, emb, "Mail", "Inbox", "en")
+        id3 = insert_entry("three", now + 2, emb, "Browser", "Docs", "en")
+
+        batch = get_entry_batch(app="Browser", entry_ids=np.array([id2, id3, 999]))
+        self.assertEqual(batch.ids.tolist(), [id3])
+        self.assertEqual(len(get_entry_batch(entry_ids=np.array([], dtype=np.int64))), 0)
+        self.assertEqual(get_entry_batch(entry_ids=np.array([id1, id2])).ids.tolist(), [id2, id1])
+
+        hours, counts = get_hourly_counts()
+        self.assertEqual(int(counts.sum()), 3)
+        self.assertTrue(np.all(np.diff(hours) > 0))
+
+    def test_sessions_are_extended_at_insert(self):
+        """Test that consecutive frames of a window are grouped into sessions."""
+        emb = np.array([1.0, 0.0], dtype=np.float32)
+        t = 1_700_000_000
+        insert_entry("a", t, emb, "Editor", "main.py", "en")
+        rich = insert_entry("a\nb\nc", t + 10, emb, "Editor", "main.py", "en")
+        insert_entry("a\nb", t + 20, emb, "Editor", "main.py", "en")
+        insert_entry("x", t + 30, emb, "Browser", "Docs", "en")
+        # Same window again, but after a long pause
+        insert_entry("x", t + 30 + openrecall.database.SESSION_GAP + 1, emb, "Browser", "Docs", "en")
+
+        sessions = get_sessions(ascending=True)
+        self.assertEqual(
+            [(s.app, s.title, s.start_time, s.end_time, s.frame_count) for s in sessions],
+            [
+                ("Editor", "main.py", t, t + 20, 3),
+                ("Browser", "Docs", t + 30, t + 30, 1),
+                ("Browser", "Docs", t + 331, t + 331, 1),
+            ],
+        )
+        self.assertEqual((sessions[0].entry_id, sessions[0].entry_timestamp), (rich, t + 10))
+        self.assertEqual(get_session(sessions[1].id), sessions[1])
+        self.assertIsNone(get_session(12345))
+
+        in_range = get_sessions(start_time=t + 15, end_time=t + 30)
+        self.assertEqual([s.app for s in in_range], ["Browser", "Editor"])
+        self.assertEqual([s.id for s in get_sessions(app="Editor")], [sessions[0].id])
+        self.assertEqual(len(get_sessions(limit=1)), 1)
+
+        # A database without the table gets it filled from existing entries
+        self.conn.execute("DROP TABLE sessions")
+        self.conn.commit()
+        create_db()
+        self.assertEqual(
+            [(s.app, s.frame_count) for s in get_sessions(ascending=True)],
+            [("Editor", 3), ("Browser", 1), ("Browser", 1)],
+        )
+
+    def test_standing_queries_match_new_entries(self):
+        """Test that inserted entries are matched against saved searches."""
+        received = []
+        openrecall.database.standing_queries.add_listener(received.extend)
+        self.addCleanup(openrecall.database.standing_queries.remove_listener, received.extend)
+        invoice = add_standing_query(
+            "invoices", "invoice", np.array([1.0, 0.0], dtype=np.float32), "m",
+            threshold=0.8, keywords="4711",
+        )
+        other = add_standing_query("other", "x", np.array([0.0, 1.0], dtype=np.float32), "m")
+        now = int(time.time())
+        emb = np.array([1.0, 0.1], dtype=np.float32)
+        match_id = insert_entry("Invoice 4711", now, emb, "Mail", "Inbox", "en", model="m")
+        insert_entry("Invoice 4712", now + 1, emb, "Mail", "Inbox", "en", model="m")
+        insert_entry("Invoice 4711", now + 2, emb, "Mail", "Inbox", "en", model="other")
+
+        matches = get_query_matches(invoice)
+        self.assertEqual([(m.entry_id, m.timestamp) for m in matches], [(match_id, now)])
+        self.assertGreater(matches[0].score, 0.99)
+        self.assertEqual(received, matches)
+        self.assertEqual(get_query_matches(other), [])
+        self.assertEqual(get_query_matches(after_timestamp=now), [])
+
+        # Queries saved later match the next entries, not history
+        late = add_standing_query("late", "y", np.array([1.0, 0.0], dtype=np.float32), "m")
+        self.assertEqual(get_query_matches(late), [])
+        late_id = insert_entry("more", now + 3, emb, "Mail", "Inbox", "en", model="m")
+        self.assertEqual([m.entry_id for m in get_query_matches(late)], [late_id])
+
+        self.assertTrue(delete_standing_query(late))
+        self.assertFalse(delete_standing_query(late))
+        self.assertEqual(get_query_matches(late), [])
+
+    def test_timeline_buckets_frames_and_seek(self):
+        """Test the bucketed timeline reads across the hot database and shards."""
+        self.assertIsNone(get_timestamp_bounds())
+        self.assertIsNone(seek_timestamp(0))
+        now = int(time.time())
+        hour = now // 3600 * 3600
+        old = hour - 90 * 86400
+        emb = np.array([1.0, 0.0], dtype=np.float32)
+        old_id = insert_entry("old", old, emb, "Mail", "Inbox", "en")
+        ids = [insert_entry(f"t{i}", hour + offset, emb, "Editor", "main.py", "en")
+               for i, offset in enumerate((0, 30, 70, 3601))]
+        seal_shards(1, now=hour + 3601)
+
+        self.assertEqual(get_timestamp_bounds(), (old, hour + 3601))
+        self.assertEqual(
+            get_timeline_buckets("hour", start_time=hour),
+            [(hour, 3), (hour + 3600, 1)],
+        )
+        self.assertEqual(
+            get_timeline_buckets("minute", start_time=hour - 60),
+            [(hour, 2), (hour + 60, 1), (hour + 3600, 1)],
+        )
+        days = get_timeline_buckets("day")
+        self.assertEqual(sum(count for _, count in days), 5)
+        self.assertEqual(days[0], (old // 86400 * 86400, 1))
+        shifted = get_timeline_buckets("minute", start_time=hour, end_time=hour + 70, utc_offset=1800 + 30)
+        self.assertEqual(shifted, [(hour - 30, 1), (hour + 30, 2)])
+
+        frame_ids, timestamps = get_frames(start_time=hour, end_time=hour + 100)
+        self.assertEqual(frame_ids.tolist(), ids[:3])
+        frame_ids, timestamps = get_frames(limit=2, ascending=True)
+        self.assertEqual(frame_ids.tolist(), [old_id, ids[0]])
+        frame_ids, timestamps = get_frames(end_time=hour + 3600, limit=2, ascending=False)
+        self.assertEqual(timestamps.tolist(), [hour + 70, hour + 30])
+
+        self.assertEqual(seek_timestamp(hour + 40), (ids[1], hour + 30))
+        self.assertEqual(seek_timestamp(hour + 40, "after"), (ids[2], hour + 70))
+        self.assertEqual(seek_timestamp(hour - 1, "before"), (old_id, old))
+        self.assertIsNone(seek_timestamp(hour + 4000, "after"))
+
+    def test_ingest_version_tracks_changes(self):
+        """Test the counters used to validate cached search results."""
+        epoch, version, last_id = get_ingest_version()
+        now = int(time.time())
+        emb = np.array([1.0, 0.0], dtype=np.float32)
+        id1 = insert_entry("one", now, emb, "Mail", "Inbox", "en")
+        id2 = insert_entry("two", now + 1, emb, "Mail", "Inbox", "en")
+        self.assertEqual(get_ingest_version(), (epoch, version + 2, id2))
+        self.assertEqual(get_entry_batch(after_id=id1).ids.tolist(), [id2])
+        self.assertEqual(len(get_entry_batch(app="Browser", after_id=0)), 0)
+
+        insert_entry("dup", now, emb, "Mail", "Inbox", "en")
+        self.assertEqual(get_ingest_version().version, version + 2)
+        update_entry_embeddings([(id1, emb, [])], "m")
+        self.assertEqual(get_ingest_version(), (epoch + 1, version + 3, id2))
+
+    def test_entry_lines_reference_stored_line_embeddings(self):
+        """Test that insert_entry records an entry's stored lines for line search."""
+        insert_line_embeddings([
+            ("line-x", np.array([1.0, 0.0], dtype=np.float32)),
+            ("line-y", np.array([0.0, 1.0], dtype=np.float32)),
+        ])
+        line_ids, matrix = get_line_embeddings_after(0, dim=2)
+        rowids = dict(self.conn.execute("SELECT hash, rowid FROM line_embeddings"))
+
+        ts = int(time.time())
+        entry_id = insert_entry(
+            "x\ny", ts, np.array([0.5, 0.5], dtype=np.float32), "A", "T", "en",
+            line_hashes=["line-y", "line-x", "line-unknown"],
+        )
+
+        entry_ids, offsets, refs = get_entry_lines_after(0)
+        self.assertEqual(entry_ids.tolist(), [entry_id])
+        self.assertEqual(offsets.tolist(), [0])
+        self.assertEqual(sorted(refs.tolist()), sorted([rowids["line-x"], rowids["line-y"]]))
+        self.assertTrue(set(refs.tolist()) <= set(line_ids.tolist()))
+        self.assertEqual(get_entry_lines_after(entry_id)[0].tolist(), [])
+
+    def test_reembedding_helpers(self):
+        """Test selecting and updating entries embedded by another model."""
+        ts = int(time.time())
+        old_id = insert_entry("old", ts, np.array([1.0, 0.0], dtype=np.float32), "A", "T", "en", model="old")
+        new_id = insert_entry("new", ts + 1, np.array([0.0, 1.0], dtype=np.float32), "A", "T", "en", model="new")
+
+        self.assertEqual(count_entries_needing_model("new"), 1)
+        self.assertEqual(get_entries_needing_model("new", 0, 10), [(old_id, "old")])
+        self.assertEqual(get_entries_needing_model("new", old_id, 10), [])
+
+        self.assertTrue(update_entry_embeddings([(old_id, np.array([0.6, 0.8], dtype=np.float32), [])], "new"))
+
+        self.assertEqual(count_entries_needing_model("new"), 0)
+        ids, matrix = get_embeddings_after(0, dim=2, model="new")
+        self.assertEqual(ids.tolist(), [old_id, new_id])
+        np.testing.assert_array_almost_equal(matrix[0], [0.6, 0.8])
+
+    def test_titles_are_stored_once_and_embedded_lazily(self):
+        """Test the distinct (app, title) table and its embeddings."""
+        ts = int(time.time())
+        emb = np.array([0.1, 0.2], dtype=np.float32)
+        id1 = insert_entry("a", ts, emb, "Mail", "Inbox", "en")
+        id2 = insert_entry("b", ts + 1, emb, "Mail", "Inbox", "en")
+        id3 = insert_entry("c", ts + 2, emb, "Code", "main.py", "en")
+
+        pending = get_titles_needing_embedding("m", 10)
+        self.assertEqual([(app, title) for _, app, title in pending], [("Mail", "Inbox"), ("Code", "main.py")])
+        inbox_id, code_id = pending[0][0], pending[1][0]
+
+        entry_ids, title_ids = get_entry_titles_after(0)
+        self.assertEqual(entry_ids.tolist(), [id1, id2, id3])
+        self.assertEqual(title_ids.tolist(), [inbox_id, inbox_id, code_id])
+
+        set_title_embeddings([(inbox_id, np.array([1.0, 0.0], dtype=np.float32))], "m")
+        self.assertEqual([row[0] for row in get_titles_needing_embedding("m", 10)], [code_id])
+        ids, matrix = get_title_embeddings_after(0, dim=2, model="m")
+        self.assertEqual(ids.tolist(), [inbox_id])
+        np.testing.assert_array_equal(matrix[0], [1.0, 0.0])
 
 
 if __name__ == '__main__':
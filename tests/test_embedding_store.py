@@ -0,0 +1,73 @@
+import numpy as np
+import pytest
+
+from openrecall.embedding_store import EmbeddingStore
+
+
+def _rows(ids, dim=4, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.array(ids, dtype=np.int64), rng.standard_normal((len(ids), dim)).astype(np.float32)
+
+
+def test_rebuild_and_load_zero_copy(tmp_path):
+    store = EmbeddingStore(str(tmp_path / "store"))
+    ids, matrix = _rows([1, 2, 5])
+    assert store.rebuild("m", 4, [(ids[:2], matrix[:2]), (ids[2:], matrix[2:])]) == 3
+
+    loaded_ids, loaded = store.load()
+    assert isinstance(loaded, np.memmap)
+    assert loaded_ids.tolist() == [1, 2, 5]
+    np.testing.assert_array_equal(loaded, matrix)
+
+    after_ids, after = store.after(1)
+    assert after_ids.tolist() == [2, 5]
+    np.testing.assert_array_equal(after, matrix[1:])
+
+    reopened = EmbeddingStore(str(tmp_path / "store"))
+    assert (reopened.model, reopened.dim, len(reopened)) == ("m", 4, 3)
+    assert not reopened.is_verified
+
+
+def test_append_only_when_verified_and_in_order(tmp_path):
+    store = EmbeddingStore(str(tmp_path / "store"))
+    ids, matrix = _rows([1, 2])
+    store.rebuild("m", 4, [(ids, matrix)])
+
+    store.append(3, np.ones(4), "m")
+    store.append(4, np.ones(4), "other-model")
+    store.append(5, np.ones(3), "m")
+    assert store.load()[0].tolist() == [1, 2, 3]
+
+    store.append(2, np.ones(4), "m")  # already stored
+    assert store.is_verified
+    store.rebuild("m", 4, [_rows([1, 3])])
+    store.append(2, np.ones(4), "m")  # out of order
+    assert not store.is_verified
+    assert not store.is_current("m", 4)
+
+
+def test_verify(tmp_path):
+    store = EmbeddingStore(str(tmp_path / "store"))
+    store.rebuild("m", 4, [_rows([1, 2, 3])])
+    assert store.verify("m", 4, 3, 1, 3)
+    assert not store.verify("m", 4, 4, 1, 4)
+    assert not store.verify("other-model", 4, 3, 1, 3)
+
+
+def test_partial_append_is_ignored_and_truncated(tmp_path):
+    store = EmbeddingStore(str(tmp_path / "store"))
+    store.rebuild("m", 4, [_rows([1])])
+    with open(store.vectors_path, "ab") as f:
+        f.write(np.ones(4, dtype=np.float32).tobytes())  # vector without its id
+    assert len(store) == 1
+
+    store.append(2, np.full(4, 2.0), "m")
+    ids, matrix = store.load()
+    assert ids.tolist() == [1, 2]
+    np.testing.assert_array_equal(matrix[1], np.full(4, 2.0))
+
+
+def test_model_name_too_long(tmp_path):
+    store = EmbeddingStore(str(tmp_path / "store"))
+    with pytest.raises(ValueError):
+        store.rebuild("m" * 300, 4, [])
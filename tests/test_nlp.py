@@ -1,5 +1,11 @@
+import json
 import pytest
 import numpy as np
+import torch
+from unittest import mock
+
+from openrecall import nlp
+from openrecall.cache import LRUCache
 from openrecall.nlp import cosine_similarity
 
 
@@ -39,3 +45,246 @@ def test_cosine_similarity_zero_vector():
     b = np.array([1, 0, 0])
     result = cosine_similarity(a, b)
     assert result == 0.0
+
+
+def test_get_embedding_encodes_each_line_once():
+    fake_model = mock.Mock()
+    fake_model.encode.side_effect = lambda lines: np.array(
+        [[float(len(line)), 1.0] for line in lines], dtype=np.float32
+    )
+    with mock.patch.object(nlp, "model", fake_model), mock.patch.object(
+        nlp, "persist_line_cache", False
+    ), mock.patch.object(nlp, "line_cache", LRUCache(100)):
+        first = nlp.get_embedding("File  Edit\nhello\n")
+        second = nlp.get_embedding("File Edit\nhello world\n")
+
+    encoded = [line for call in fake_model.encode.call_args_list for line in call.args[0]]
+    assert encoded == ["File Edit", "hello", "hello world"]
+    np.testing.assert_allclose(first, [7.0, 1.0])
+    np.testing.assert_allclose(second, [10.0, 1.0])
+
+
+def test_get_query_embedding_is_cached():
+    with mock.patch.object(nlp, "query_cache", LRUCache(10)), mock.patch.object(
+        nlp, "get_embedding", return_value=np.array([1.0, 2.0], dtype=np.float32)
+    ) as get_embedding:
+        nlp.get_query_embedding("invoice  4711")
+        nlp.get_query_embedding(" invoice 4711 ")
+        assert get_embedding.call_count == 1
+        assert nlp.query_cache.stats()["hits"] == 1
+
+
+def test_get_query_embedding_skips_zero_vectors():
+    with mock.patch.object(nlp, "query_cache", LRUCache(10)), mock.patch.object(
+        nlp, "get_embedding", return_value=np.zeros(2, dtype=np.float32)
+    ):
+        nlp.get_query_embedding("anything")
+        assert len(nlp.query_cache) == 0
+
+
+def test_embedding_index_top_k():
+    index = nlp.EmbeddingIndex(dim=2, capacity=1)
+    index.add(np.array([1, 2]), np.array([[1.0, 0.0], [3.0, 4.0]]))
+    index.add(np.array([3]), np.array([[0.0, 5.0]]))
+
+    assert len(index) == 3
+    assert index.last_id == 3
+
+    ids, scores = index.search(np.array([0.0, 2.0]), k=2)
+    assert ids.tolist() == [3, 2]
+    np.testing.assert_allclose(scores, [1.0, 0.8], rtol=1e-6)
+
+
+def test_embedding_index_candidate_filter():
+    index = nlp.EmbeddingIndex(dim=2)
+    index.add(np.array([1, 2, 3]), np.array([[1.0, 0.0], [0.6, 0.8], [0.0, 1.0]]))
+
+    ids, _ = index.search(np.array([0.0, 1.0]), k=10, candidate_ids=np.array([1, 2]))
+    assert ids.tolist() == [2, 1]
+
+
+def test_embedding_index_sync_fetches_only_new_rows():
+    index = nlp.EmbeddingIndex(dim=2)
+    fetch = mock.Mock(return_value=(np.array([4, 7]), np.ones((2, 2))))
+    assert index.sync(fetch) == 2
+    fetch.assert_called_once_with(0)
+
+    fetch.return_value = (np.array([], dtype=np.int64), np.empty((0, 2)))
+    assert index.sync(fetch) == 0
+    fetch.assert_called_with(7)
+
+
+def test_embedding_index_rejects_wrong_dimension():
+    index = nlp.EmbeddingIndex(dim=3)
+    with pytest.raises(ValueError):
+        index.add(np.array([1]), np.ones((1, 2)))
+
+
+def _line_index():
+    index = nlp.MultiVectorIndex(dim=2)
+    index.lines.add(
+        np.array([10, 11, 12]), np.array([[1.0, 0.0], [0.0, 1.0], [0.6, 0.8]])
+    )
+    # Entry 1 has lines 10 and 11, entry 2 has line 12, entry 3 only an
+    # unknown line and is therefore skipped.
+    index.add(np.array([1, 2, 3]), np.array([0, 2, 3]), np.array([10, 11, 12, 99]))
+    return index
+
+
+def test_multi_vector_index_max_sim():
+    index = _line_index()
+    assert len(index) == 2
+    assert index.last_id == 2
+
+    ids, scores = index.search(np.array([0.0, 1.0]), k=10)
+    assert ids.tolist() == [1, 2]
+    np.testing.assert_allclose(scores, [1.0, 0.8], rtol=1e-6)
+
+
+def test_multi_vector_index_top_n_mean():
+    index = _line_index()
+    ids, scores = index.search(np.array([0.0, 1.0]), k=10, reduce="top_n", top_n=2)
+    assert ids.tolist() == [2, 1]
+    np.testing.assert_allclose(scores, [0.8, 0.5], rtol=1e-6)
+
+
+def test_multi_vector_index_candidates_and_unknown_reduce():
+    index = _line_index()
+    ids, _ = index.search(np.array([0.0, 1.0]), candidate_ids=np.array([2]))
+    assert ids.tolist() == [2]
+    with pytest.raises(ValueError):
+        index.search(np.array([0.0, 1.0]), reduce="median")
+
+
+def test_get_line_hashes_deduplicates_normalized_lines():
+    hashes = nlp.get_line_hashes("a  b\n\na b\nc\n")
+    assert hashes == [nlp.line_hash("a b"), nlp.line_hash("c")]
+
+
+def test_embed_texts_pools_lines_across_texts():
+    fake_model = mock.Mock()
+    fake_model.encode.side_effect = lambda lines: np.array(
+        [[float(len(line)), 1.0] for line in lines], dtype=np.float32
+    )
+    with mock.patch.object(nlp, "model", fake_model), mock.patch.object(
+        nlp, "persist_line_cache", False
+    ), mock.patch.object(nlp, "line_cache", LRUCache(100)), mock.patch.object(
+        nlp, "EMBEDDING_DIM", 2
+    ):
+        embeddings, hashes = nlp.embed_texts(["ab\ncdef", "", "cdef"])
+
+    fake_model.encode.assert_called_once_with(["ab", "cdef"])
+    np.testing.assert_allclose(embeddings, [[3.0, 1.0], [0.0, 0.0], [4.0, 1.0]])
+    assert hashes[1] == []
+    assert hashes[2] == [nlp.line_hash("cdef")]
+
+
+def test_title_index_blends_title_and_text_scores():
+    text_index = nlp.EmbeddingIndex(dim=2)
+    text_index.add(np.array([1, 2, 3]), np.array([[1.0, 0.0], [0.8, 0.6], [0.0, 1.0]]))
+    title_index = nlp.TitleIndex(dim=2)
+    title_index.titles.add(np.array([7, 8]), np.array([[0.0, 1.0], [1.0, 0.0]]))
+    # Entry 3 points to a title that has no embedding yet
+    title_index.add(np.array([1, 2, 3]), np.array([7, 8, 9]))
+
+    scores = title_index.entry_scores(np.array([1.0, 0.0]), np.array([1, 2, 3, 4]))
+    np.testing.assert_allclose(scores, [0.0, 1.0, 0.0, 0.0])
+
+    ids, blended = title_index.rank(np.array([1.0, 0.0]), text_index, title_weight=0.5)
+    assert ids.tolist() == [2, 1, 3]
+    np.testing.assert_allclose(blended, [0.9, 0.5, 0.0], atol=1e-6)
+
+    ids, _ = title_index.rank(np.array([1.0, 0.0]), text_index, candidate_ids=np.array([1, 3]))
+    assert ids.tolist() == [1, 3]
+
+
+def test_embed_new_titles_embeds_each_pending_title_once():
+    pending = [[(1, "Mail", "Inbox"), (2, "Code", "main.py")], []]
+    with mock.patch.object(nlp, "model", mock.Mock()), mock.patch.object(
+        nlp, "get_titles_needing_embedding", side_effect=pending
+    ), mock.patch.object(
+        nlp, "embed_texts", return_value=(np.ones((2, 2), dtype=np.float32), [[], []])
+    ) as embed_texts, mock.patch.object(nlp, "set_title_embeddings") as store:
+        assert nlp.embed_new_titles() == 2
+
+    embed_texts.assert_called_once_with(["Mail Inbox", "Code main.py"])
+    assert [item[0] for item in store.call_args.args[0]] == [1, 2]
+
+
+class _TinyEncoder(torch.nn.Module):
+    """A stand-in sentence encoder with a single linear layer."""
+
+    def __init__(self):
+        super().__init__()
+        torch.manual_seed(0)
+        self.linear = torch.nn.Linear(16, 8)
+
+    def encode(self, sentences):
+        features = torch.stack(
+            [torch.randn(16, generator=torch.Generator().manual_seed(len(s))) for s in sentences]
+        )
+        with torch.no_grad():
+            return self.linear(features).numpy()
+
+
+def test_quantize_model_converts_linear_layers():
+    quantized = nlp.quantize_model(_TinyEncoder())
+    assert not isinstance(quantized.linear, torch.nn.Linear)
+    assert "quantized" in type(quantized.linear).__module__
+
+
+def test_embedding_agreement():
+    float_model = _TinyEncoder()
+    identical = nlp.embedding_agreement(float_model, float_model)
+    assert identical["mean"] == pytest.approx(1.0)
+    assert identical["min"] == pytest.approx(1.0)
+
+    quantized = nlp.embedding_agreement(float_model, nlp.quantize_model(float_model))
+    assert 0.9 < quantized["min"] <= quantized["mean"] <= 1.0 + 1e-6
+
+
+def test_get_quantized_model_records_agreement(tmp_path):
+    with mock.patch.object(nlp, "model_cache_path", str(tmp_path)), \
+            mock.patch.object(nlp, "get_model", return_value=_TinyEncoder()):
+        first = nlp.get_quantized_model("tiny")
+        record = json.loads((tmp_path / ("tiny" + nlp.QUANTIZED_AGREEMENT_SUFFIX)).read_text())
+        assert record["passed"] is True
+        assert 0.9 < record["min"] <= record["mean"]
+        with mock.patch.object(nlp, "embedding_agreement") as agreement:
+            second = nlp.get_quantized_model("tiny")
+            agreement.assert_not_called()
+    assert type(second.linear) is type(first.linear)
+    x = torch.ones(1, 16)
+    assert torch.equal(second.linear(x), first.linear(x))
+
+
+def test_get_quantized_model_rechecks_unreadable_record(tmp_path):
+    marker_file = tmp_path / ("tiny" + nlp.QUANTIZED_AGREEMENT_SUFFIX)
+    marker_file.write_text("not json")
+    with mock.patch.object(nlp, "model_cache_path", str(tmp_path)), \
+            mock.patch.object(nlp, "get_model", return_value=_TinyEncoder()):
+        model = nlp.get_quantized_model("tiny")
+    assert "quantized" in type(model.linear).__module__
+    assert json.loads(marker_file.read_text())["passed"] is True
+
+
+def test_get_quantized_model_falls_back_on_disagreement(tmp_path):
+    float_model = _TinyEncoder()
+    with mock.patch.object(nlp, "model_cache_path", str(tmp_path)), \
+            mock.patch.object(nlp, "get_model", return_value=float_model):
+        with mock.patch.object(nlp, "embedding_agreement", return_value={"mean": 0.5, "min": 0.1}):
+            assert nlp.get_quantized_model("tiny") is float_model
+        # The failed check is recorded, so it is not repeated
+        with mock.patch.object(nlp, "embedding_agreement") as agreement:
+            assert nlp.get_quantized_model("tiny") is float_model
+            agreement.assert_not_called()
+    record = json.loads((tmp_path / ("tiny" + nlp.QUANTIZED_AGREEMENT_SUFFIX)).read_text())
+    assert record == {"passed": False, "mean": 0.5, "min": 0.1}
+
+
+def test_reciprocal_rank_fusion():
+    fused = nlp.reciprocal_rank_fusion([np.array([1, 2, 3]), np.array([3, 1, 4])])
+    # 1 and 3 appear in both rankings; 1 has the better combined rank
+    assert fused.tolist() == [1, 3, 2, 4]
+    assert nlp.reciprocal_rank_fusion([np.array([5]), np.array([], dtype=np.int64)], limit=1).tolist() == [5]
+    assert len(nlp.reciprocal_rank_fusion([])) == 0
@@ -0,0 +1,78 @@
+import numpy as np
+
+from openrecall import planner
+from openrecall.planner import FILTER_FIRST, VECTOR_FIRST, QueryTrace, SearchPlanner, SelectivityStats
+
+HOUR = 3600
+
+
+def make_stats():
+    # 1000 entries over 10 hours: 900 in "Browser", 10 in "Mail"
+    return SelectivityStats(
+        {"Browser": 900, "Editor": 90, "Mail": 10},
+        {"en": 500, "de": 500},
+        np.arange(100, 110, dtype=np.int64),
+        np.full(10, 100, dtype=np.int64),
+    )
+
+
+def test_selectivity_combines_filters_independently():
+    stats = make_stats()
+    assert stats.total == 1000
+    assert stats.selectivity() == 1.0
+    assert stats.selectivity(app="Browser") == 0.9
+    assert stats.selectivity(app="Browser", language="de") == 0.45
+    assert stats.selectivity(app="Unknown") == 0.0
+    # Hours 100 to 101 inclusive hold 200 of the entries
+    assert stats.selectivity(start_time=100 * HOUR, end_time=101 * HOUR + 59) == 0.2
+    assert stats.selectivity(start_time=200 * HOUR) == 0.0
+    assert stats.selectivity(end_time=99 * HOUR) == 0.0
+
+
+def test_planner_picks_the_cheaper_strategy():
+    loads = []
+
+    def load():
+        loads.append(1)
+        return make_stats()
+
+    search_planner = SearchPlanner(load, ttl=60)
+    plan = search_planner.plan(10)
+    assert plan.strategy == VECTOR_FIRST and plan.fetch_k == 10
+
+    broad = search_planner.plan(10, app="Browser")
+    assert broad.strategy == VECTOR_FIRST
+    assert broad.fetch_k == 23  # 10 results / 0.9 selectivity, overfetched twice
+    assert broad.costs[VECTOR_FIRST] < broad.costs[FILTER_FIRST]
+
+    narrow = search_planner.plan(10, app="Mail")
+    assert narrow.strategy == FILTER_FIRST
+    assert narrow.estimated_rows == 10
+
+    assert search_planner.plan(10, app="Unknown").strategy == FILTER_FIRST
+    assert len(loads) == 1
+
+
+def test_planner_reloads_expired_stats(monkeypatch):
+    loads = []
+    search_planner = SearchPlanner(lambda: loads.append(1) or make_stats(), ttl=60)
+    clock = [1000.0]
+    monkeypatch.setattr(planner.time, "monotonic", lambda: clock[0])
+    search_planner.plan(10)
+    clock[0] += 30
+    search_planner.plan(10)
+    clock[0] += 31
+    search_planner.plan(10)
+    assert len(loads) == 2
+
+
+def test_query_trace_records_stages():
+    trace = QueryTrace()
+    with trace.stage("filter") as stage:
+        stage["rows"] = 3
+    with trace.stage("rank"):
+        pass
+    report = trace.to_dict()
+    assert [stage["stage"] for stage in report["stages"]] == ["filter", "rank"]
+    assert report["stages"][0]["rows"] == 3
+    assert report["total_ms"] >= 0
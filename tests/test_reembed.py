@@ -0,0 +1,61 @@
+import numpy as np
+from unittest import mock
+
+from openrecall import reembed
+from openrecall.reembed import ReembedJob
+
+
+def _fake_embed_texts(texts):
+    return np.ones((len(texts), 2), dtype=np.float32), [["h"] for _ in texts]
+
+
+def test_reembed_job_processes_all_chunks():
+    chunks = [[(1, "a"), (2, "b")], [(5, "c")], []]
+    on_complete = mock.Mock()
+    with mock.patch.object(
+        reembed, "count_entries_needing_model", return_value=3
+    ), mock.patch.object(
+        reembed, "get_entries_needing_model", side_effect=chunks
+    ) as get_entries, mock.patch.object(
+        reembed, "update_entry_embeddings", return_value=True
+    ) as update, mock.patch.object(
+        reembed, "apply_shard_embeddings", return_value=0
+    ) as apply, mock.patch.object(
+        reembed.nlp, "embed_texts", side_effect=_fake_embed_texts
+    ):
+        job = ReembedJob("new-model", chunk_size=2, on_complete=on_complete)
+        job.run()
+
+    assert [c.args for c in get_entries.call_args_list] == [
+        ("new-model", 0, 2),
+        ("new-model", 2, 2),
+        ("new-model", 5, 2),
+    ]
+    assert update.call_count == 2
+    assert update.call_args_list[1].args[0][0][0] == 5
+    status = job.status()
+    assert status["state"] == "completed"
+    assert status["done"] == 3
+    assert status["remaining"] == 0
+    apply.assert_called_once()
+    on_complete.assert_called_once()
+
+
+def test_reembed_job_reports_failure():
+    with mock.patch.object(
+        reembed, "count_entries_needing_model", return_value=1
+    ), mock.patch.object(
+        reembed, "get_entries_needing_model", return_value=[(1, "a")]
+    ), mock.patch.object(
+        reembed.nlp, "embed_texts", side_effect=RuntimeError("model not loaded")
+    ):
+        job = ReembedJob("new-model")
+        job.run()
+
+    assert job.status()["state"] == "failed"
+    assert job.done == 0
+
+
+def test_reembed_job_does_not_start_without_model():
+    with mock.patch.object(reembed.nlp, "model", None):
+        assert not ReembedJob("new-model").start()
@@ -0,0 +1,40 @@
+import numpy as np
+
+from openrecall.result_cache import ResultCache
+
+
+def test_result_cache_returns_rankings_of_the_same_version():
+    cache = ResultCache(4)
+    assert cache.get("q", 0, 1, 10) is None
+    cache.put("q", 0, 1, 10, np.array([3, 1]))
+    assert cache.get("q", 0, 1, 10).tolist() == [3, 1]
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["hit_rate"]) == (1, 1, 0.5)
+
+
+def test_result_cache_extends_rankings_after_inserts():
+    cache = ResultCache(4)
+    cache.put("q", 0, 1, 10, np.array([3, 1]))
+    calls = []
+
+    def extend(ids, last_id):
+        calls.append((ids.tolist(), last_id))
+        return np.array([12, 3])
+
+    assert cache.get("q", 0, 2, 12, extend=extend).tolist() == [12, 3]
+    assert calls == [([3, 1], 10)]
+    # The extended ranking is cached at the new version
+    assert cache.get("q", 0, 2, 12, extend=extend).tolist() == [12, 3]
+    assert len(calls) == 1
+    assert cache.stats()["extended"] == 1
+
+
+def test_result_cache_drops_rankings_it_cannot_extend():
+    cache = ResultCache(4)
+    cache.put("q", 0, 1, 10, np.array([3, 1]))
+    assert cache.get("q", 0, 2, 11) is None
+    cache.put("q", 0, 2, 11, np.array([3, 1]))
+    # A deletion or re-embedding starts a new epoch
+    assert cache.get("q", 1, 3, 11, extend=lambda ids, last_id: ids) is None
+    assert cache.get("q", 1, 3, 11) is None
+    assert cache.stats()["invalidated"] == 2
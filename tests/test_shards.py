@@ -0,0 +1,39 @@
+import datetime
+import sqlite3
+
+from openrecall import shards
+
+
+def test_period_bounds_align_to_calendar_months():
+    moment = int(datetime.datetime(2024, 5, 17, 13, 0).timestamp())
+    start, end = shards.period_bounds(moment, 1)
+    assert datetime.datetime.fromtimestamp(start) == datetime.datetime(2024, 5, 1)
+    assert datetime.datetime.fromtimestamp(end) == datetime.datetime(2024, 6, 1)
+    start, end = shards.period_bounds(moment, 3)
+    assert datetime.datetime.fromtimestamp(start) == datetime.datetime(2024, 4, 1)
+    assert datetime.datetime.fromtimestamp(end) == datetime.datetime(2024, 7, 1)
+    _, end = shards.period_bounds(int(datetime.datetime(2024, 12, 31).timestamp()), 1)
+    assert datetime.datetime.fromtimestamp(end) == datetime.datetime(2025, 1, 1)
+    assert shards.shard_name(start) == "recall-2024-04.db"
+
+
+def test_shard_set_reads_summaries_and_selects(tmp_path):
+    for name, meta in (
+        ("recall-2024-01.db", {"start": 0, "end": 100, "first_timestamp": 10, "last_timestamp": 90,
+                               "first_id": 1, "last_id": 5, "entry_count": 5, "apps": {"Mail": 5}}),
+        ("recall-2024-02.db", {"start": 100, "end": 200, "first_timestamp": 110, "last_timestamp": 190,
+                               "first_id": 6, "last_id": 9, "entry_count": 4, "apps": {"Browser": 4}}),
+    ):
+        conn = sqlite3.connect(tmp_path / name)
+        shards.write_meta(conn.cursor(), meta)
+        conn.commit()
+        conn.close()
+    (tmp_path / "recall-2024-03.db.tmp").write_bytes(b"")
+
+    shard_set = shards.ShardSet(str(tmp_path))
+    assert [shard.start for shard in shard_set.shards()] == [0, 100]
+    assert [shard.start for shard in shard_set.select(start_time=95)] == [100]
+    assert [shard.start for shard in shard_set.select(end_time=5)] == []
+    assert [shard.start for shard in shard_set.select(app="Mail")] == [0]
+    assert [shard.start for shard in shard_set.select(min_id=6)] == [100]
+    assert shard_set.stats() == {"shards": 2, "entries": 9, "oldest": 10}
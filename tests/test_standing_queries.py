@@ -0,0 +1,68 @@
+import numpy as np
+from unittest import mock
+
+from openrecall import standing_queries
+from openrecall.standing_queries import QueryMatch, StandingQuery, StandingQueryRegistry
+
+
+def make_query(query_id, embedding, threshold=0.5, keywords=None, app=None, model="m"):
+    return StandingQuery(
+        query_id, f"q{query_id}", "text", np.asarray(embedding, dtype=np.float32),
+        model, threshold, keywords, app, None,
+    )
+
+
+def test_match_scores_all_queries_at_once():
+    registry = StandingQueryRegistry()
+    registry.load([
+        make_query(1, [1.0, 0.0]),
+        make_query(2, [0.0, 1.0], threshold=0.9),
+        make_query(3, [1.0, 1.0], app="Mail"),
+        make_query(4, [1.0, 0.0], keywords="Invoice 4711"),
+    ])
+    matches = registry.match(
+        [10, 11, 12],
+        [100, 101, 102],
+        [np.array([2.0, 0.1]), np.array([0.5, 1.0]), np.array([1.0, 0.0])],
+        ["m", "m", "m"],
+        ["Mail", "Browser", "Mail"],
+        ["hello", "see INVOICE 4711 attached", "invoice 4711 due"],
+    )
+    assert sorted((m.query_id, m.entry_id) for m in matches) == [
+        (1, 10), (1, 12), (3, 10), (3, 12), (4, 12),
+    ]
+    match = next(m for m in matches if (m.query_id, m.entry_id) == (1, 12))
+    assert match == QueryMatch(1, 12, 102, 1.0)
+
+
+def test_match_only_compares_embeddings_of_the_same_model():
+    registry = StandingQueryRegistry()
+    registry.load([make_query(1, [1.0, 0.0], model="a")])
+    assert registry.match([1], [1], [np.array([1.0, 0.0])], ["b"], [None], [""]) == []
+    assert registry.match([1], [1], [np.array([1.0, 0.0, 0.0])], ["a"], [None], [""]) == []
+    assert len(registry.match([1], [1], [np.array([1.0, 0.0])], ["a"], [None], [""])) == 1
+    registry.reset()
+    assert not registry.is_loaded and len(registry) == 0
+
+
+def test_notify_calls_listeners():
+    registry = StandingQueryRegistry()
+    received = []
+    registry.add_listener(received.extend)
+    registry.notify([])
+    registry.notify([QueryMatch(1, 2, 3, 0.9)])
+    registry.remove_listener(received.extend)
+    registry.notify([QueryMatch(1, 4, 5, 0.9)])
+    assert received == [QueryMatch(1, 2, 3, 0.9)]
+
+
+def test_webhooks_must_be_http_urls():
+    assert standing_queries.is_valid_webhook("https://example.com/hook")
+    assert standing_queries.is_valid_webhook("HTTP://localhost:8080/x")
+    for url in ("file:///etc/passwd", "ftp://example.com/x", "http://", "example.com", "http://[::1"):
+        assert not standing_queries.is_valid_webhook(url)
+    with mock.patch.object(standing_queries, "urlopen") as urlopen:
+        standing_queries._post_matches("file:///tmp/matches", [QueryMatch(1, 2, 3, 0.9)])
+        urlopen.assert_not_called()
+        standing_queries._post_matches("http://localhost/hook", [QueryMatch(1, 2, 3, 0.9)])
+        urlopen.assert_called_once()
@@ -0,0 +1,53 @@
+import sqlite3
+
+import numpy as np
+
+from openrecall import text_store
+
+
+def test_encode_line_compresses_only_when_smaller():
+    short = "OK"
+    long = "Downloads " * 20
+    assert text_store.encode_line(short)[:1] == text_store.RAW
+    assert text_store.encode_line(long)[:1] == text_store.DEFLATE
+    assert len(text_store.encode_line(long)) < len(long)
+    for line in (short, long, "", "café ✓"):
+        assert text_store.decode_line(text_store.encode_line(line)) == line
+
+
+def test_pack_line_ids_roundtrip():
+    blob = text_store.pack_line_ids([3, 1, 3])
+    assert len(blob) == 12
+    np.testing.assert_array_equal(text_store.unpack_line_ids(blob), [3, 1, 3])
+    assert len(text_store.unpack_line_ids(None)) == 0
+
+
+def test_store_and_load_texts():
+    conn = sqlite3.connect(":memory:")
+    cursor = conn.cursor()
+    text_store.create_table(cursor)
+    texts = ["a\nb\n\na", "b\na", ""]
+    blobs = text_store.store_texts(cursor, texts)
+    assert cursor.execute("SELECT COUNT(*) FROM text_lines").fetchone()[0] == 3
+    text_store.line_cache.clear()
+    assert text_store.load_texts(cursor, blobs + [None]) == texts + [None]
+    # A second write reuses the stored lines
+    assert text_store.store_texts(cursor, ["a\nb"]) == [blobs[0][:8]]
+    assert cursor.execute("SELECT COUNT(*) FROM text_lines").fetchone()[0] == 3
+
+
+def test_references_and_delete_unreferenced():
+    conn = sqlite3.connect(":memory:")
+    cursor = conn.cursor()
+    text_store.create_table(cursor)
+    blobs = text_store.store_texts(cursor, ["a\na\nb", "b\nc", "d"])
+    text_store.add_references(cursor, blobs)
+    counts = dict(cursor.execute("SELECT data, ref_count FROM text_lines"))
+    assert [counts[text_store.encode_line(line)] for line in "abcd"] == [1, 2, 1, 1]
+
+    released = text_store.add_references(cursor, blobs[:1] + blobs[2:], -1)
+    assert len(released) == 3
+    # "b" is still used and "d" has the highest id, so only "a" goes
+    assert text_store.delete_unreferenced(cursor, released) == 1
+    remaining = [row[0] for row in cursor.execute("SELECT data FROM text_lines")]
+    assert sorted(text_store.decode_line(data) for data in remaining) == ["b", "c", "d"]
@@ -0,0 +1,83 @@
+import threading
+
+import numpy as np
+import pytest
+
+from openrecall.database import NewEntry
+from openrecall.writer import BatchWriter
+
+
+def _entry(timestamp):
+    return NewEntry("text", timestamp, np.zeros(2, dtype=np.float32), "App", "Title", "en")
+
+
+class RecordingInsert:
+    """Stands in for insert_entries, recording each group it receives."""
+
+    def __init__(self):
+        self.groups = []
+
+    def __call__(self, batch):
+        self.groups.append([entry.timestamp for entry in batch])
+        return [entry.timestamp * 10 for entry in batch]
+
+
+def test_groups_are_bounded_by_size():
+    insert = RecordingInsert()
+    writer = BatchWriter(max_batch=3, max_latency=0.5, insert=insert)
+    futures = writer.insert_entries([_entry(ts) for ts in range(1, 8)])
+    assert [future.result(timeout=5) for future in futures] == [10, 20, 30, 40, 50, 60, 70]
+    writer.close()
+    assert all(len(group) <= 3 for group in insert.groups)
+    assert sum(insert.groups, []) == list(range(1, 8))
+
+
+def test_latency_commits_partial_group():
+    insert = RecordingInsert()
+    writer = BatchWriter(max_batch=100, max_latency=0.05, insert=insert)
+    assert writer.submit(_entry(1)).result(timeout=5) == 10
+    writer.close()
+    assert insert.groups == [[1]]
+
+
+def test_flush_and_close_write_everything():
+    insert = RecordingInsert()
+    writer = BatchWriter(max_batch=100, max_latency=60.0, insert=insert)
+    futures = [writer.submit(_entry(ts)) for ts in (1, 2)]
+    writer.flush()
+    assert all(future.done() for future in futures)
+
+    pending = writer.submit(_entry(3))
+    writer.close()
+    assert pending.result(timeout=0) == 30
+    with pytest.raises(RuntimeError):
+        writer.submit(_entry(4))
+
+
+def test_failed_group_sets_exceptions():
+    def failing_insert(batch):
+        raise ValueError("disk full")
+
+    writer = BatchWriter(max_batch=10, max_latency=0.01, insert=failing_insert)
+    future = writer.submit(_entry(1))
+    with pytest.raises(ValueError):
+        future.result(timeout=5)
+    writer.close()
+
+
+def test_concurrent_submitters():
+    insert = RecordingInsert()
+    writer = BatchWriter(max_batch=16, max_latency=0.01, insert=insert)
+    results = {}
+
+    def submit(start):
+        for ts in range(start, start + 50):
+            results[ts] = writer.submit(_entry(ts))
+
+    threads = [threading.Thread(target=submit, args=(start,)) for start in (0, 1000)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    writer.close()
+    assert all(future.result(timeout=0) == ts * 10 for ts, future in results.items())